@@ -1,56 +1,414 @@
 from openai import AsyncOpenAI
 import asyncio
+import hashlib
+import json
+import random
 import re
-from bot_config import GPT_API_KEY, ABUSE_THRESHOLD
+import time
+from bot_config import GPT_API_KEY, ABUSE_THRESHOLD, ABUSE_CACHE_SIZE, ABUSE_CACHE_TTL, ABUSE_BATCH_SIZE, ABUSE_BATCH_WINDOW_MS, ABUSE_BATCH_FALLBACK
+from bot_config import GPT_MAX_CONCURRENCY, GPT_RATE_PER_SEC, GPT_BURST, GPT_DEADLINE_MS, GPT_BREAKER_FAILURES, GPT_BREAKER_RESET, GPT_AUTH_COOLDOWN
+from bot_config import ABUSE_MODEL_PATH, ABUSE_MODEL_LOW, ABUSE_MODEL_HIGH, TRUST_MIN_HISTORY, ABUSE_LEXICON_PATH
+from bot_config import VERDICT_STORE_TTL, TRUST_HALF_LIFE_DAYS, TRUST_SAMPLE_RATE
+from batcher import MicroBatcher
+from guard import ApiGuard, GuardRejected, CircuitBreaker
+from bio import MAX_SCAN_CHARS
+from cache import TTLCache
+from classifier import load_model
+from lexicon import LEXICON, Lexicon, load_lexicon_file
+from normalize import fold
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Per-chat gate settings: fewest letters worth a GPT call, and the trust
+# score at which a user's messages stop being escalated (None: never).
+SENSITIVITY = {
+    "low": (8, 0.8),
+    "normal": (4, 0.9),
+    "high": (2, None),
+}
+
+# Reasons of verdicts GPT did not give: the local checks', the answers
+# used when it could not be asked, and /approve overrides.
+NOT_GPT_REASONS = ("local_match", "local_fallback", "lexicon", "model", "fallback", "fallback_error", "degraded",
+                   "admin")
+
+def from_gpt(result: dict) -> bool:
+    """
+    True for a verdict GPT gave on this very message. Answers marked
+    "cached" (a cache or store hit, or a join on someone else's request)
+    do not count, so reposting one text cannot add up trust.
+    """
+    if result.get("cached"):
+        return False
+    return str(result.get("reason") or "").split(":", 1)[0] not in NOT_GPT_REASONS
 
 class AbuseDetector:
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=GPT_API_KEY) if GPT_API_KEY else None
+        # Retries and timeouts are the guard's job, not the SDK's.
+        self.client = AsyncOpenAI(api_key=GPT_API_KEY, max_retries=0) if GPT_API_KEY else None
         self.is_ready = True if GPT_API_KEY else False
+        self.guard = ApiGuard(GPT_MAX_CONCURRENCY, GPT_RATE_PER_SEC, GPT_BURST, GPT_DEADLINE_MS / 1000,
+                              GPT_BREAKER_FAILURES, GPT_BREAKER_RESET)
+        self.degraded = 0
+        # Offline-trained n-gram model (classifier.py train); None until one is saved.
+        self.model = load_model(ABUSE_MODEL_PATH)
+        self.model_abusive = 0
+        self.model_clean = 0
+        self.escalated = 0
+        # {user_id: [clean, abusive, ts]} GPT and admin verdict counts behind the
+        # trust score, halved every TRUST_HALF_LIFE_DAYS; ts is when they were decayed to.
+        self.user_history = {}
+        self.trust_half_life = TRUST_HALF_LIFE_DAYS * 86400
+        self.trust_sampled = 0
+        self.gated = {}
+        self.gate_passed = 0
+        # Only words that are abusive wherever they appear, and threats aimed
+        # at someone: "kill the process", "Lund" or "Randi" in an ordinary
+        # sentence is for the lexicon and GPT to weigh.
         self.local_patterns = [
             r'\b(?:fuck|shit|bitch|bastard|asshole)\b',
-            r'\b(?:rape|kill|murder|terror)\b',
-            r'\b(?:slur|chutiya|madarchod|bhosdike|lund|randi)\b',
-            r'\b(?:harass|abuse|bully)\b',
+            r'\b(?:chutiya|madarchod|bhosdike)\b',
+            r'\b(?:kill|murder|rape|shoot|stab|behead|bomb)\s+(?:you|u|ya|your\s+(?:family|mother|mom|sister))\b',
+            r'\b(?:terror(?:ist)?\s+attack|blow\s+up)\s+(?:on\s+)?(?:you|u|your)\b',
         ]
+        # Alternations of literals between word boundaries: linear in the text.
         self.local_regex = re.compile('|'.join(self.local_patterns), re.IGNORECASE)
+        self.lexicon = self._build_lexicon()
+        self.lexicon_hits = 0
+        # GPT verdicts keyed by a hash of the normalized text, so a raid that
+        # posts the same message everywhere costs one request.
+        self.verdict_cache = TTLCache(ABUSE_CACHE_SIZE, ABUSE_CACHE_TTL)
+        self._inflight = {}
+        # Storage behind the cache (attach_store); None keeps verdicts in memory only.
+        self.store = None
+        self.store_hits = 0
+        self.gpt_calls = 0
+        self.coalesced = 0
+        self.batch_retries = 0
+        self.configure_batching(ABUSE_BATCH_SIZE, ABUSE_BATCH_WINDOW_MS, ABUSE_BATCH_FALLBACK)
+
+    def configure_batching(self, size: int, window_ms: float, fallback: str = "single"):
+        """
+        Send up to `size` texts per GPT request, waiting at most `window_ms`
+        for a batch to fill. `fallback` decides what happens to items the
+        batched answer does not cover: "single" asks for them one by one,
+        "local" hands them to the local fallback verdict.
+        """
+        self.batch_fallback = fallback
+        self.batcher = MicroBatcher(self._ask_gpt_batch, size, window_ms) if size > 1 else None
+
+    def _build_lexicon(self) -> Lexicon:
+        entries = dict(LEXICON)
+        if ABUSE_LEXICON_PATH:
+            try:
+                entries.update(load_lexicon_file(ABUSE_LEXICON_PATH))
+            except Exception as e:
+                print(f"Warning: could not load abuse lexicon from {ABUSE_LEXICON_PATH}: {e}")
+        return Lexicon(entries)
+
+    def set_api_key(self, key: str):
+        self.client = AsyncOpenAI(api_key=key, max_retries=0)
+        self.is_ready = True
+        self.guard.breaker.record_success()
+
+    def local_match(self, text: str) -> bool:
+        return self.local_regex.search((text or "")[:MAX_SCAN_CHARS]) is not None
+
+    @staticmethod
+    def cache_key(text: str) -> bytes:
+        normalized = _WHITESPACE.sub(' ', fold(text or "").lower()).strip()
+        return hashlib.blake2b(normalized.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
     
     async def detect_abuse(self, text: str) -> dict:
-        if self.local_regex.search(text or ""):
+        return self.detect_local(text) or await self.detect_remote(text)
+
+    def detect_local(self, text: str):
+        """Verdict from the in-process checks alone, or None when only GPT can tell."""
+        if self.local_match(text):
             return {"is_abusive": True, "confidence": 0.9, "reason": "local_match"}
+        hit = self.lexicon.match(text)
+        if hit and hit.confidence >= ABUSE_THRESHOLD:
+            self.lexicon_hits += 1
+            return {"is_abusive": True, "confidence": hit.confidence, "reason": f"lexicon:{hit.terms[0]}"}
+        if self.model is not None:
+            p = self.model.predict_proba(text)
+            if p >= ABUSE_MODEL_HIGH:
+                self.model_abusive += 1
+                return {"is_abusive": True, "confidence": p, "reason": "model"}
+            if p <= ABUSE_MODEL_LOW:
+                self.model_clean += 1
+                return {"is_abusive": False, "confidence": p, "reason": "model"}
+        self.escalated += 1
+        return None
+
+    def _counts(self, user_id, now: float):
+        """(clean, abusive) verdict weights for a user as of `now`."""
+        counts = self.user_history.get(user_id)
+        if counts is None:
+            return 0.0, 0.0
+        factor = 0.5 ** (max(0.0, now - counts[2]) / self.trust_half_life)
+        return counts[0] * factor, counts[1] * factor
+
+    def record_verdict(self, user_id, abusive: bool, ts: float = None):
+        """Count a GPT or admin verdict on one of the user's messages; local ones are not counted."""
+        if user_id is None:
+            return
+        now = time.time() if ts is None else ts
+        clean, abusive_count = self._counts(user_id, now)
+        last = self.user_history.get(user_id, (0, 0, now))[2]
+        self.user_history[user_id] = [clean + (not abusive), abusive_count + bool(abusive), max(now, last)]
+
+    def warm_trust(self, events):
+        """Rebuild verdict counts from stored (type, payload, ts) events: GPT deletions and clean verdicts, and /approve."""
+        for event_type, payload, ts in events:
+            if event_type == "abuse_delete" and not from_gpt(payload):
+                continue
+            if event_type in ("abuse_delete", "abuse_clean", "approve"):
+                self.record_verdict(payload.get("user_id"), event_type == "abuse_delete", ts)
+
+    def trust_score(self, user_id) -> float:
+        """Share of a user's checked messages that were clean; each abusive one weighs three times."""
+        clean, abusive = self._counts(user_id, time.time())
+        return (clean + 1) / (clean + 3 * abusive + 2)
+
+    def _gate(self, text: str, user_id, trusted: bool, sensitivity: str):
+        min_letters, trust_cutoff = SENSITIVITY.get(sensitivity, SENSITIVITY["normal"])
+        letters = [c for c in fold((text or "")[:MAX_SCAN_CHARS]).lower() if c.isalpha()]
+        if len(letters) < min_letters:
+            return "short"
+        if len(set(letters)) <= 2:
+            return "repetitive"
+        if trust_cutoff is not None:
+            if trusted:
+                return "trusted"
+            if sum(self._counts(user_id, time.time())) >= TRUST_MIN_HISTORY and self.trust_score(user_id) >= trust_cutoff:
+                # A sample still goes to GPT, so trust is kept by behaving, not earned once.
+                if random.random() >= TRUST_SAMPLE_RATE:
+                    return "trusted"
+                self.trust_sampled += 1
+        return None
+
+    def should_escalate(self, text: str, user_id=None, trusted: bool = False, sensitivity: str = "normal") -> bool:
+        """
+        Cheap checks before paying for a GPT call: too few letters (emoji,
+        numbers, one-word replies), a couple of letters repeated ("hahaha"),
+        or a user with a long, recent clean record (bar a TRUST_SAMPLE_RATE
+        sample). Skipped escalations are counted by reason.
+        """
+        reason = self._gate(text, user_id, trusted, sensitivity)
+        if reason:
+            self.gated[reason] = self.gated.get(reason, 0) + 1
+            return False
+        self.gate_passed += 1
+        return True
+
+    def attach_store(self, store, warm: int = 0) -> int:
+        """
+        Persist GPT verdicts in `store` and look there on a cache miss before
+        asking GPT. With a positive `warm`, expired verdicts are pruned and
+        the `warm` freshest loaded into the cache straight away; returns how
+        many were.
+        """
+        self.store = store
+        if store is None or warm <= 0:
+            return 0
+        store.prune_verdicts()
+        now = time.time()
+        loaded = 0
+        for key, verdict, expires in store.recent_verdicts("abuse", warm):
+            self.verdict_cache.set(key, verdict, ttl=min(ABUSE_CACHE_TTL, expires - now))
+            loaded += 1
+        return loaded
+
+    def remote_available(self) -> bool:
+        return bool(self.is_ready and self.client and self.guard.available())
+
+    async def detect_remote(self, text: str) -> dict:
+        """GPT verdict for a text the local checks passed, through the cache, batcher and guard."""
         if not self.is_ready or not self.client:
             return {"is_abusive": False, "confidence": 0.0, "reason": "fallback"}
+
+        key = self.cache_key(text)
+        cached = self.verdict_cache.get(key)
+        if cached is None and self.store is not None and key not in self._inflight:
+            stored = await self.store.aload_verdict("abuse", key)
+            if stored is not None:
+                self.store_hits += 1
+                cached, expires = stored
+                self.verdict_cache.set(key, cached, ttl=min(ABUSE_CACHE_TTL, expires - time.time()))
+        if cached is not None:
+            return {**cached, "cached": True}
+        task = self._inflight.get(key)
+        if task is None and not self.guard.available():
+            # Breaker open: local checks only until it lets a probe through.
+            self.degraded += 1
+            return {"is_abusive": False, "confidence": 0.0, "reason": "degraded"}
+        joined = task is not None
+        if task is None:
+            task = asyncio.ensure_future(self.batcher.submit(text) if self.batcher else self._ask_gpt(text))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._settle(key, t))
+        else:
+            self.coalesced += 1
         
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are an abuse detector for Telegram groups. Analyze the message and respond ONLY with JSON:
-                        {"is_abusive": true/false, "confidence": 0.0-1.0, "reason": "brief explanation"}
-                        
-                        Detect profanity, hate speech, threats, harassment, spam, or inappropriate content.
-                        Be strict but fair. Ignore normal conversation."""
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Analyze this message: {text}"
-                    }
-                ],
-                temperature=0.1,
-                max_tokens=150
-            )
-            
-            result = response.choices[0].message.content.strip()
-            import json
-            return json.loads(result)
-            
+            # Shielded so one caller going away does not cancel the shared request.
+            result = dict(await asyncio.shield(task))
+            if joined:
+                result["cached"] = True
+            return result
+        except GuardRejected as e:
+            self.degraded += 1
+            return {"is_abusive": False, "confidence": 0.0, "reason": f"degraded:{e.reason}"}
         except Exception as e:
             msg = str(e).lower()
             if ("invalid api key" in msg) or ("401" in msg) or ("unauthorized" in msg):
-                self.is_ready = False
-                self.client = None
-            if self.local_regex.search(text or ""):
+                # A bad key will not fix itself quickly; probe again after a long pause
+                # (or straight away once /setgptkey installs a new one).
+                if self.guard.breaker.state != CircuitBreaker.OPEN:
+                    self.guard.breaker.trip(GPT_AUTH_COOLDOWN)
+            if self.local_match(text):
                 return {"is_abusive": True, "confidence": 0.8, "reason": "local_fallback"}
             return {"is_abusive": False, "confidence": 0.0, "reason": "fallback_error"}
+
+    def _settle(self, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        self.verdict_cache.set(key, result)
+        if self.store is not None:
+            self.store.save_verdict("abuse", key, result, source="gpt",
+                                    confidence=result.get("confidence"), ttl=VERDICT_STORE_TTL)
+
+    def override(self, text: str, source: str = "admin"):
+        """Replace the cached and stored verdict on `text` with a clean one from `source`."""
+        key = self.cache_key(text)
+        verdict = {"is_abusive": False, "confidence": 0.0, "reason": source}
+        self.verdict_cache.set(key, verdict)
+        if self.store is not None:
+            self.store.save_verdict("abuse", key, verdict, source=source, confidence=0.0, ttl=VERDICT_STORE_TTL)
+
+    async def _ask_gpt(self, text: str) -> dict:
+        self.gpt_calls += 1
+        response = await self.guard.call(
+            self.client.chat.completions.create,
+            model="gpt-3.5-turbo",
+            messages=[
+                {
+                    "role": "system",
+                    "content": """You are an abuse detector for Telegram groups. Analyze the message and respond ONLY with JSON:
+                    {"is_abusive": true/false, "confidence": 0.0-1.0, "reason": "brief explanation"}
+                    
+                    Detect profanity, hate speech, threats, harassment, spam, or inappropriate content.
+                    Be strict but fair. Ignore normal conversation."""
+                },
+                {
+                    "role": "user",
+                    "content": f"Analyze this message: {text}"
+                }
+            ],
+            temperature=0.1,
+            max_tokens=150
+        )
+        
+        return self._check_verdict(json.loads(response.choices[0].message.content.strip()))
+
+    @staticmethod
+    def _check_verdict(result) -> dict:
+        if not isinstance(result, dict) or "is_abusive" not in result:
+            raise ValueError(f"unexpected verdict: {result!r}")
+        return result
+
+    async def _ask_gpt_batch(self, texts: list) -> list:
+        """One request for several texts; returns a verdict or an exception per text."""
+        if len(texts) == 1:
+            return [await self._ask_gpt(texts[0])]
+        self.gpt_calls += 1
+        response = await self.guard.call(
+            self.client.chat.completions.create,
+            model="gpt-3.5-turbo",
+            messages=[
+                {
+                    "role": "system",
+                    "content": """You are an abuse detector for Telegram groups. You get a JSON array of {"i": index, "text": message} objects. Respond ONLY with a JSON array holding one object per message, with the same index:
+                    [{"i": index, "is_abusive": true/false, "confidence": 0.0-1.0, "reason": "brief explanation"}, ...]
+                    
+                    Detect profanity, hate speech, threats, harassment, spam, or inappropriate content.
+                    Be strict but fair. Ignore normal conversation."""
+                },
+                {
+                    "role": "user",
+                    "content": "Analyze these messages: " + json.dumps([{"i": i, "text": t} for i, t in enumerate(texts)], ensure_ascii=False)
+                }
+            ],
+            temperature=0.1,
+            max_tokens=60 + 90 * len(texts)
+        )
+
+        try:
+            parsed = json.loads(response.choices[0].message.content.strip())
+            if isinstance(parsed, dict):
+                parsed = next((v for v in parsed.values() if isinstance(v, list)), None)
+            if not isinstance(parsed, list):
+                raise ValueError(f"expected a JSON array, got {type(parsed).__name__}")
+            results = self._match_batch(parsed, len(texts))
+        except ValueError as e:
+            results = [e] * len(texts)
+
+        if self.batch_fallback == "single":
+            retry = [i for i, r in enumerate(results) if isinstance(r, Exception)]
+            if retry:
+                self.batch_retries += len(retry)
+                retried = await asyncio.gather(*(self._ask_gpt(texts[i]) for i in retry), return_exceptions=True)
+                for i, r in zip(retry, retried):
+                    results[i] = r
+        return results
+
+    @classmethod
+    def _match_batch(cls, items: list, n: int) -> list:
+        """
+        Verdict or exception for each of `n` texts, matched on the "i" each
+        answer carries rather than on its position. An index that is
+        missing, out of range or answered twice fails, so a dropped,
+        reordered or injected item never lands on another message.
+        """
+        by_index = {}
+        for item in items:
+            i = item.get("i") if isinstance(item, dict) else None
+            if isinstance(i, int) and not isinstance(i, bool) and 0 <= i < n:
+                by_index.setdefault(i, []).append(item)
+        results = []
+        for i in range(n):
+            answers = by_index.get(i, ())
+            if len(answers) != 1:
+                results.append(ValueError("missing from batched answer" if not answers else "answered more than once"))
+                continue
+            verdict = {k: v for k, v in answers[0].items() if k != "i"}
+            try:
+                results.append(cls._check_verdict(verdict))
+            except ValueError as e:
+                results.append(e)
+        return results
+
+    def cache_stats(self) -> dict:
+        stats = self.verdict_cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "gpt_calls": self.gpt_calls,
+            "coalesced": self.coalesced,
+            "store_hits": self.store_hits,
+            "inflight": len(self._inflight),
+            "batch_retries": self.batch_retries,
+            "degraded": self.degraded,
+            "lexicon_hits": self.lexicon_hits,
+            "model_abusive": self.model_abusive,
+            "model_clean": self.model_clean,
+            "escalated": self.escalated,
+            "gated": dict(self.gated),
+            "gate_passed": self.gate_passed,
+            "trust_sampled": self.trust_sampled,
+            # Lookups answered without a request of their own: cache hits plus joins on an in-flight one.
+            "saved_rate": (stats["hits"] + self.coalesced + self.store_hits) / lookups if lookups else 0.0,
+        })
+        return stats
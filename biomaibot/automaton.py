@@ -0,0 +1,103 @@
+from collections import deque
+
+class PhraseAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of phrases.
+
+    Matching is case-insensitive and costs one pass over the text regardless
+    of how many phrases were compiled in. Instances are immutable once built;
+    to change the phrase set build a new one and swap the reference.
+    """
+
+    def __init__(self, phrases=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]
+        self._term = [None]
+        self._phrases = {}
+        for phrase in phrases:
+            self._insert(phrase)
+        self._link()
+
+    def _insert(self, phrase):
+        key = (phrase or "").lower()
+        if not key or key in self._phrases:
+            return
+        self._phrases[key] = phrase
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._term.append(None)
+                self._goto[node][ch] = nxt
+            node = nxt
+        self._out[node] = key
+        self._term[node] = key
+
+    def _link(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                # Inherit the match reachable through the failure link so a
+                # hit is reported at the first position where any phrase ends.
+                if out[nxt] is None:
+                    out[nxt] = out[fail[nxt]]
+
+    def __len__(self):
+        return len(self._phrases)
+
+    def __bool__(self):
+        return bool(self._phrases)
+
+    @property
+    def phrases(self):
+        return tuple(self._phrases.values())
+
+    def search(self, text: str):
+        """
+        Return (phrase, start, end) for the first phrase that ends in `text`,
+        or None. Offsets index into `text.lower()`.
+        """
+        if not self._phrases or not text:
+            return None
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text.lower()):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            key = out[node]
+            if key is not None:
+                return (self._phrases[key], i + 1 - len(key), i + 1)
+        return None
+
+    def finditer(self, text: str):
+        """Yield (phrase, start, end) for every occurrence of every phrase, overlaps included."""
+        if not self._phrases or not text:
+            return
+        goto, fail, out, term = self._goto, self._fail, self._out, self._term
+        node = 0
+        for i, ch in enumerate(text.lower()):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node] is None:
+                continue
+            n = node
+            while n:
+                key = term[n]
+                if key is not None:
+                    yield (self._phrases[key], i + 1 - len(key), i + 1)
+                n = fail[n]
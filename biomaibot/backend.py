@@ -0,0 +1,113 @@
+"""
+The interface every storage backend implements. storage.Storage picks one
+(MongoDB, SQLite or memory), keeps the seen users/chats and stored-set
+mirrors on top of it, and turns any exception a backend raises into a
+logged error and an empty answer, so backends themselves just raise.
+
+Events travel as rows of (type, payload, ts, new user id, new chat id):
+`ts` is epoch seconds, and the two ids are set only the first time
+Storage sees that user or chat, so backends can keep their users/chats
+records without looking anything up. Verdict keys are bytes and expiry
+times epoch seconds; `now` is passed in rather than read from the clock.
+
+Point reads (load_verdict, load_chat_settings) need not see writes still
+queued inside the backend; flush() first to read your own writes. Their
+`aload_*` twins are for the bot's event loop: the defaults just call the
+blocking version, and backends that wait on the network override them.
+"""
+
+# Names of the stored sets; members are strings, except special_users (ints).
+SET_NAMES = ("blocklist", "link_whitelist", "special_users")
+
+class StorageBackend:
+    name = "backend"
+
+    # events and counters
+
+    def insert_events(self, rows):
+        """Write a batch of event rows; may block, called from the event writer thread."""
+        raise NotImplementedError
+
+    def add_event(self, row):
+        """Write one event row from the event loop, without waiting on the network."""
+        raise NotImplementedError
+
+    def iter_events(self, types=None) -> list:
+        """(type, payload) for stored events, oldest first, optionally only of the given types."""
+        raise NotImplementedError
+
+    def events_since(self, types, since: float) -> list:
+        """(type, payload, ts) for events of the given types at or after `since`, oldest first."""
+        raise NotImplementedError
+
+    def count_events(self) -> int:
+        raise NotImplementedError
+
+    def load_seen(self):
+        """(set of user ids, set of chat ids) seen so far."""
+        raise NotImplementedError
+
+    # settings
+
+    def load_state(self) -> dict:
+        raise NotImplementedError
+
+    def update_state(self, fields: dict):
+        raise NotImplementedError
+
+    def load_set(self, name: str) -> set:
+        raise NotImplementedError
+
+    def sync_set(self, name: str, added, removed):
+        raise NotImplementedError
+
+    def load_chat_settings(self, chat_id: int) -> dict:
+        raise NotImplementedError
+
+    async def aload_chat_settings(self, chat_id: int) -> dict:
+        return self.load_chat_settings(chat_id)
+
+    def set_chat_setting(self, chat_id: int, key: str, value):
+        raise NotImplementedError
+
+    # groups
+
+    def add_group(self, chat_id: int, title: str = None):
+        """Record a group; a missing title leaves a stored one alone."""
+        raise NotImplementedError
+
+    def count_groups(self) -> int:
+        raise NotImplementedError
+
+    async def acount_groups(self) -> int:
+        return self.count_groups()
+
+    # verdicts
+
+    def save_verdict(self, kind: str, key: bytes, verdict, source, confidence, expires: float):
+        raise NotImplementedError
+
+    def load_verdict(self, kind: str, key: bytes, now: float):
+        """(verdict, expires) if one is stored and expires after `now`, else None."""
+        raise NotImplementedError
+
+    async def aload_verdict(self, kind: str, key: bytes, now: float):
+        return self.load_verdict(kind, key, now)
+
+    def recent_verdicts(self, kind: str, limit: int, now: float) -> list:
+        """Up to `limit` live (key, verdict, expires) of one kind, latest expiry first."""
+        raise NotImplementedError
+
+    def prune_verdicts(self, now: float) -> int:
+        raise NotImplementedError
+
+    # lifecycle
+
+    def flush(self):
+        """Wait until every write made so far is stored."""
+
+    def close(self):
+        pass
+
+    def snapshot(self) -> dict:
+        return {}
@@ -0,0 +1,73 @@
+import asyncio
+
+class MicroBatcher:
+    """
+    Collects items submitted from many coroutines and hands them to
+    `handler(items)` as one list, either when `max_batch` items are waiting
+    or `window_ms` after the first of them arrived. The handler returns one
+    result per item, in order; an exception instance in place of a result is
+    raised to that item's caller only, and an exception from the handler
+    itself is raised to every caller in the batch.
+    """
+
+    def __init__(self, handler, max_batch: int = 8, window_ms: float = 20.0):
+        self.handler = handler
+        self.max_batch = max(1, max_batch)
+        self.window = max(0.0, window_ms) / 1000.0
+        self._pending = []
+        self._timer = None
+        self._running = set()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.largest = max(self.largest, len(batch))
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        try:
+            results = await self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"handler returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def snapshot(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": self.items / self.batches if self.batches else 0.0,
+            "largest": self.largest,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,752 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the moderation detectors.
+
+    python bench.py detectors [--messages N] [--seed S] [--corpus FILE]
+                              [--save-baseline] [--compare] [--tolerance 0.2]
+    python bench.py fuzz [--cases N] [--length 4096] [--budget-ms 5] [--repeat 3]
+    python bench.py redirects [--links N] [--hops 3] [--budget-ms 300]
+    python bench.py gpt [--messages N] [--rate 200] [--batch 8] [--window-ms 15]
+    python bench.py events [--events N] [--batch 256] [--flush-ms 200] [--mongo URI]
+    python bench.py storage [--sizes 100000,1000000] [--backend memory,sqlite] [--mongo URI]
+
+The corpus is synthetic group traffic (clean chatter, obfuscated bio-link
+spam, URLs, Hindi/Hinglish and adversarial long inputs) unless --corpus
+points at a file with one message per line. Results are printed as
+msgs/sec and p50/p99 latency per detector and per link rule, plus the peak
+memory traced while classifying a message. --save-baseline stores them in
+bench_baseline.json; --compare exits non-zero when a detector got slower
+than the stored baseline by more than --tolerance.
+
+The fuzz command throws worst-case inputs at every detector (punctuation
+runs between the letters of "biolink", dotted label chains, "www." and
+"dot" repetitions, whitespace floods) and fails if any single message takes
+longer than the per-message budget.
+
+The redirects command starts a local fake shortener (redirect chains, a
+server that refuses HEAD, a redirect loop and a slow hop) and checks the
+redirect resolver against it: final hosts, cold and cached latency, the
+concurrency cap and that resolve_within() returns within its budget.
+
+The gpt command runs AbuseDetector against a local stub of the OpenAI chat
+completions endpoint (fixed latency per request plus a little per message)
+once unbatched and once micro-batched, and prints requests sent, prompt
+characters, throughput and per-message latency for both.
+
+The events command saves the same stream of "seen" events into a scratch
+SQLite database twice, once with a commit per event and once through the
+write-behind EventWriter, and prints events/sec (including the final
+flush) and the latency the calling handler sees for each. With --mongo it
+also runs the write-behind path against that MongoDB server.
+
+The storage command fills each storage backend with synthetic "seen"
+events in event-writer sized batches and, each time the history reaches
+one of --sizes, prints the write rate since the previous size, the latency
+of the storage calls /status makes, and how long loading the seen users
+and chats (done once at startup) and counting events take. Use
+--sizes 1000000,10000000 for the large-history numbers; the memory backend
+needs a few GB for the second. --mongo URI adds a MongoDB round, which
+writes into that database.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+from automaton import PhraseAutomaton
+from bio import BioLinkDetector, _Scan
+
+BASELINE_PATH = Path(__file__).parent / "bench_baseline.json"
+
+CLEAN = [
+    "good morning everyone", "kal ka match dekha?", "haha sahi hai bhai", "what time is the meeting today",
+    "anyone tried the new update", "ok", "thanks!", "bhai notes bhej de please", "lol that was funny",
+    "I will be late by 10 minutes", "happy birthday 🎉🎉", "kya scene hai aaj", "same here", "biology exam kal hai",
+]
+HINGLISH = [
+    "नमस्ते दोस्तों, कैसे हो सब?", "aaj ka plan kya hai bhai", "खाना खा लिया?", "arre yaar kal milte hain",
+    "मैं थोड़ा लेट हो जाऊँगा", "bhai ye video dekh, mast hai", "सब ठीक है? 🙏", "chal theek hai phir",
+]
+SPAM = [
+    "check my bio link", "link in bio 🔥", "bio me link hai", "visit linktr.ee/hotgirl", "b.i.o l.i.n.k",
+    "DM me, bio⋅link", "linktr dot ee slash me", "𝐛𝐢𝐨 𝐥𝐢𝐧𝐤 👀", "bio mein link", "l i n k t r e e",
+    "bıo.lınk/xyz", "beacons.ai/promo", "join t.me/freecoins", "ʙɪᴏ ʟɪɴᴋ ᴅᴇᴋʜᴏ", "bіо.lіnk/x",
+]
+URLS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "see www.example.com/page", "docs at python.org",
+    "bit.ly/3abcd", "https://evil-youtube.com.attacker.io/login",
+]
+ABUSIVE = ["shut up you bastard", "tu chutiya hai", "fuck this group", "i will kill you", "f.u.c.k off",
+           "chut1ya saala", "तू चूतिया है", "m a d a r c h o d"]
+BLOCKLIST = ["teri maa ki chut", "drugs", "porn", "free crypto", "earn money fast", "gandu", "bhosra"]
+
+
+def _adversarial(rnd):
+    pick = rnd.randrange(4)
+    if pick == 0:
+        return "bio" + "".join(rnd.choice(".-_ ,") for _ in range(rnd.randint(500, 2000))) + "x"
+    if pick == 1:
+        return " ".join(".".join("a" * rnd.randint(1, 3) for _ in range(rnd.randint(20, 200))) for _ in range(5))
+    if pick == 2:
+        return "b" + "".join(rnd.choice(" .i.o.l") for _ in range(rnd.randint(500, 2000)))
+    return "".join(rnd.choice("bio link tree .-") for _ in range(rnd.randint(1000, 4000)))
+
+
+def make_corpus(n: int, seed: int = 1, adversarial: float = 0.01):
+    rnd = random.Random(seed)
+    pools = [(CLEAN, 0.5), (HINGLISH, 0.15), (SPAM, 0.15), (URLS, 0.1), (ABUSIVE, 0.05), (BLOCKLIST, 0.05)]
+    out = []
+    for _ in range(n):
+        if rnd.random() < adversarial:
+            text = _adversarial(rnd)
+        else:
+            r = rnd.random()
+            for pool, weight in pools:
+                if r < weight:
+                    break
+                r -= weight
+            text = rnd.choice(pool)
+            if rnd.random() < 0.3:
+                text = f"{rnd.choice(CLEAN + HINGLISH)} {text}"
+        out.append(SimpleNamespace(text=text, caption=None, entities=(), caption_entities=()))
+    return out
+
+
+def load_corpus(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    return [SimpleNamespace(text=t, caption=None, entities=(), caption_entities=()) for t in lines]
+
+
+def _percentile(sorted_ns, q):
+    if not sorted_ns:
+        return 0.0
+    idx = min(len(sorted_ns) - 1, int(round(q * (len(sorted_ns) - 1))))
+    return sorted_ns[idx] / 1000.0
+
+
+def _measure(name, fn, items):
+    """Time fn over items one call at a time and return throughput and latency percentiles (us)."""
+    clock = time.perf_counter_ns
+    samples = []
+    hits = 0
+    for item in items:
+        t0 = clock()
+        if fn(item):
+            hits += 1
+        samples.append(clock() - t0)
+    total = sum(samples) / 1e9
+    samples.sort()
+    return {
+        "name": name,
+        "messages": len(items),
+        "hits": hits,
+        "msgs_per_sec": len(items) / total if total else 0.0,
+        "p50_us": _percentile(samples, 0.50),
+        "p99_us": _percentile(samples, 0.99),
+        "max_us": samples[-1] / 1000.0 if samples else 0.0,
+    }
+
+
+def _peak_alloc(fn, items):
+    """Largest tracemalloc peak (bytes) seen while running fn on a single item."""
+    worst = 0
+    total = 0
+    tracemalloc.start()
+    try:
+        for item in items:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fn(item)
+            peak = tracemalloc.get_traced_memory()[1] - base
+            worst = max(worst, peak)
+            total += peak
+    finally:
+        tracemalloc.stop()
+    return {"peak_bytes_max": worst, "peak_bytes_avg": total / len(items) if items else 0.0}
+
+
+FUZZ_ALPHABETS = (
+    " .-_,!?*~",
+    "bio.link ",
+    "b.i.o.l.i.n.k.t.r.e.e",
+    "a.",
+    "www.",
+    "dot ",
+    "bio link tree dot [].",
+    " \t\n",
+    "https://",
+    "f.u.c.k ",
+)
+
+
+def fuzz_cases(n: int, length: int, seed: int):
+    rnd = random.Random(seed)
+    for i in range(n):
+        alphabet = FUZZ_ALPHABETS[i % len(FUZZ_ALPHABETS)]
+        if rnd.random() < 0.5:
+            # Repeat one unit so runs line up with what the patterns look for.
+            unit = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 6)))
+            text = (rnd.choice(("bio", "link", "b", "www.", "")) + unit * (length // max(1, len(unit))))[:length]
+        else:
+            text = "".join(rnd.choice(alphabet) for _ in range(length))
+        yield text
+
+
+def run_fuzz(args):
+    suite = detector_suite()
+    budget_us = args.budget_ms * 1000.0
+    worst = {name: (0.0, "") for name in suite}
+    clock = time.perf_counter_ns
+    for text in fuzz_cases(args.cases, args.length, args.seed):
+        msg = SimpleNamespace(text=text, caption=None, entities=(), caption_entities=())
+        for name, fn in suite.items():
+            # Best of a few runs, so a GC pause or scheduler hiccup is not
+            # mistaken for a slow pattern.
+            took = float("inf")
+            for _ in range(args.repeat):
+                t0 = clock()
+                fn(msg)
+                took = min(took, (clock() - t0) / 1000.0)
+            if took > worst[name][0]:
+                worst[name] = (took, text)
+    status = 0
+    for name, (took, text) in worst.items():
+        flag = "OVER BUDGET" if took > budget_us else "ok"
+        print(f"{name:24} worst {took:10.1f} us  budget {budget_us:.0f} us  {flag}")
+        if took > budget_us:
+            print(f"    input: {text[:80]!r}...")
+            status = 1
+    return status
+
+
+def detector_suite():
+    """Name -> callable(message) for every detector that can be loaded here."""
+    suite = {}
+    bio = BioLinkDetector()
+    suite["bio.classify"] = lambda m: bio.classify(m).matched
+    blocker = PhraseAutomaton(BLOCKLIST)
+    suite["blocklist"] = lambda m: blocker.search(m.text) is not None
+    try:
+        from abuse import AbuseDetector
+    except ImportError as e:
+        print(f"skipping abuse.local_regex: {e}", file=sys.stderr)
+    else:
+        abuse = AbuseDetector()
+        suite["abuse.local_regex"] = lambda m: abuse.local_match(m.text)
+        suite["abuse.lexicon"] = lambda m: abuse.lexicon.match(m.text) is not None
+    return suite
+
+
+def rule_suite():
+    """Per-rule callables over a fresh scan, so every rule pays for the views it needs."""
+    bio = BioLinkDetector()
+    suite = {}
+    for rule_id, check in bio.rules:
+        suite[f"rule:{rule_id}"] = (lambda c: lambda m: c(_Scan(bio.normalize(m.text))) is not None)(check)
+    return suite
+
+
+def run_detectors(args):
+    corpus = load_corpus(args.corpus) if args.corpus else make_corpus(args.messages, args.seed)
+    results = {}
+    for name, fn in detector_suite().items():
+        r = _measure(name, fn, corpus)
+        r.update(_peak_alloc(fn, corpus[:args.alloc_sample]))
+        results[name] = r
+    rule_corpus = corpus[:args.rule_sample]
+    for name, fn in rule_suite().items():
+        results[name] = _measure(name, fn, rule_corpus)
+
+    print(f"{'detector':34} {'msgs/s':>10} {'hits':>7} {'p50us':>8} {'p99us':>9} {'maxus':>10} {'peakB':>8}")
+    for r in results.values():
+        peak = r.get("peak_bytes_max")
+        print(f"{r['name']:34} {r['msgs_per_sec']:10.0f} {r['hits']:7d} {r['p50_us']:8.1f} {r['p99_us']:9.1f} "
+              f"{r['max_us']:10.1f} {peak if peak is not None else '':>8}")
+
+    status = 0
+    if args.compare:
+        status = compare_baseline(results, Path(args.baseline), args.tolerance)
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2, sort_keys=True), encoding="utf-8")
+        print(f"baseline saved to {args.baseline}")
+    return status
+
+
+def compare_baseline(results, path: Path, tolerance: float) -> int:
+    try:
+        baseline = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        print(f"no usable baseline at {path}: {e}", file=sys.stderr)
+        return 1
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if r["msgs_per_sec"] < base["msgs_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {base['msgs_per_sec']:.0f} -> {r['msgs_per_sec']:.0f} msgs/s")
+        if base["p99_us"] and r["p99_us"] > base["p99_us"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {base['p99_us']:.1f} -> {r['p99_us']:.1f} us")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print("no regressions against baseline")
+    return 1 if regressions else 0
+
+
+class _FakeShortener(BaseHTTPRequestHandler):
+    """
+    /s/<key>/<n>  redirects n more times, then lands on /final/<key>
+    /nohead/<key> answers HEAD with 405 and GET with a redirect
+    /loop         redirects to itself
+    /slow/<key>   sleeps before redirecting
+    """
+
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    slow_seconds = 1.0
+
+    def log_message(self, *args):
+        pass
+
+    def _redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _ok(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _route(self, head):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            parts = self.path.strip("/").split("/")
+            if parts[0] == "s":
+                left = int(parts[2])
+                self._redirect(f"/s/{parts[1]}/{left - 1}" if left > 1 else f"/final/{parts[1]}")
+            elif parts[0] == "nohead":
+                if head:
+                    self.send_response(405)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                else:
+                    self._redirect(f"/final/{parts[1]}")
+            elif parts[0] == "loop":
+                self._redirect("/loop")
+            elif parts[0] == "slow":
+                time.sleep(cls.slow_seconds)
+                self._redirect(f"/final/{parts[1]}")
+            else:
+                self._ok()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def do_HEAD(self):
+        self._route(True)
+
+    def do_GET(self):
+        self._route(False)
+
+
+async def _redirect_checks(args, base):
+    from resolver import RedirectResolver
+    resolver = RedirectResolver(("127.0.0.1",), max_hops=args.hops + 1, timeout=2.0, concurrency=args.concurrency,
+                                allow_private=True)
+    failures = []
+    clock = time.perf_counter_ns
+    try:
+        urls = [f"{base}/s/k{i}/{args.hops}" for i in range(args.links)]
+        t0 = clock()
+        cold = await asyncio.gather(*(resolver.resolve(u) for u in urls))
+        cold_ms = (clock() - t0) / 1e6
+        for i, hit in enumerate(cold):
+            if hit != ("127.0.0.1", f"/final/k{i}"):
+                failures.append(f"{urls[i]} -> {hit}")
+        warm = []
+        for u in urls:
+            t0 = clock()
+            await resolver.resolve(u)
+            warm.append(clock() - t0)
+        warm.sort()
+        print(f"cold: {args.links} links x {args.hops} hops in {cold_ms:.1f} ms "
+              f"(peak {_FakeShortener.peak} concurrent requests, cap {args.concurrency})")
+        print(f"cached: p50 {_percentile(warm, 0.5):.1f} us  p99 {_percentile(warm, 0.99):.1f} us")
+        if _FakeShortener.peak > args.concurrency:
+            failures.append(f"concurrency cap exceeded: {_FakeShortener.peak} > {args.concurrency}")
+
+        if await resolver.resolve(f"{base}/nohead/x") != ("127.0.0.1", "/final/x"):
+            failures.append("HEAD-refusing server was not followed with GET")
+        if await resolver.resolve(f"{base}/loop") is not None:
+            failures.append("redirect loop did not give up")
+
+        budget = args.budget_ms / 1000.0
+        t0 = clock()
+        within = await resolver.resolve_within([f"{base}/slow/y", urls[0]], budget)
+        took_ms = (clock() - t0) / 1e6
+        print(f"budget: resolve_within returned in {took_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+        if took_ms > args.budget_ms + 50:
+            failures.append(f"resolve_within overran its budget: {took_ms:.1f} ms")
+        if within[f"{base}/slow/y"] is not None or within[urls[0]] is None:
+            failures.append(f"unexpected partial result: {within}")
+        await asyncio.sleep(_FakeShortener.slow_seconds + 0.5)
+        if resolver.cache.get(f"{base}/slow/y") != ("127.0.0.1", "/final/y"):
+            failures.append("slow lookup did not finish in the background")
+        print(f"resolver: {resolver.snapshot()}")
+    finally:
+        await resolver.close()
+    return failures
+
+
+def run_redirects(args):
+    try:
+        import httpx  # noqa: F401
+    except ImportError as e:
+        print(f"skipping redirects: {e}", file=sys.stderr)
+        return 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeShortener)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        failures = asyncio.run(_redirect_checks(args, f"http://127.0.0.1:{server.server_port}"))
+    finally:
+        server.shutdown()
+        server.server_close()
+    for line in failures:
+        print(f"FAIL {line}")
+    if not failures:
+        print("all redirect checks passed")
+    return 1 if failures else 0
+
+
+class _StubOpenAI(BaseHTTPRequestHandler):
+    """POST /v1/chat/completions answering like gpt-3.5-turbo would, minus the thinking."""
+
+    base_ms = 120.0
+    per_item_ms = 4.0
+    requests = 0
+    prompt_chars = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    @staticmethod
+    def _verdict(text):
+        bad = "idiot" in text.lower()
+        return {"is_abusive": bad, "confidence": 0.9 if bad else 0.1, "reason": "stub"}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        messages = body["messages"]
+        user = messages[-1]["content"]
+        cls = type(self)
+        with cls.lock:
+            cls.requests += 1
+            cls.prompt_chars += sum(len(m["content"]) for m in messages)
+        if user.startswith("Analyze these messages: "):
+            items = json.loads(user[len("Analyze these messages: "):])
+            texts = [item["text"] for item in items]
+            # Answers come back in reverse order; the detector matches them on "i".
+            content = json.dumps([{"i": item["i"], **self._verdict(item["text"])} for item in reversed(items)])
+        else:
+            texts = [user]
+            content = json.dumps(self._verdict(user))
+        time.sleep((cls.base_ms + cls.per_item_ms * len(texts)) / 1000.0)
+        payload = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+async def _gpt_round(args, base, batch, window_ms):
+    from openai import AsyncOpenAI
+    from abuse import AbuseDetector
+    detector = AbuseDetector()
+    detector.client = AsyncOpenAI(api_key="stub", base_url=f"{base}/v1", max_retries=0, timeout=30)
+    detector.is_ready = True
+    detector.configure_batching(batch, window_ms, "single")
+    rnd = random.Random(args.seed)
+    words = ["hello", "kal milte", "you idiot", "nice pic", "kya hua", "send notes", "good night"]
+    texts = [f"{rnd.choice(words)} #{i}" for i in range(args.messages)]
+    _StubOpenAI.requests = 0
+    _StubOpenAI.prompt_chars = 0
+    clock = time.perf_counter_ns
+    latencies = []
+    wrong = 0
+
+    async def one(text):
+        nonlocal wrong
+        t0 = clock()
+        verdict = await detector.detect_abuse(text)
+        latencies.append(clock() - t0)
+        if verdict["is_abusive"] != ("idiot" in text) or verdict["reason"].startswith("fallback"):
+            wrong += 1
+
+    start = clock()
+    tasks = []
+    for text in texts:
+        tasks.append(asyncio.ensure_future(one(text)))
+        await asyncio.sleep(rnd.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    total = (clock() - start) / 1e9
+    latencies.sort()
+    return {
+        "name": f"batch={batch}" + (f" window={window_ms:g}ms" if batch > 1 else ""),
+        "requests": _StubOpenAI.requests,
+        "prompt_chars": _StubOpenAI.prompt_chars,
+        "msgs_per_sec": len(texts) / total,
+        "p50_ms": _percentile(latencies, 0.50) / 1000.0,
+        "p99_ms": _percentile(latencies, 0.99) / 1000.0,
+        "wrong": wrong,
+        "batcher": detector.batcher.snapshot() if detector.batcher else None,
+    }
+
+
+def run_gpt(args):
+    try:
+        import openai  # noqa: F401
+        import abuse  # noqa: F401
+    except ImportError as e:
+        print(f"skipping gpt: {e}", file=sys.stderr)
+        return 0
+    _StubOpenAI.base_ms = args.latency_ms
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOpenAI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        rounds = [asyncio.run(_gpt_round(args, base, 1, 0)),
+                  asyncio.run(_gpt_round(args, base, args.batch, args.window_ms))]
+    finally:
+        server.shutdown()
+        server.server_close()
+    print(f"{'mode':26} {'requests':>9} {'prompt chars':>13} {'msgs/s':>8} {'p50ms':>8} {'p99ms':>8} {'wrong':>6}")
+    for r in rounds:
+        print(f"{r['name']:26} {r['requests']:9d} {r['prompt_chars']:13d} {r['msgs_per_sec']:8.1f} "
+              f"{r['p50_ms']:8.1f} {r['p99_ms']:8.1f} {r['wrong']:6d}")
+    if rounds[1]["batcher"]:
+        print(f"batcher: {rounds[1]['batcher']}")
+    return 1 if any(r["wrong"] for r in rounds) else 0
+
+
+def _events_round(name, path, events, writer_args=None, uri=""):
+    from storage import Storage
+    storage = Storage(uri=uri, sqlite_path=path)
+    if uri and not storage.mongo_enabled:
+        raise RuntimeError(f"could not connect to {uri}")
+    before = storage.count_events()
+    if writer_args:
+        storage.start_writer(*writer_args)
+    clock = time.perf_counter_ns
+    samples = []
+    t0 = clock()
+    for event in events:
+        t1 = clock()
+        storage.save_event("seen", event)
+        samples.append(clock() - t1)
+    writer = storage.writer
+    storage.stop_writer()
+    writer = writer.snapshot() if writer is not None else None
+    storage.flush()
+    total = (clock() - t0) / 1e9
+    rows = storage.count_events() - before
+    storage.close()
+    samples.sort()
+    return {
+        "name": name,
+        "events_per_sec": len(events) / total if total else 0.0,
+        "p50_us": _percentile(samples, 0.50),
+        "p99_us": _percentile(samples, 0.99),
+        "rows": rows,
+        "writer": writer,
+    }
+
+
+def run_events(args):
+    import tempfile
+    rnd = random.Random(args.seed)
+    events = [{"chat_id": -1000000000000 - rnd.randrange(50), "user_id": rnd.randrange(1, 5000)}
+              for _ in range(args.events)]
+    with tempfile.TemporaryDirectory() as tmp:
+        writer_args = (args.flush_ms, args.batch, max(args.queue, args.batch))
+        rounds = [_events_round("commit per event", str(Path(tmp) / "direct.db"), events),
+                  _events_round("write-behind", str(Path(tmp) / "batched.db"), events, writer_args)]
+        if args.mongo:
+            rounds.append(_events_round("mongo write-behind", str(Path(tmp) / "unused.db"), events, writer_args, args.mongo))
+    print(f"{'mode':18} {'events/s':>10} {'p50us':>8} {'p99us':>8} {'rows':>7}")
+    for r in rounds:
+        print(f"{r['name']:18} {r['events_per_sec']:10.0f} {r['p50_us']:8.1f} {r['p99_us']:8.1f} {r['rows']:7d}")
+    writer = rounds[1]["writer"]
+    print(f"writer: {writer['batches']} batches (avg {writer['avg_batch']:.0f}), "
+          f"max depth {writer['max_depth']}, {writer['dropped']} dropped")
+    print(f"speedup: {rounds[1]['events_per_sec'] / max(rounds[0]['events_per_sec'], 1e-9):.1f}x")
+    return 1 if any(r["rows"] != len(events) - (r["writer"] or {}).get("dropped", 0) for r in rounds) else 0
+
+
+def _storage_round(backend, sizes, args):
+    from storage import Storage
+    storage = Storage(backend=backend)
+    rnd = random.Random(args.seed)
+    clock = time.perf_counter_ns
+    chats = [-1000000000000 - i for i in range(args.chats)]
+    for chat_id in chats:
+        backend.add_group(chat_id, f"group {chat_id}")
+    seen_users, seen_chats = set(), set()
+    written = 0
+    results = []
+    for size in sizes:
+        start, write_ns = written, 0
+        while written < size:
+            now = time.time()
+            rows = []
+            for _ in range(min(args.batch, size - written)):
+                user_id, chat_id = rnd.randrange(1, args.users + 1), rnd.choice(chats)
+                new_user = user_id if user_id not in seen_users else None
+                new_chat = chat_id if chat_id not in seen_chats else None
+                seen_users.add(user_id)
+                seen_chats.add(chat_id)
+                rows.append(("seen", {"chat_id": chat_id, "user_id": user_id}, now, new_user, new_chat))
+            t0 = clock()
+            backend.insert_events(rows)
+            write_ns += clock() - t0
+            written += len(rows)
+        t0 = clock()
+        backend.flush()
+        write_ns += clock() - t0
+        status = []
+        for _ in range(args.samples):
+            t0 = clock()
+            storage.count_groups()
+            storage.count_distinct_users()
+            status.append(clock() - t0)
+        status.sort()
+        t0 = clock()
+        backend.load_seen()
+        load_ms = (clock() - t0) / 1e6
+        t0 = clock()
+        backend.count_events()
+        count_ms = (clock() - t0) / 1e6
+        results.append({
+            "backend": backend.name,
+            "events": written,
+            "writes_per_sec": (written - start) / (write_ns / 1e9) if write_ns else 0.0,
+            "status_p50_ms": _percentile(status, 0.50) / 1000.0,
+            "status_p99_ms": _percentile(status, 0.99) / 1000.0,
+            "load_seen_ms": load_ms,
+            "count_ms": count_ms,
+            "errors": storage.errors,
+        })
+    storage.close()
+    return results
+
+
+def run_storage(args):
+    import tempfile
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in [n for n in args.backend.split(",") if n]:
+            if name == "memory":
+                from memory_backend import MemoryBackend
+                backend = MemoryBackend()
+            elif name == "sqlite":
+                from sqlite_backend import SqliteBackend
+                backend = SqliteBackend(str(Path(tmp) / "bench.db"))
+            else:
+                print(f"unknown backend {name}", file=sys.stderr)
+                return 2
+            rows += _storage_round(backend, sizes, args)
+        if args.mongo:
+            from mongo_backend import MongoBackend
+            rows += _storage_round(MongoBackend(args.mongo, timeout=60), sizes, args)
+    print(f"{'backend':8} {'events':>10} {'writes/s':>10} {'status p50ms':>13} {'p99ms':>8} {'load seen ms':>13} {'count ms':>9}")
+    for r in rows:
+        print(f"{r['backend']:8} {r['events']:10d} {r['writes_per_sec']:10.0f} {r['status_p50_ms']:13.3f} "
+              f"{r['status_p99_ms']:8.3f} {r['load_seen_ms']:13.1f} {r['count_ms']:9.1f}")
+    return 1 if any(r["errors"] for r in rows) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+    det = sub.add_parser("detectors", help="detector throughput and latency")
+    det.add_argument("--messages", type=int, default=20000)
+    det.add_argument("--seed", type=int, default=1)
+    det.add_argument("--corpus", help="file with one message per line")
+    det.add_argument("--rule-sample", type=int, default=5000)
+    det.add_argument("--alloc-sample", type=int, default=2000)
+    det.add_argument("--baseline", default=str(BASELINE_PATH))
+    det.add_argument("--save-baseline", action="store_true")
+    det.add_argument("--compare", action="store_true")
+    det.add_argument("--tolerance", type=float, default=0.2)
+    det.set_defaults(func=run_detectors)
+    fz = sub.add_parser("fuzz", help="worst-case inputs against a per-message time budget")
+    fz.add_argument("--cases", type=int, default=2000)
+    fz.add_argument("--length", type=int, default=4096)
+    fz.add_argument("--seed", type=int, default=7)
+    fz.add_argument("--budget-ms", type=float, default=5.0)
+    fz.add_argument("--repeat", type=int, default=3)
+    fz.set_defaults(func=run_fuzz)
+    rd = sub.add_parser("redirects", help="redirect resolver against a local fake shortener")
+    rd.add_argument("--links", type=int, default=50)
+    rd.add_argument("--hops", type=int, default=3)
+    rd.add_argument("--concurrency", type=int, default=8)
+    rd.add_argument("--budget-ms", type=float, default=300.0)
+    rd.set_defaults(func=run_redirects)
+    gp = sub.add_parser("gpt", help="abuse detector against a local OpenAI stub, unbatched vs batched")
+    gp.add_argument("--messages", type=int, default=400)
+    gp.add_argument("--rate", type=float, default=200.0, help="mean arrivals per second")
+    gp.add_argument("--batch", type=int, default=8)
+    gp.add_argument("--window-ms", type=float, default=15.0)
+    gp.add_argument("--latency-ms", type=float, default=120.0, help="stub latency per request")
+    gp.add_argument("--seed", type=int, default=3)
+    gp.set_defaults(func=run_gpt)
+    ev = sub.add_parser("events", help="event writes, commit per event vs write-behind batches")
+    ev.add_argument("--events", type=int, default=5000)
+    ev.add_argument("--batch", type=int, default=256)
+    ev.add_argument("--flush-ms", type=float, default=200.0)
+    ev.add_argument("--queue", type=int, default=100000)
+    ev.add_argument("--seed", type=int, default=5)
+    ev.add_argument("--mongo", help="MongoDB URI to run the write-behind round against as well")
+    ev.set_defaults(func=run_events)
+    st = sub.add_parser("storage", help="storage backend write rate and /status latency as history grows")
+    st.add_argument("--sizes", default="100000,1000000", help="comma-separated history sizes to measure at")
+    st.add_argument("--backend", default="memory,sqlite", help="comma-separated: memory, sqlite")
+    st.add_argument("--batch", type=int, default=256)
+    st.add_argument("--users", type=int, default=50000)
+    st.add_argument("--chats", type=int, default=500)
+    st.add_argument("--samples", type=int, default=200)
+    st.add_argument("--seed", type=int, default=11)
+    st.add_argument("--mongo", help="MongoDB URI (a scratch database) to measure as well")
+    st.set_defaults(func=run_storage)
+    args = parser.parse_args()
+    if not getattr(args, "func", None):
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,164 +1,310 @@
 import re
-import unicodedata
-URL_PATTERN = re.compile(r'(https?://|www\.)[a-zA-Z0-9.\-]+(\.[a-zA-Z]{2,})+(/[a-zA-Z0-9._%+-]*)*')
-
-def _strip_diacritics(s: str) -> str:
-    return ''.join(c for c in unicodedata.normalize('NFKD', s or '') if not unicodedata.combining(c))
-
-def _fold_confusables(s: str) -> str:
-    return (s.replace('ø', 'o')
-             .replace('ö', 'o')
-             .replace('ó', 'o')
-             .replace('ô', 'o')
-             .replace('õ', 'o')
-             .replace('œ', 'oe')
-             .replace('ß', 'ss')
-             .replace('ï', 'i')
-             .replace('í', 'i')
-             .replace('î', 'i')
-             .replace('ì', 'i')
-             .replace('ı', 'i')
-             .replace('ĺ', 'l')
-             .replace('ľ', 'l')
-             .replace('ł', 'l'))
+import time
+from collections import namedtuple
+from normalize import fold, obfuscation_view, collapsed_view
+
+# Every rule below runs in time linear in the text: the regexes either start
+# from a literal and scan a bounded window, or match maximal runs that cannot
+# overlap, and the gap heuristics walk sorted occurrence lists. Telegram caps
+# messages at 4096 characters; anything longer is cut before the text rules.
+MAX_SCAN_CHARS = 4096
+
+# Dotted hosts. A match may only start at the beginning of a run of host
+# characters (or right after a scheme), so attempts never overlap, and the
+# backtracking inside one attempt is bounded by the length of its run. The
+# domain form needs a label made of two or more letters up to '-' or the end
+# of the label, like the old `\.[a-zA-Z]{2,}\b`.
+_URL = re.compile(r'(?:https?://|(?<![A-Za-z0-9\-.])www\.)[A-Za-z0-9\-.]*[A-Za-z0-9\-]\.[A-Za-z]{2}[A-Za-z0-9\-.]*', re.IGNORECASE)
+_DOMAIN = re.compile(r'(?<![A-Za-z0-9\-.])[A-Za-z0-9\-.]*[A-Za-z0-9\-]\.[A-Za-z]{2,}(?![A-Za-z0-9])[A-Za-z0-9\-.]*')
+_WHITESPACE = re.compile(r'\s+')
+_NON_WORD = re.compile(r'\W+')
+
+_BIO_DOT_LINK = re.compile(r'bio(?:dot)*link')
+_LINKTR_DOT_EE = re.compile(r'linktr(?:dot)*ee')
+_BIO_NEAR_LINK = re.compile(r'bio[\W_]{0,10}link', re.IGNORECASE)
+_LINK_NEAR_TREE = re.compile(r'link[\W_]{0,10}tree', re.IGNORECASE)
+_LINK_NEAR_BIO = re.compile(r'link[\W_]{0,10}bio', re.IGNORECASE)
+_HINDI_BIO_LINK = re.compile(r'\bbio ?(me|mein|mai|m) ?link\b')
+
+# Result of a single classification pass. `rule` is the reason label that
+# get_link_reason used to return and `rule_id` the entry in
+# BioLinkDetector.rules (or entity check) that produced it. `span` is the
+# (start, end) of the match in `text` when the rule matched on the normalized
+# text, otherwise None.
+LinkVerdict = namedtuple("LinkVerdict", ("matched", "rule", "span", "text", "rule_id"))
+
+class _Scan:
+    """Derived views of one message text, each computed at most once."""
+    __slots__ = ("norm", "_lower", "_obf", "_collapsed", "_spaced", "_skeleton")
+
+    def __init__(self, norm: str):
+        self.norm = norm[:MAX_SCAN_CHARS]
+        self._lower = None
+        self._obf = None
+        self._collapsed = None
+        self._spaced = None
+        self._skeleton = None
+
+    @property
+    def lower(self) -> str:
+        if self._lower is None:
+            self._lower = self.norm.lower()
+        return self._lower
+
+    @property
+    def obf(self) -> str:
+        if self._obf is None:
+            self._obf = obfuscation_view(self.lower)
+        return self._obf
+
+    @property
+    def collapsed(self) -> str:
+        if self._collapsed is None:
+            self._collapsed = collapsed_view(self.lower)
+        return self._collapsed
+
+    @property
+    def spaced(self) -> str:
+        if self._spaced is None:
+            self._spaced = _WHITESPACE.sub(' ', self.lower)
+        return self._spaced
+
+    @property
+    def skeleton(self) -> str:
+        """Lowercase text with every non-word character removed."""
+        if self._skeleton is None:
+            self._skeleton = _NON_WORD.sub('', self.lower)
+        return self._skeleton
+
+def _within(text: str, first: str, second: str, gap: int) -> bool:
+    """True if `second` starts at most `gap` characters after an occurrence of `first` ends."""
+    ends = []
+    i = text.find(first)
+    while i != -1:
+        ends.append(i + len(first))
+        i = text.find(first, i + 1)
+    if not ends:
+        return False
+    k = 0
+    j = text.find(second, ends[0])
+    while j != -1:
+        while k + 1 < len(ends) and ends[k + 1] <= j:
+            k += 1
+        if ends[k] <= j <= ends[k] + gap:
+            return True
+        j = text.find(second, j + 1)
+    return False
+
+class RuleStats:
+    """
+    Per-rule counters for BioLinkDetector: how often each rule ran, how
+    often it fired, how often a message it flagged was let through anyway
+    (whitelisted or /approve'd) and the time spent in it. A rule's time
+    includes building any text view it is the first to ask for.
+    """
 
-class BioLinkDetector:
     def __init__(self):
-        self.domain_patterns = [
-            r'\b(?:https?://)?(?:www\.)?[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\b',
-            r'\b(?:t\.me|telegram\.me)/[a-zA-Z0-9_\-]+\b',
-            r'\b(?:bio\.link|linktr\.ee|lnk\.bio|linkin\.bio|beacons\.ai|tap\.bio|campsite\.bio|solo\.to|carrd\.co)(?:[^\s]*)\b',
-            r'\b(?:bit\.ly|tinyurl\.com|goo\.gl|short\.ee)\b',
-        ]
+        self.reset()
+
+    def reset(self):
+        self.messages = 0
+        self.calls = {}
+        self.hits = {}
+        self.overrides = {}
+        self.time_ns = {}
+        self.started = time.time()
+
+    def record(self, rule_id: str, elapsed_ns: int, hit: bool):
+        self.calls[rule_id] = self.calls.get(rule_id, 0) + 1
+        self.time_ns[rule_id] = self.time_ns.get(rule_id, 0) + elapsed_ns
+        if hit:
+            self.hits[rule_id] = self.hits.get(rule_id, 0) + 1
+
+    def record_override(self, rule_id: str):
+        self.overrides[rule_id] = self.overrides.get(rule_id, 0) + 1
+
+    def snapshot(self) -> dict:
+        rules = {}
+        for rule_id in set(self.calls) | set(self.hits) | set(self.overrides):
+            calls = self.calls.get(rule_id, 0)
+            spent = self.time_ns.get(rule_id, 0)
+            rules[rule_id] = {
+                "calls": calls,
+                "hits": self.hits.get(rule_id, 0),
+                "overrides": self.overrides.get(rule_id, 0),
+                "time_ms": spent / 1e6,
+                "avg_us": spent / calls / 1e3 if calls else 0.0,
+            }
+        return {"messages": self.messages, "since": self.started, "rules": rules}
+
+class BioLinkDetector:
+    def __init__(self, instrument: bool = False):
+        self.stats = RuleStats() if instrument else None
         self.target_domains = ("bio.link", "linktr.ee", "lnk.bio", "linkin.bio", "beacons.ai", "tap.bio", "campsite.bio", "solo.to", "carrd.co")
         self.target_synonyms = ("biolink", "linktree", "linkinbio", "bio-link", "link-in-bio")
+        # Text rules in priority order; the first one that fires decides the verdict.
+        self.rules = [
+            ("pattern:url", self._rule_url),
+            ("pattern:domain", self._rule_domain),
+            ("domain", self._rule_target_domain),
+            ("synonym", self._rule_synonym),
+            ("match:confusable_biolink", self._rule_confusable),
+            ("match:bio*link", self._skeleton_rule(_BIO_DOT_LINK, "match:bio*link")),
+            ("match:linktr*ee", self._skeleton_rule(_LINKTR_DOT_EE, "match:linktr*ee")),
+            ("match:bio..link", self._regex_rule(_BIO_NEAR_LINK, "match:bio..link")),
+            ("match:link..tree", self._regex_rule(_LINK_NEAR_TREE, "match:link..tree")),
+            ("match:link..bio", self._regex_rule(_LINK_NEAR_BIO, "match:link..bio")),
+            ("match:spaced-biolink", self._skeleton_contains("biolink", "match:spaced-biolink")),
+            ("match:spaced-linktree", self._skeleton_contains("linktree", "match:spaced-linktree")),
+            ("match:bio..link-heuristic", self._rule_far_bio_link),
+            ("match:hindi-bio-link", self._rule_hindi),
+        ]
 
     def normalize(self, text: str) -> str:
-        s = _strip_diacritics(text or '')
-        s = _fold_confusables(s)
-        return re.sub(r'[\u200B-\u200F\u202A-\u202E\u2060]', '', s).strip()
+        return fold(text).strip()
 
     def normalize_obfuscations(self, text: str) -> str:
-        s = text.lower()
-        s = self.normalize(s)
-        s = _fold_confusables(s)
-        s = re.sub(r'\s*\[\s*dot\s*\]\s*', '.', s)
-        s = re.sub(r'\s*dot\s*', '.', s)
-        s = s.replace('•', '.').replace('·', '.').replace('∙', '.').replace('●', '.').replace('﹒', '.').replace('．', '.').replace('｡', '.')
-        s = s.replace(' ', '').replace('-', '').replace('_', '')
-        return s
-    
+        return obfuscation_view(self.normalize(text.lower()))
+
     def contains_confusable_biolink(self, text: str) -> bool:
-        s = self.normalize(text).lower()
-        s = re.sub(r'[\s\-\._]+', '', s)
-        s = (s.replace('0', 'o')
-               .replace('1', 'l')
-               .replace('¡', 'i'))
-        s = _fold_confusables(s)
-        collapsed = re.sub(r'[^a-z0-9]+', '', s)
-        return ('biolink' in collapsed) or ('linktree' in collapsed) or ('linktr' in collapsed and 'ee' in collapsed)
+        return self._rule_confusable(_Scan(self.normalize(text))) is not None
 
-    def has_link_in_text(self, text: str) -> bool:
-        content = self.normalize(text)
-        if URL_PATTERN.search(content):
-            return True
-        for pattern in self.domain_patterns:
-            if re.search(pattern, content, re.IGNORECASE):
-                return True
-        obf = self.normalize_obfuscations(text)
+    def _rule_url(self, scan):
+        m = _URL.search(scan.norm)
+        return ("pattern:url", m.span()) if m else None
+
+    def _rule_domain(self, scan):
+        m = _DOMAIN.search(scan.norm)
+        return ("pattern:domain", m.span()) if m else None
+
+    def _rule_target_domain(self, scan):
+        obf = scan.obf
         for dom in self.target_domains:
             if dom in obf:
-                return True
+                return (f"domain:{dom}", None)
+        return None
+
+    def _rule_synonym(self, scan):
+        obf = scan.obf
         for syn in self.target_synonyms:
             if syn in obf:
-                return True
-        if self.contains_confusable_biolink(text):
-            return True
-        if re.search(r'bio(\W*|dot)+link', text, re.IGNORECASE):
-            return True
-        if re.search(r'linktr(\W*|dot)+ee', text, re.IGNORECASE):
-            return True
-        if re.search(r'bio[\W_]{0,10}link', content, re.IGNORECASE):
-            return True
-        if re.search(r'link[\W_]{0,10}tree', content, re.IGNORECASE):
-            return True
-        if re.search(r'link[\W_]{0,10}bio', content, re.IGNORECASE):
-            return True
-        if re.search(r'b\W*i\W*o\W*l\W*i\W*n\W*k', text, re.IGNORECASE):
-            return True
-        if re.search(r'l\W*i\W*n\W*k\W*t\W*r\W*e\W*e', text, re.IGNORECASE):
-            return True
-        base = re.sub(r'\s+', ' ', content.lower())
-        if re.search(r'bio.{0,100}link', base) or re.search(r'link.{0,100}bio', base):
-            return True
-        if re.search(r'\bbio\s*(me|mein|mai|m)\s*link\b', base, re.IGNORECASE):
-            return True
-        return False
+                return (f"synonym:{syn}", None)
+        return None
 
-    def has_link_in_message(self, message) -> bool:
-        base = message.text or message.caption or ""
-        base = self.normalize(base)
-        entities = []
-        if getattr(message, "entities", None):
-            entities += message.entities
-        if getattr(message, "caption_entities", None):
-            entities += message.caption_entities
-        for e in entities:
-            if e.type in ("url", "text_link"):
-                if e.type == "text_link" and getattr(e, "url", None):
-                    return True
-                if base:
-                    seg = base[e.offset:e.offset + e.length]
-                    if seg:
-                        return True
-        return self.has_link_in_text(base)
-    
-    def get_link_reason(self, message):
-        base = message.text or message.caption or ""
-        norm = self.normalize(base)
-        entities = []
-        if getattr(message, "entities", None):
-            entities += message.entities
-        if getattr(message, "caption_entities", None):
-            entities += message.caption_entities
+    def _rule_confusable(self, scan):
+        collapsed = scan.collapsed
+        if ('biolink' in collapsed) or ('linktree' in collapsed) or ('linktr' in collapsed and 'ee' in collapsed):
+            return ("match:confusable_biolink", None)
+        return None
+
+    def _regex_rule(self, regex, label):
+        def check(scan):
+            m = regex.search(scan.norm)
+            return (label, m.span()) if m else None
+        return check
+
+    def _skeleton_rule(self, regex, label):
+        def check(scan):
+            return (label, None) if regex.search(scan.skeleton) else None
+        return check
+
+    def _skeleton_contains(self, word, label):
+        def check(scan):
+            return (label, None) if word in scan.skeleton else None
+        return check
+
+    def _rule_far_bio_link(self, scan):
+        spaced = scan.spaced
+        if _within(spaced, "bio", "link", 100) or _within(spaced, "link", "bio", 100):
+            return ("match:bio..link-heuristic", None)
+        return None
+
+    def _rule_hindi(self, scan):
+        m = _HINDI_BIO_LINK.search(scan.spaced)
+        return ("match:hindi-bio-link", None) if m else None
+
+    def _classify_scan(self, scan) -> LinkVerdict:
+        if scan.norm:
+            stats = self.stats
+            if stats is None:
+                for rule_id, check in self.rules:
+                    hit = check(scan)
+                    if hit is not None:
+                        return LinkVerdict(True, hit[0], hit[1], scan.norm, rule_id)
+            else:
+                clock = time.perf_counter_ns
+                for rule_id, check in self.rules:
+                    t0 = clock()
+                    hit = check(scan)
+                    stats.record(rule_id, clock() - t0, hit is not None)
+                    if hit is not None:
+                        return LinkVerdict(True, hit[0], hit[1], scan.norm, rule_id)
+        return LinkVerdict(False, None, None, scan.norm, None)
+
+    def classify_text(self, text: str) -> LinkVerdict:
+        if self.stats is not None:
+            self.stats.messages += 1
+        return self._classify_scan(_Scan(self.normalize(text)))
+
+    def classify(self, message) -> LinkVerdict:
+        """Normalize the message once, walk its entities once and run the text rules in order."""
+        stats = self.stats
+        if stats is not None:
+            stats.messages += 1
+        norm = self.normalize(message.text or message.caption or "")
+        entities = tuple(getattr(message, "entities", None) or ()) + tuple(getattr(message, "caption_entities", None) or ())
         for e in entities:
+            rule_id = None
             if e.type == "text_link" and getattr(e, "url", None):
-                return "entity:text_link"
-            if e.type == "url":
-                seg = norm[e.offset:e.offset + e.length]
-                if seg:
-                    return "entity:url"
-        if URL_PATTERN.search(norm):
-            return "pattern:url"
-        for pattern in self.domain_patterns:
-            if re.search(pattern, norm, re.IGNORECASE):
-                return "pattern:domain"
-        obf = self.normalize_obfuscations(base)
+                rule_id = "entity:text_link"
+            elif e.type == "url" and norm[e.offset:e.offset + e.length]:
+                rule_id = "entity:url"
+            if rule_id:
+                if stats is not None:
+                    stats.record(rule_id, 0, True)
+                return LinkVerdict(True, rule_id, (e.offset, e.offset + e.length), norm, rule_id)
+        return self._classify_scan(_Scan(norm))
+
+    def reorder_rules(self) -> bool:
+        """
+        Sort the text rules by observed hits per unit of time so cheap rules
+        that fire often run first. Needs instrumentation; returns True if the
+        order changed. Rules that never ran keep their place at the end.
+        """
+        stats = self.stats
+        if stats is None:
+            return False
+
+        def score(rule):
+            calls = stats.calls.get(rule[0], 0)
+            if not calls:
+                return 0.0
+            hit_rate = (stats.hits.get(rule[0], 0) + 1) / (calls + 2)
+            return hit_rate / max(stats.time_ns.get(rule[0], 0) / calls, 1.0)
+
+        new_order = sorted(self.rules, key=score, reverse=True)
+        changed = [r[0] for r in new_order] != [r[0] for r in self.rules]
+        self.rules = new_order
+        return changed
+
+    def target_domain_of(self, host: str):
+        """The bio-link service `host` belongs to (itself or a subdomain), or None."""
+        host = (host or "").lower()
         for dom in self.target_domains:
-            if dom in obf:
-                return f"domain:{dom}"
-        for syn in self.target_synonyms:
-            if syn in obf:
-                return f"synonym:{syn}"
-        if self.contains_confusable_biolink(base):
-            return "match:confusable_biolink"
-        if re.search(r'bio(\W*|dot)+link', base, re.IGNORECASE):
-            return "match:bio*link"
-        if re.search(r'linktr(\W*|dot)+ee', base, re.IGNORECASE):
-            return "match:linktr*ee"
-        if re.search(r'bio[\W_]{0,10}link', norm, re.IGNORECASE):
-            return "match:bio..link"
-        if re.search(r'link[\W_]{0,10}tree', norm, re.IGNORECASE):
-            return "match:link..tree"
-        if re.search(r'link[\W_]{0,10}bio', norm, re.IGNORECASE):
-            return "match:link..bio"
-        if re.search(r'b\W*i\W*o\W*l\W*i\W*n\W*k', base, re.IGNORECASE):
-            return "match:spaced-biolink"
-        if re.search(r'l\W*i\W*n\W*k\W*t\W*r\W*e\W*e', base, re.IGNORECASE):
-            return "match:spaced-linktree"
-        base2 = re.sub(r'\s+', ' ', norm.lower())
-        if re.search(r'bio.{0,100}link', base2) or re.search(r'link.{0,100}bio', base2):
-            return "match:bio..link-heuristic"
-        if re.search(r'\bbio\s*(me|mein|mai|m)\s*link\b', base2, re.IGNORECASE):
-            return "match:hindi-bio-link"
+            if host == dom or host.endswith("." + dom):
+                return dom
         return None
+
+    def record_override(self, verdict: LinkVerdict):
+        """Count a flagged message that was let through (whitelisted or /approve'd)."""
+        if self.stats is not None and verdict.matched and verdict.rule_id:
+            self.stats.record_override(verdict.rule_id)
+
+    def has_link_in_text(self, text: str) -> bool:
+        return self.classify_text(text).matched
+
+    def has_link_in_message(self, message) -> bool:
+        return self.classify(message).matched
+
+    def get_link_reason(self, message):
+        return self.classify(message).rule
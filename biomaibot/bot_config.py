@@ -61,6 +61,69 @@ try:
     ABUSE_THRESHOLD = float(abuse_threshold_str)
 except ValueError:
     ABUSE_THRESHOLD = 0.8
+# Cache of GPT verdicts for repeated messages (entries, seconds)
+ABUSE_CACHE_SIZE = int(os.getenv("ABUSE_CACHE_SIZE", "4096"))
+ABUSE_CACHE_TTL = int(os.getenv("ABUSE_CACHE_TTL", "3600"))
+# GPT verdicts and resolved short links are also kept in storage for
+# VERDICT_STORE_TTL seconds, so a restart does not pay for them again; the
+# VERDICT_WARM_SIZE freshest are loaded into memory at startup
+VERDICT_STORE_ENABLED = os.getenv("VERDICT_STORE_ENABLED", "true").lower() == "true"
+VERDICT_STORE_TTL = int(os.getenv("VERDICT_STORE_TTL", str(30 * 86400)))
+VERDICT_WARM_SIZE = int(os.getenv("VERDICT_WARM_SIZE", "1024"))
+# Micro-batching of GPT checks: texts per request (1 = off), how long to wait
+# for a batch to fill, and what to do with items a batched answer misses
+# ("single" re-asks them one by one, "local" uses the local fallback)
+ABUSE_BATCH_SIZE = int(os.getenv("ABUSE_BATCH_SIZE", "8"))
+ABUSE_BATCH_WINDOW_MS = float(os.getenv("ABUSE_BATCH_WINDOW_MS", "15"))
+ABUSE_BATCH_FALLBACK = os.getenv("ABUSE_BATCH_FALLBACK", "single").lower()
+
+# Guard around the OpenAI client: concurrent requests, request rate and
+# burst, per-call deadline, and the circuit breaker (consecutive failures
+# before opening, seconds before a probe, and how long a rejected key waits)
+GPT_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", "8"))
+GPT_RATE_PER_SEC = float(os.getenv("GPT_RATE_PER_SEC", "10"))
+GPT_BURST = int(os.getenv("GPT_BURST", "20"))
+GPT_DEADLINE_MS = int(os.getenv("GPT_DEADLINE_MS", "3000"))
+GPT_BREAKER_FAILURES = int(os.getenv("GPT_BREAKER_FAILURES", "5"))
+GPT_BREAKER_RESET = float(os.getenv("GPT_BREAKER_RESET", "30"))
+GPT_AUTH_COOLDOWN = float(os.getenv("GPT_AUTH_COOLDOWN", "600"))
+
+# Background GPT checks: worker count, queue bound, and what to do when the
+# queue is full ("local_only" keeps the new message's local verdict,
+# "drop_oldest" makes room by dropping the longest-waiting one)
+ABUSE_WORKERS = int(os.getenv("ABUSE_WORKERS", "4"))
+ABUSE_QUEUE_SIZE = int(os.getenv("ABUSE_QUEUE_SIZE", "500"))
+ABUSE_QUEUE_OVERFLOW = os.getenv("ABUSE_QUEUE_OVERFLOW", "local_only").lower()
+
+# Local n-gram model (python classifier.py train): scores at or below LOW are
+# clean, at or above HIGH abusive, anything in between goes to GPT
+ABUSE_MODEL_PATH = os.getenv("ABUSE_MODEL_PATH", str(Path(__file__).parent / "abuse_model.npz"))
+ABUSE_MODEL_LOW = float(os.getenv("ABUSE_MODEL_LOW", "0.15"))
+ABUSE_MODEL_HIGH = float(os.getenv("ABUSE_MODEL_HIGH", "0.9"))
+# Extra abuse lexicon terms, one "term<TAB>severity" (1-3) per line
+ABUSE_LEXICON_PATH = os.getenv("ABUSE_LEXICON_PATH", "")
+# Checked messages a user needs before their trust score can skip GPT
+TRUST_MIN_HISTORY = int(os.getenv("TRUST_MIN_HISTORY", "10"))
+# Days after which a verdict counts half as much toward trust
+TRUST_HALF_LIFE_DAYS = float(os.getenv("TRUST_HALF_LIFE_DAYS", "14"))
+# Share of trusted users' messages still sent to GPT, so trust keeps being earned
+TRUST_SAMPLE_RATE = float(os.getenv("TRUST_SAMPLE_RATE", "0.05"))
+
+# Link rule instrumentation (per-rule hits, overrides and timing, see /rulestats)
+RULE_STATS_ENABLED = os.getenv("RULE_STATS_ENABLED", "false").lower() == "true"
+# Re-rank moderation stages (and link rules, when stats are on) every N messages
+PIPELINE_REORDER_EVERY = int(os.getenv("PIPELINE_REORDER_EVERY", "200"))
+
+# Shortened link expansion (needs httpx). The handler waits at most
+# REDIRECT_BUDGET_MS for lookups; slower ones finish in the background.
+REDIRECT_RESOLVER_ENABLED = os.getenv("REDIRECT_RESOLVER_ENABLED", "false").lower() == "true"
+REDIRECT_BUDGET_MS = int(os.getenv("REDIRECT_BUDGET_MS", "800"))
+REDIRECT_TIMEOUT = float(os.getenv("REDIRECT_TIMEOUT", "2.0"))
+REDIRECT_MAX_HOPS = int(os.getenv("REDIRECT_MAX_HOPS", "5"))
+REDIRECT_CONCURRENCY = int(os.getenv("REDIRECT_CONCURRENCY", "8"))
+REDIRECT_CACHE_TTL = int(os.getenv("REDIRECT_CACHE_TTL", "3600"))
+shortener_hosts_str = os.getenv("SHORTENER_HOSTS", "")
+SHORTENER_HOSTS = [x.strip().lower() for x in shortener_hosts_str.split(",") if x.strip()]
 
 # Time settings
 EDIT_DELETE_DELAY = 10  # 10 seconds
@@ -69,6 +132,35 @@ STICKER_DELETE_DELAY = int(os.getenv("STICKER_DELETE_DELAY", "30"))  # default 3
 
 # MongoDB and moderation config
 MONGO_URI = os.getenv("MONGO_URI", "")
+# Connection pool size, per-read timeout (seconds) and how long settings
+# writes are gathered into one bulk write (ms)
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "20"))
+MONGO_TIMEOUT = float(os.getenv("MONGO_TIMEOUT", "5"))
+MONGO_FLUSH_MS = int(os.getenv("MONGO_FLUSH_MS", "50"))
+# Events are written behind the handlers by a background thread: one batch
+# (one transaction) every EVENT_FLUSH_MS or EVENT_BATCH_SIZE events, with at
+# most EVENT_QUEUE_SIZE waiting before new ones are dropped
+EVENT_WRITER_ENABLED = os.getenv("EVENT_WRITER_ENABLED", "true").lower() == "true"
+EVENT_FLUSH_MS = int(os.getenv("EVENT_FLUSH_MS", "200"))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "256"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))
+# Retention: raw events are rolled up into daily per-chat counts and deleted
+# after EVENT_RETENTION_DAYS (0 keeps them), except the EVENT_RETENTION_KEEP
+# types the abuse model trains on. A background pass runs every
+# RETENTION_INTERVAL seconds, RETENTION_BATCH rows per transaction, and
+# hands back up to RETENTION_VACUUM_PAGES free pages each time. A database
+# file older than incremental vacuum needs RETENTION_CONVERT_VACUUM once: a
+# full VACUUM at startup, before any handler runs
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+EVENT_RETENTION_DAYS = float(os.getenv("EVENT_RETENTION_DAYS", "30"))
+EVENT_RETENTION_KEEP = tuple(t.strip() for t in os.getenv("EVENT_RETENTION_KEEP", "abuse_delete,abuse_clean,approve").split(",") if t.strip())
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "300"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "1000"))
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "256"))
+RETENTION_CONVERT_VACUUM = os.getenv("RETENTION_CONVERT_VACUUM", "false").lower() == "true"
+# /stats: per-chat deletion counts kept in memory in hourly buckets for the
+# last MOD_STATS_HOURS hours, refilled from the stored events at startup
+MOD_STATS_HOURS = int(os.getenv("MOD_STATS_HOURS", "168"))
 DEFAULT_WARNING_LIMIT = int(os.getenv("DEFAULT_WARNING_LIMIT", "3"))
 DEFAULT_PUNISHMENT = os.getenv("DEFAULT_PUNISHMENT", "mute")
 DEFAULT_CONFIG = ("warn", DEFAULT_WARNING_LIMIT, DEFAULT_PUNISHMENT)
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire `ttl` seconds after they were
+    stored. Lookups and inserts are O(1); the least recently used entry is
+    evicted when the cache is full. Not thread-safe, meant for the event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0, clock=time.monotonic):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires = entry
+        if expires <= self._clock():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        expires = self._clock() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Local abuse model: multinomial naive Bayes over hashed character n-grams.
+
+    python classifier.py train [--out abuse_model.npz] [--folds 5] [--min-per-class 20] [--force]
+    python classifier.py eval [--model abuse_model.npz]
+
+Training data comes from the stored moderation events: `abuse_delete` texts
+are abusive, `abuse_clean` (GPT said no) and `approve` (an admin let the
+message stay) texts are clean, and an approval wins over an earlier delete
+of the same text. Deletions the model or the lexicon decided on their own
+are left out, so the model never learns from its own output. `train`
+reports cross-validated precision and recall, and how many messages the
+model would have settled without GPT, before saving.
+"""
+import argparse
+import math
+import re
+import sys
+import zlib
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from normalize import fold
+
+MODEL_PATH = Path(__file__).parent / "abuse_model.npz"
+POSITIVE = ("abuse_delete",)
+NEGATIVE = ("abuse_clean", "approve")
+# Deletion reasons (before any ':') from the local checks, not GPT.
+SELF_LABELLED = ("model", "lexicon")
+MAX_CHARS = 1024
+
+_WHITESPACE = re.compile(r'\s+')
+
+def prepare(text: str) -> str:
+    return ' ' + _WHITESPACE.sub(' ', fold(text or '').lower()).strip()[:MAX_CHARS] + ' '
+
+class NgramNaiveBayes:
+    """
+    Two-class multinomial naive Bayes. Character n-grams of the folded,
+    lower-cased text are hashed into `n_features` buckets (a power of two),
+    so the model size is fixed however much text it has seen, and the same
+    confusable folding as the link detector applies.
+    """
+
+    def __init__(self, n_features: int = 1 << 18, ngram_range=(2, 4), alpha: float = 0.5):
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        if n_features & (n_features - 1):
+            raise ValueError("n_features must be a power of two")
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.alpha = alpha
+        self.counts = np.zeros((2, n_features), dtype=np.float64)
+        self.docs = np.zeros(2, dtype=np.float64)
+        self._log_prob = None
+        self._log_prior = None
+
+    def _features(self, text: str):
+        s = prepare(text).encode('utf-8', 'surrogatepass')
+        mask = self.n_features - 1
+        lo, hi = self.ngram_range
+        idx = [zlib.crc32(s[i:i + n]) & mask for n in range(lo, hi + 1) for i in range(len(s) - n + 1)]
+        if not idx:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        buckets, counts = np.unique(np.asarray(idx, dtype=np.int64), return_counts=True)
+        return buckets, counts.astype(np.float64)
+
+    def partial_fit(self, texts, labels):
+        for text, label in zip(texts, labels):
+            buckets, counts = self._features(text)
+            row = 1 if label else 0
+            np.add.at(self.counts[row], buckets, counts)
+            self.docs[row] += 1
+        self._log_prob = None
+        return self
+
+    def fit(self, texts, labels):
+        self.counts[:] = 0
+        self.docs[:] = 0
+        return self.partial_fit(texts, labels)
+
+    def _prepare(self):
+        smoothed = self.counts + self.alpha
+        self._log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        self._log_prior = np.log((self.docs + 1) / (self.docs.sum() + 2))
+
+    def predict_proba(self, text: str) -> float:
+        """Probability that `text` is abusive."""
+        if self._log_prob is None:
+            self._prepare()
+        buckets, counts = self._features(text)
+        scores = self._log_prior + self._log_prob[:, buckets] @ counts
+        margin = scores[0] - scores[1]
+        if margin > 700:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(margin))
+
+    def save(self, path):
+        np.savez_compressed(path, counts=self.counts.astype(np.float32), docs=self.docs,
+                            meta=np.array([self.n_features, self.ngram_range[0], self.ngram_range[1]]),
+                            alpha=np.array([self.alpha]))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        n_features, lo, hi = (int(x) for x in data["meta"])
+        model = cls(n_features, (lo, hi), float(data["alpha"][0]))
+        model.counts = data["counts"].astype(np.float64)
+        model.docs = data["docs"].astype(np.float64)
+        return model
+
+def load_model(path=MODEL_PATH):
+    """The saved model at `path`, or None if there is none or numpy is missing."""
+    if np is None or not Path(path).exists():
+        return None
+    try:
+        return NgramNaiveBayes.load(path)
+    except Exception as e:
+        print(f"Warning: could not load abuse model from {path}: {e}")
+        return None
+
+def examples_from_events(events):
+    """(text, label) pairs from (type, payload) events. Later events relabel a text, but never an approved one."""
+    labelled = {}
+    for event_type, payload in events:
+        text = (payload or {}).get("text")
+        if not text:
+            continue
+        key = prepare(text)
+        if event_type in POSITIVE and str(payload.get("reason") or "").split(":", 1)[0] in SELF_LABELLED:
+            continue
+        if event_type in POSITIVE:
+            if labelled.get(key, (None, None))[1] != "approve":
+                labelled[key] = ((text, 1), event_type)
+        elif event_type in NEGATIVE:
+            labelled[key] = ((text, 0), event_type)
+    return [example for example, _ in labelled.values()]
+
+def score_report(labels, probs, low: float, high: float) -> dict:
+    """Precision/recall at 0.5, and what the model settles on its own between `low` and `high`."""
+    tp = sum(1 for y, p in zip(labels, probs) if y and p >= 0.5)
+    fp = sum(1 for y, p in zip(labels, probs) if not y and p >= 0.5)
+    fn = sum(1 for y, p in zip(labels, probs) if y and p < 0.5)
+    decided = [(y, p) for y, p in zip(labels, probs) if p >= high or p <= low]
+    d_tp = sum(1 for y, p in decided if y and p >= high)
+    d_fp = sum(1 for y, p in decided if not y and p >= high)
+    d_wrong = sum(1 for y, p in decided if (y and p <= low) or (not y and p >= high))
+    return {
+        "examples": len(labels),
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "local_share": len(decided) / len(labels) if labels else 0.0,
+        "local_precision": d_tp / (d_tp + d_fp) if d_tp + d_fp else 0.0,
+        "local_errors": d_wrong,
+    }
+
+def cross_validate(examples, folds: int, low: float, high: float, seed: int = 1) -> dict:
+    import random
+    order = list(range(len(examples)))
+    random.Random(seed).shuffle(order)
+    labels, probs = [], []
+    for k in range(folds):
+        test = set(order[k::folds])
+        train = [examples[i] for i in order if i not in test]
+        model = NgramNaiveBayes().fit([t for t, _ in train], [y for _, y in train])
+        for i in sorted(test):
+            labels.append(examples[i][1])
+            probs.append(model.predict_proba(examples[i][0]))
+    return score_report(labels, probs, low, high)
+
+def _print_report(title, r):
+    print(f"{title}: {r['examples']} examples, precision {r['precision']:.3f}, recall {r['recall']:.3f}, "
+          f"settled locally {r['local_share']:.1%} (precision {r['local_precision']:.3f}, {r['local_errors']} wrong)")
+
+def _load_examples():
+    from storage import Storage
+    return examples_from_events(Storage().iter_events(POSITIVE + NEGATIVE))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+    tr = sub.add_parser("train", help="train from stored events and save the model")
+    tr.add_argument("--out", default=str(MODEL_PATH))
+    tr.add_argument("--folds", type=int, default=5)
+    tr.add_argument("--min-per-class", type=int, default=20)
+    tr.add_argument("--force", action="store_true", help="save even with too few examples")
+    ev = sub.add_parser("eval", help="score a saved model against the stored history")
+    ev.add_argument("--model", default=str(MODEL_PATH))
+    for p in (tr, ev):
+        p.add_argument("--low", type=float, default=0.15)
+        p.add_argument("--high", type=float, default=0.9)
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if np is None:
+        print("numpy is not installed", file=sys.stderr)
+        return 1
+
+    examples = _load_examples()
+    positives = sum(y for _, y in examples)
+    negatives = len(examples) - positives
+    print(f"{positives} abusive and {negatives} clean examples in the stored history")
+
+    if args.command == "eval":
+        model = load_model(args.model)
+        if model is None:
+            print(f"no model at {args.model}", file=sys.stderr)
+            return 1
+        probs = [model.predict_proba(t) for t, _ in examples]
+        _print_report("history", score_report([y for _, y in examples], probs, args.low, args.high))
+        return 0
+
+    if min(positives, negatives) < args.min_per_class and not args.force:
+        print(f"need at least {args.min_per_class} examples per class (use --force to save anyway)", file=sys.stderr)
+        return 1
+    if args.folds > 1 and min(positives, negatives) >= args.folds:
+        _print_report(f"{args.folds}-fold cross-validation", cross_validate(examples, args.folds, args.low, args.high))
+    model = NgramNaiveBayes().fit([t for t, _ in examples], [y for _, y in examples])
+    model.save(args.out)
+    print(f"model saved to {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
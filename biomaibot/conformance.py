@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Checks that every storage backend behaves the same.
+
+    python conformance.py [--backend memory,sqlite] [--mongo URI] [-v]
+
+Each check gets a fresh backend and goes through the backend.StorageBackend
+methods directly; the last one drives storage.Storage on top of it, with
+the event writer on. SQLite runs against a file in a temporary directory.
+--mongo adds a MongoDB backend at URI; point it at a scratch database,
+since its collections are emptied before every check. Exits non-zero if
+any check fails. pytest runs the same checks through test_conformance.py:
+memory and SQLite always, MongoDB when TEST_MONGO_URI names a scratch
+database.
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+from backend import SET_NAMES
+
+NOW = time.time()
+
+def _row(event_type, payload, ts, new_user=None, new_chat=None):
+    return (event_type, payload, ts, new_user, new_chat)
+
+def check_events(b):
+    b.insert_events([
+        _row("seen", {"chat_id": -100, "user_id": 1}, NOW - 30, 1, -100),
+        _row("abuse_delete", {"chat_id": -100, "user_id": 2, "text": "idiot", "reason": "lexicon"}, NOW - 20, 2),
+        _row("seen", {"chat_id": -200, "user_id": 1}, NOW - 10, None, -200),
+    ])
+    b.add_event(_row("approve", {"chat_id": -100, "user_id": 3, "text": "नमस्ते"}, NOW, 3))
+    b.flush()
+    assert b.count_events() == 4, b.count_events()
+    events = b.iter_events()
+    assert [t for t, _ in events] == ["seen", "abuse_delete", "seen", "approve"], events
+    assert events[1][1] == {"chat_id": -100, "user_id": 2, "text": "idiot", "reason": "lexicon"}, events[1]
+    assert events[3][1]["text"] == "नमस्ते", events[3]
+    only = b.iter_events(("abuse_delete", "approve"))
+    assert [p["user_id"] for _, p in only] == [2, 3], only
+    assert b.iter_events(("missing",)) == []
+
+def check_events_since(b):
+    b.insert_events([
+        _row("abuse_delete", {"chat_id": -1, "user_id": 1, "reason": "model"}, NOW - 7200),
+        _row("link_delete", {"chat_id": -1, "user_id": 2, "reason": "bio"}, NOW - 60),
+        _row("seen", {"chat_id": -1, "user_id": 2}, NOW - 30),
+        _row("abuse_delete", {"chat_id": -2, "user_id": 3, "reason": "lexicon:x"}, NOW),
+    ])
+    b.flush()
+    recent = b.events_since(("abuse_delete", "link_delete"), NOW - 3600)
+    assert [(t, p["user_id"]) for t, p, _ in recent] == [("link_delete", 2), ("abuse_delete", 3)], recent
+    assert abs(recent[0][2] - (NOW - 60)) <= 1 and recent[0][1]["reason"] == "bio", recent[0]
+    assert len(b.events_since(("abuse_delete",), NOW - 86400)) == 2
+    assert b.events_since(("approve",), 0) == []
+
+def check_event_without_ids(b):
+    b.add_event(_row("start", {"note": "no chat"}, NOW))
+    b.add_event(_row("start", {}, NOW + 1))
+    b.flush()
+    assert b.iter_events(("start",)) == [("start", {"note": "no chat"}), ("start", {})], b.iter_events()
+
+def check_seen(b):
+    users, chats = b.load_seen()
+    assert users == set() and chats == set(), (users, chats)
+    b.insert_events([_row("seen", {"chat_id": -1, "user_id": 7}, NOW, 7, -1),
+                     _row("seen", {"chat_id": -2, "user_id": 8}, NOW, 8, -2)])
+    b.insert_events([_row("seen", {"chat_id": -1, "user_id": 7}, NOW)])
+    b.flush()
+    assert b.load_seen() == ({7, 8}, {-1, -2}), b.load_seen()
+
+def check_state(b):
+    assert b.load_state() == {}
+    b.update_state({"abuse_enabled": True, "log_chat": -5, "words": ["a", "ब"]})
+    b.update_state({"log_chat": -6})
+    assert b.load_state() == {"abuse_enabled": True, "log_chat": -6, "words": ["a", "ब"]}, b.load_state()
+
+def check_sets(b):
+    for name in SET_NAMES:
+        assert b.load_set(name) == set(), name
+    b.sync_set("blocklist", {"spam", "scam", "स्पैम"}, set())
+    b.sync_set("blocklist", {"promo"}, {"scam"})
+    b.sync_set("special_users", {10, 11}, set())
+    b.sync_set("special_users", set(), {10, 99})
+    assert b.load_set("blocklist") == {"spam", "स्पैम", "promo"}, b.load_set("blocklist")
+    assert b.load_set("special_users") == {11}, b.load_set("special_users")
+    assert b.load_set("link_whitelist") == set()
+
+def check_chat_settings(b):
+    assert b.load_chat_settings(-1) == {}
+    b.set_chat_setting(-1, "sensitivity", "high")
+    b.set_chat_setting(-1, "edit", 30)
+    b.set_chat_setting(-1, "edit", 45)
+    b.set_chat_setting(-2, "sensitivity", "low")
+    b.flush()
+    assert b.load_chat_settings(-1) == {"sensitivity": "high", "edit": 45}, b.load_chat_settings(-1)
+    assert b.load_chat_settings(-2) == {"sensitivity": "low"}, b.load_chat_settings(-2)
+
+def check_groups(b):
+    assert b.count_groups() == 0
+    b.add_group(-1, "First")
+    b.add_group(-1)
+    b.add_group(-1, "Renamed")
+    b.add_group(-2)
+    assert b.count_groups() == 2, b.count_groups()
+
+def check_verdicts(b):
+    key, other = bytes(range(16)), b"\xff" * 16
+    assert b.load_verdict("abuse", key, NOW) is None
+    b.save_verdict("abuse", key, [True, "slur"], "gpt", 0.9, NOW + 100)
+    b.save_verdict("abuse", other, [False, ""], "gpt", None, NOW + 200)
+    b.save_verdict("link", key, ["https://t.me/x", "t.me", "/x"], None, None, NOW + 300)
+    b.save_verdict("abuse", b"\x01" * 16, [True, ""], "gpt", None, NOW - 100)
+    b.flush()
+    verdict, expires = b.load_verdict("abuse", key, NOW)
+    assert verdict == [True, "slur"] and abs(expires - (NOW + 100)) <= 1, (verdict, expires)
+    assert b.load_verdict("link", key, NOW)[0] == ["https://t.me/x", "t.me", "/x"]
+    assert b.load_verdict("abuse", b"\x01" * 16, NOW) is None
+    assert b.load_verdict("abuse", key, NOW + 150) is None
+    b.save_verdict("abuse", key, [False, ""], "model", 0.1, NOW + 400)
+    b.flush()
+    assert b.load_verdict("abuse", key, NOW)[0] == [False, ""]
+    recent = b.recent_verdicts("abuse", 10, NOW)
+    assert [(k, v) for k, v, _ in recent] == [(key, [False, ""]), (other, [False, ""])], recent
+    assert len(b.recent_verdicts("abuse", 1, NOW)) == 1
+    assert b.prune_verdicts(NOW) in (0, 1)
+    assert b.prune_verdicts(NOW + 250) == 1
+    assert [k for k, _, _ in b.recent_verdicts("abuse", 10, NOW)] == [key]
+
+def check_async_reads(b):
+    key = bytes(range(16))
+    b.save_verdict("abuse", key, [True, "slur"], "gpt", 0.9, NOW + 100)
+    b.set_chat_setting(-1, "sensitivity", "high")
+    b.flush()
+    b.add_group(-1)
+    b.add_group(-2)
+
+    async def read():
+        return (await b.aload_verdict("abuse", key, NOW), await b.aload_verdict("abuse", key, NOW + 150),
+                await b.aload_chat_settings(-1), await b.aload_chat_settings(-2), await b.acount_groups())
+
+    verdict, expired, settings, missing, groups = asyncio.run(read())
+    assert verdict[0] == [True, "slur"] and expired is None, (verdict, expired)
+    assert settings == {"sensitivity": "high"} and missing == {}, (settings, missing)
+    assert groups == 2, groups
+
+def check_storage(b):
+    from storage import Storage
+    storage = Storage(backend=b)
+    storage.start_writer(flush_ms=5, batch_size=4)
+    for i in range(10):
+        storage.save_event("seen", {"chat_id": -1 - i % 2, "user_id": i % 3})
+    assert storage.count_events() == 10, storage.count_events()
+    assert storage.count_distinct_users() == 3 and storage.count_distinct_chats() == 2
+    storage.sync_set("link_whitelist", {"t.me/ok", "example.com"})
+    storage.sync_set("link_whitelist", {"t.me/ok"})
+    storage.update_state({"abuse_enabled": False})
+    storage.flush()
+    assert b.load_set("link_whitelist") == {"t.me/ok"}
+    assert b.load_seen() == ({0, 1, 2}, {-1, -2}), b.load_seen()
+    assert storage.load_state() == {"abuse_enabled": False}
+    assert storage.errors == 0, storage.errors
+    storage.stop_writer()
+
+CHECKS = [check_events, check_events_since, check_event_without_ids, check_seen, check_state, check_sets,
+          check_chat_settings, check_groups, check_verdicts, check_async_reads, check_storage]
+
+def open_memory(tmp):
+    from memory_backend import MemoryBackend
+    return MemoryBackend()
+
+def open_sqlite(tmp):
+    from sqlite_backend import SqliteBackend
+    open_sqlite.n = getattr(open_sqlite, "n", 0) + 1
+    return SqliteBackend(str(Path(tmp) / f"conformance{open_sqlite.n}.db"))
+
+def mongo_opener(uri):
+    """Backend factory for a scratch MongoDB database at `uri`, emptied on every open."""
+    from mongo_backend import MongoBackend
+
+    def factory(tmp):
+        b = MongoBackend(uri, timeout=10)
+
+        async def empty():
+            for name in await b.db.list_collection_names():
+                await b.db[name].delete_many({})
+
+        b.read(empty)
+        return b
+
+    return factory
+
+# Factories taking a temporary directory, for the backends that need no server.
+BACKENDS = {"memory": open_memory, "sqlite": open_sqlite}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="memory,sqlite", help="comma-separated: memory, sqlite")
+    parser.add_argument("--mongo", default="", metavar="URI", help="also check MongoDB at URI (a scratch database)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print tracebacks of failures")
+    args = parser.parse_args()
+    backends = [(name, BACKENDS[name]) for name in args.backend.split(",") if name]
+    if args.mongo:
+        backends.append(("mongo", mongo_opener(args.mongo)))
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in backends:
+            for check in CHECKS:
+                label = check.__name__[len("check_"):]
+                try:
+                    b = factory(tmp)
+                except Exception as e:
+                    print(f"{name:7} {label:18} ERROR  could not open: {e}")
+                    failures += 1
+                    continue
+                try:
+                    check(b)
+                    print(f"{name:7} {label:18} ok")
+                except Exception as e:
+                    failures += 1
+                    print(f"{name:7} {label:18} FAIL   {type(e).__name__}: {e}")
+                    if args.verbose:
+                        traceback.print_exc()
+                finally:
+                    b.close()
+    print(f"{len(backends) * len(CHECKS) - failures} passed, {failures} failed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
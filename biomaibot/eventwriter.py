@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class EventWriter:
+    """
+    Write-behind buffer for storage writes. `put` only appends to an
+    in-memory queue; a background thread hands the queued items to
+    `write_batch(items)` in lists of up to `batch_size`, as soon as that
+    many are waiting or `flush_ms` after the last flush. When `maxsize`
+    items are already waiting, new ones are dropped rather than blocking
+    the caller.
+    """
+
+    def __init__(self, write_batch, flush_ms: float = 200.0, batch_size: int = 256, maxsize: int = 10000,
+                 name: str = "event-writer"):
+        self.write_batch = write_batch
+        self.interval = max(0.001, flush_ms / 1000.0)
+        self.batch_size = max(1, batch_size)
+        self.maxsize = max(self.batch_size, maxsize)
+        self.name = name
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._writing = 0
+        self._stopping = False
+        self._flush_now = False
+        self._thread = None
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.write_ns = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def accepting(self) -> bool:
+        """Whether `put` queues items (or drops them when full) rather than refusing them."""
+        return self.running and not self._stopping
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def put(self, item) -> bool:
+        """Queue one item without waiting; False if it was dropped."""
+        with self._cond:
+            if self._stopping or not self.running:
+                return False
+            if len(self._queue) >= self.maxsize:
+                self.dropped += 1
+                return False
+            self._queue.append(item)
+            self.queued += 1
+            depth = len(self._queue)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            if depth >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued so far has been written; False on timeout."""
+        with self._cond:
+            self._flush_now = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._queue and not self._writing or not self.running, timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """Write what is still queued and stop the thread."""
+        thread = self._thread
+        if thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error(f"{self.name} did not finish within {timeout}s; {len(self._queue)} items not written")
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._queue) >= self.batch_size or self._stopping or self._flush_now,
+                                    self.interval)
+                if len(self._queue) <= self.batch_size:
+                    self._flush_now = False
+                if not self._queue:
+                    if self._stopping:
+                        self._cond.notify_all()
+                        return
+                    continue
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._writing = len(batch)
+            t0 = time.perf_counter_ns()
+            try:
+                self.write_batch(batch)
+                self.flushed += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"{self.name}: writing {len(batch)} items failed: {e}")
+            finally:
+                self.write_ns += time.perf_counter_ns() - t0
+                self.batches += 1
+                with self._cond:
+                    self._writing = 0
+                    self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        return {
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch": self.flushed / self.batches if self.batches else 0.0,
+            "write_avg_ms": self.write_ns / self.batches / 1e6 if self.batches else 0.0,
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+class GuardRejected(Exception):
+    """The guard refused or abandoned a call; `reason` says why."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: int, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._stamp = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available."""
+        self._refill()
+        if self._tokens >= 1 or self.rate <= 0:
+            return 0.0 if self._tokens >= 1 else float("inf")
+        return (1 - self._tokens) / self.rate
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset_after` seconds. Then it lets one probe through (half-open): a
+    success closes it, a failure opens it again for another period.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0, clock=time.monotonic):
+        self.threshold = max(1, threshold)
+        self.reset_after = reset_after
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_for = reset_after
+        self.trips = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if self._clock() - self.opened_at < self.open_for:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.trip()
+
+    def release_probe(self):
+        """Give up a half-open probe that never reached the API."""
+        self._probing = False
+
+    def trip(self, open_for: float = None):
+        self.state = self.OPEN
+        self.opened_at = self._clock()
+        self.open_for = self.reset_after if open_for is None else open_for
+        self.trips += 1
+        self._probing = False
+
+    def retry_in(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.open_for - (self._clock() - self.opened_at))
+
+class ApiGuard:
+    """
+    Wraps calls to a remote API so the caller's wait is bounded by `deadline`
+    no matter how the API behaves: a token bucket caps the request rate, a
+    semaphore caps concurrent requests, and a circuit breaker stops calling
+    an API that keeps failing. Anything the guard will not run in time raises
+    GuardRejected so the caller can fall back to local checks.
+    """
+
+    def __init__(self, concurrency: int = 8, rate: float = 10.0, burst: int = 20, deadline: float = 3.0,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0):
+        self.deadline = deadline
+        self.concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = {}
+
+    def available(self) -> bool:
+        """Cheap pre-check: False while the breaker is open."""
+        return self.breaker.state != CircuitBreaker.OPEN or self.breaker.retry_in() == 0.0
+
+    def _reject(self, reason: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise GuardRejected(reason)
+
+    async def call(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        if not self.breaker.allow():
+            self._reject("circuit_open")
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            while not self.bucket.try_take():
+                wait = self.bucket.wait_time()
+                if wait > deadline - loop.time():
+                    self._reject("rate_limited")
+                await asyncio.sleep(wait)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                self._reject("busy")
+        except (GuardRejected, asyncio.CancelledError):
+            # A probe that never reached the API says nothing about its health.
+            if probe:
+                self.breaker.release_probe()
+            raise
+        self.in_flight += 1
+        self.calls += 1
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.failures += 1
+            self.breaker.record_failure()
+            raise GuardRejected("deadline")
+        except asyncio.CancelledError:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        except Exception:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+        self.breaker.record_success()
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "retry_in": self.breaker.retry_in(),
+            "trips": self.breaker.trips,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": dict(self.rejected),
+        }
@@ -1,6 +1,8 @@
 from telegram.constants import ParseMode
 from telegram.ext import CommandHandler
 from bot_config import OWNER_ID, SUPPORT_GROUP_ID
+from abuse import SENSITIVITY
+from modstats import format_report, parse_window
 
 def register_help_commands(application, bot):
     application.add_handler(CommandHandler("help", make_help(bot)))
@@ -12,6 +14,10 @@ def register_help_commands(application, bot):
     application.add_handler(CommandHandler("setmongo", make_setmongo(bot)))
     application.add_handler(CommandHandler("linkapprove", make_linkapprove(bot)))
     application.add_handler(CommandHandler("linkwhitelist", make_linkwhitelist(bot)))
+    application.add_handler(CommandHandler("rulestats", make_rulestats(bot)))
+    application.add_handler(CommandHandler("pipeline", make_pipeline(bot)))
+    application.add_handler(CommandHandler("sensitivity", make_sensitivity(bot)))
+    application.add_handler(CommandHandler("stats", make_stats(bot)))
 
 def make_help(bot):
     async def handler(update, context):
@@ -27,6 +33,10 @@ def make_help(bot):
             f"• <code>/blockadd &lt;word or phrase&gt;</code> — owner only: add to blocklist\n"
             f"• <code>/blocklist</code> — owner only: show all blocked words\n"
             f"• <code>/setdelay &lt;media|sticker&gt; &lt;seconds|1s|1m|off&gt;</code> — per-group auto-delete\n"
+            f"• <code>/sensitivity [low|normal|high]</code> — owner/admin: how eagerly this group's messages go to GPT\n"
+            f"• <code>/stats [24h|7d]</code> — owner/admin: this group's deletions by reason, top offenders and hourly trend\n"
+            f"• <code>/rulestats [reset]</code> — owner only: link rule hits and timing\n"
+            f"• <code>/pipeline</code> — owner only: moderation stage order and savings\n"
             "Bot auto-removes links and abusive content. Edited messages are removed after 10 seconds."
         )
         await update.message.reply_text(text, parse_mode=ParseMode.HTML)
@@ -84,6 +94,7 @@ def make_setdelay(bot):
         if seconds is not None:
             seconds = max(1, min(3600, seconds))
         chat_id = update.effective_chat.id
+        await bot.preload_chat_settings(chat_id)
         bot.set_chat_delay(chat_id, target, seconds)
         if seconds is None:
             await update.message.reply_text(f"✅ {target.capitalize()} auto-delete turned OFF for this group")
@@ -94,6 +105,25 @@ def make_setdelay(bot):
         # global delays persist left as-is; per-chat delays are persisted via bot.set_chat_delay
     return handler
 
+def make_sensitivity(bot):
+    async def handler(update, context):
+        if not await bot.is_owner_or_admin(update, context):
+            await update.message.reply_text("❌ Unauthorized")
+            return
+        chat_id = update.effective_chat.id
+        await bot.preload_chat_settings(chat_id)
+        if not context.args:
+            await update.message.reply_text(f"ℹ️ Abuse sensitivity for this group: {bot.get_chat_sensitivity(chat_id)}")
+            return
+        level = context.args[0].strip().lower()
+        if level not in SENSITIVITY:
+            await update.message.reply_text("Usage: /sensitivity <low|normal|high>")
+            return
+        bot.set_chat_sensitivity(chat_id, level)
+        await update.message.reply_text(f"✅ Abuse sensitivity set to {level} for this group")
+        await bot.send_log(context, f"🎚️ Abuse sensitivity set to {level}", f"Chat: {update.effective_chat.title or chat_id}")
+    return handler
+
 def make_setmongo(bot):
     async def handler(update, context):
         if not await bot.is_owner_or_admin(update, context):
@@ -103,7 +133,7 @@ def make_setmongo(bot):
             await update.message.reply_text("Usage: /setmongo <mongodb_uri>")
             return
         uri = " ".join(context.args).strip()
-        ok = bot.set_mongo_uri(uri)
+        ok = await bot.set_mongo_uri(uri)
         if ok:
             await update.message.reply_text("✅ MongoDB connected")
             await bot.send_log(context, "🗄️ MongoDB connected via command", f"By: {update.effective_user.full_name}")
@@ -122,6 +152,22 @@ def make_approve(bot):
         chat_id = update.message.chat.id
         message_id = update.message.reply_to_message.message_id
         await bot.cancel_deletion_task(chat_id, message_id)
+        approved = update.message.reply_to_message
+        verdict = bot.link_verdicts.pop((chat_id, message_id))
+        if verdict is not None:
+            bot.bio_detector.record_override(verdict)
+        approved_text = approved.text or approved.caption
+        if approved.from_user:
+            # An admin's verdict counts toward trust like GPT's.
+            bot.abuse_detector.record_verdict(approved.from_user.id, False)
+        if approved_text:
+            # Otherwise a stored GPT verdict keeps deleting copies until VERDICT_STORE_TTL runs out.
+            bot.abuse_detector.override(approved_text)
+            bot.storage.save_event("approve", {
+                "chat_id": chat_id,
+                "user_id": approved.from_user.id if approved.from_user else None,
+                "text": approved_text
+            })
         await update.message.reply_text("✅ Approved. Auto-delete canceled.")
         await bot.send_log(context, "✅ Approved message; deletion canceled", f"Chat: {update.effective_chat.title or chat_id}")
     return handler
@@ -140,6 +186,7 @@ def make_blockadd(bot):
             await update.message.reply_text("Usage: /blockadd <word or phrase> or reply to a message")
             return
         bot.blocklist.add(phrase)
+        await bot.refresh_block_matcher()
         await update.message.reply_text(f"✅ Added to blocklist: {phrase}")
         await bot.send_log(context, f"🛑 Blocklist added: {phrase}", f"By: {update.effective_user.full_name}")
         bot.persist_blocklist()
@@ -170,10 +217,10 @@ def make_linkapprove(bot):
             await update.message.reply_text("yash papa se milo")
             return
         if not context.args:
-            await update.message.reply_text("Usage: /linkapprove <domain or substring>")
+            await update.message.reply_text("Usage: /linkapprove <domain or url prefix>")
             return
         phrase = " ".join(context.args).strip().lower()
-        if not phrase:
+        if not phrase or not bot.whitelist_index.add(phrase):
             await update.message.reply_text("❌ Invalid input")
             return
         bot.link_whitelist.add(phrase)
@@ -194,3 +241,69 @@ def make_linkwhitelist(bot):
         text = f"✅ Approved links:\n{words}"
         await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
     return handler
+
+def make_rulestats(bot):
+    async def handler(update, context):
+        if update.effective_user.id != OWNER_ID:
+            await update.message.reply_text("yash papa se milo")
+            return
+        stats = bot.bio_detector.stats
+        if stats is None:
+            await update.message.reply_text("ℹ️ Rule stats disabled. Set RULE_STATS_ENABLED=true")
+            return
+        if context.args and context.args[0].lower() == "reset":
+            stats.reset()
+            await update.message.reply_text("✅ Rule stats reset")
+            return
+        snap = stats.snapshot()
+        rows = sorted(snap["rules"].items(), key=lambda kv: kv[1]["time_ms"], reverse=True)
+        lines = [f"📊 Link rules over {snap['messages']} messages", "rule | hits | overrides | total ms | avg us"]
+        for rule_id, r in rows:
+            lines.append(f"{rule_id} | {r['hits']} | {r['overrides']} | {r['time_ms']:.1f} | {r['avg_us']:.1f}")
+        await update.message.reply_text("\n".join(lines))
+    return handler
+
+def make_pipeline(bot):
+    async def handler(update, context):
+        if update.effective_user.id != OWNER_ID:
+            await update.message.reply_text("yash papa se milo")
+            return
+        snap = bot.moderation.snapshot()
+        lines = [
+            f"🧭 Moderation pipeline over {snap['messages']} messages ({snap['verdicts']} verdicts)",
+            f"Order: {' → '.join(snap['order'])} (declared: {' → '.join(snap['declared_order'])})",
+            f"Reorders: {snap['reorders']} | Saved: {snap['saved_us_per_message']:.1f} us/msg, {snap['saved_ms_total']:.1f} ms total",
+            "stage | runs | hit rate | avg us | skipped",
+        ]
+        for name, s in snap["stages"].items():
+            lines.append(f"{name} | {s['runs']} | {s['hit_rate']:.3f} | {s['avg_us']:.1f} | {s['skipped']}")
+        lines.append("Link rules: " + ", ".join(rule_id for rule_id, _ in bot.bio_detector.rules))
+        if bot.resolver is not None:
+            r = bot.resolver.snapshot()
+            lines.append(f"Redirects: {r['resolved']} resolved, {r['failures']} failed, {r['over_budget']} over budget, "
+                         f"cache hit rate {r['cache']['hit_rate']:.2f} ({r['cache']['size']} entries)")
+        await update.message.reply_text("\n".join(lines))
+    return handler
+
+def make_stats(bot):
+    async def handler(update, context):
+        if not await bot.is_owner_or_admin(update, context):
+            await update.message.reply_text("❌ Unauthorized")
+            return
+        chat = update.effective_chat
+        chat_id, title, hours = chat.id, chat.title or str(chat.id), 24
+        for arg in context.args or []:
+            window = parse_window(arg)
+            if window:
+                hours = window
+            elif arg.lstrip("-").isdigit() and update.effective_user.id == OWNER_ID:
+                chat_id = title = int(arg)
+            else:
+                await update.message.reply_text("Usage: /stats [24h|7d] (owner: /stats <chat_id> [24h|7d])")
+                return
+        if chat.type == "private" and chat_id == chat.id:
+            await update.message.reply_text("Usage: /stats [24h|7d] in a group (owner: /stats <chat_id> [24h|7d])")
+            return
+        report = bot.mod_stats.report(chat_id, hours)
+        await update.message.reply_text(format_report(report, str(title)), parse_mode=ParseMode.HTML)
+    return handler
@@ -0,0 +1,101 @@
+from collections import namedtuple
+
+from automaton import PhraseAutomaton
+from bio import MAX_SCAN_CHARS
+from normalize import word_view
+
+# Term -> severity: 1 mild insult, or a word with an everyday meaning
+# (dog, a name, a place) that is only abusive in context; 2 profanity or
+# strong insult; 3 slur, sexual abuse or threat. One severity-1 term is
+# never enough to delete a message locally, so GPT judges those; the
+# abusive uses of such words get phrase entries of their own ("teri gand").
+# Threats name who they are aimed at ("kill you"), not just the verb.
+# A trailing '*' also matches longer words that start with the term
+# ("fuck*" covers "fucking"), so it is only used where no ordinary word
+# starts the same way; other terms match whole words.
+# Terms are spelled plainly; leetspeak, spacing and lookalikes are handled
+# by word_view on both sides.
+LEXICON = {
+    # English
+    "idiot": 1, "stupid": 1, "moron": 1, "dumb": 1, "loser": 1, "shut up": 1, "stfu": 1, "jerk": 1,
+    "fuck*": 2, "fck": 2, "fuk": 2, "wtf": 1, "shit*": 2, "bitch*": 2, "bastard*": 2, "asshole*": 2,
+    "dick": 1, "dickhead": 2, "cunt*": 3, "whore*": 3, "slut*": 3, "prick": 1, "retard": 2,
+    "retarded": 2, "retards": 2, "motherfucker*": 3, "son of a bitch": 3, "piece of shit": 2,
+    "go to hell": 1, "kill you": 3, "kill u": 3, "kill yourself": 3, "kys": 3, "murder you": 3,
+    "murder u": 3, "rape": 3, "raped": 3, "rapes": 3, "raping": 3, "rapist": 3,
+    "nigger*": 3, "faggot*": 3,
+    # Hinglish (romanised Hindi)
+    "chutiya*": 2, "chutiye": 2, "chutia*": 2, "chut": 1, "teri chut": 3, "choot": 1, "lund": 1,
+    "loda": 2, "lauda": 2, "lavda": 2, "lodu": 2, "gandu": 2, "gaandu": 2, "gand": 1, "teri gand": 3,
+    "gand mar*": 3, "gaand": 2, "bhosdi*": 3, "bhosda": 3, "bhosdike": 3, "bsdk": 3, "madarchod*": 3,
+    "maderchod*": 3, "mc": 1, "behenchod*": 3, "bhenchod*": 3, "benchod*": 3, "bc": 1, "randi": 1,
+    "randiya": 3, "randiyon": 3, "randi ka": 3, "randi ki": 3, "randi ke": 3, "harami*": 2,
+    "haramkhor": 2, "haramzada*": 3, "kamina": 2, "kamine": 2, "kutta": 1, "kutte": 1, "kutiya": 2,
+    "kutti": 1, "saala": 1, "saali": 1, "sala": 1,
+    "jhaatu": 2, "jhant*": 2, "chinal": 3, "chhinal": 3, "teri maa ki": 3, "teri behen ki": 3,
+    "suar ki aulad": 2, "ullu": 1, "ullu ka pattha": 1, "pagal": 1, "bewakoof": 1, "bevakoof": 1,
+    "gadha": 1, "nalayak": 1, "tatti": 1, "jaan se maar": 3, "maar dunga": 3,
+    # Hindi (Devanagari)
+    "मादरचोद": 3, "बहनचोद": 3, "भेनचोद": 3, "भोसडी*": 3, "भोसड़ा": 3, "रंडी": 3, "हरामजादा": 3,
+    "चूतिया": 2, "चुतिया": 2, "गांडू": 2, "गांड": 2, "लौड़ा": 2, "लंड": 2, "हरामी": 2, "कमीना": 2,
+    "कुत्ता": 1, "कुतिया": 2, "साला": 1, "बेवकूफ": 1, "पागल": 1, "गधा": 1, "उल्लू": 1,
+    "जान से मार": 3, "मार डालूंगा": 3,
+}
+
+# Chance that one occurrence of a term at each severity means the message is abusive.
+SEVERITY_WEIGHT = {1: 0.4, 2: 0.85, 3: 0.95}
+
+LexiconHit = namedtuple("LexiconHit", ("confidence", "severity", "terms"))
+
+def load_lexicon_file(path) -> dict:
+    """Read `term<TAB or comma>severity` lines; '#' starts a comment."""
+    entries = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            sep = "\t" if "\t" in line else ","
+            term, _, severity = line.rpartition(sep)
+            try:
+                entries[term.strip()] = max(1, min(3, int(severity)))
+            except ValueError:
+                entries[line] = 2
+    return entries
+
+class Lexicon:
+    """
+    Severity-weighted abuse lexicon matched in one Aho-Corasick pass over
+    the word view of a message. Each term is compiled with a leading space,
+    and a trailing one unless it is a prefix term, so matches start (and
+    usually end) at word boundaries.
+    """
+
+    def __init__(self, entries=None):
+        self.severity = {}
+        for term, severity in (LEXICON if entries is None else entries).items():
+            prefix = term.endswith("*")
+            key = word_view(term.rstrip("*").lower()).strip()
+            if not key:
+                continue
+            pattern = " " + key if prefix else " " + key + " "
+            self.severity[pattern] = max(severity, self.severity.get(pattern, 0))
+        self.automaton = PhraseAutomaton(self.severity)
+
+    def __len__(self):
+        return len(self.severity)
+
+    def match(self, text: str):
+        """LexiconHit for the terms in `text`, or None if there are none."""
+        if not text:
+            return None
+        found = {}
+        for pattern, _, _ in self.automaton.finditer(word_view(text[:MAX_SCAN_CHARS].lower())):
+            found[pattern] = self.severity[pattern]
+        if not found:
+            return None
+        clean = 1.0
+        for severity in found.values():
+            clean *= 1.0 - SEVERITY_WEIGHT.get(severity, 0.85)
+        terms = sorted(found, key=found.get, reverse=True)
+        return LexiconHit(1.0 - clean, max(found.values()), tuple(t.strip() for t in terms))
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, MessageHandler, CommandHandler, CallbackQueryHandler, ChatMemberHandler, filters, ContextTypes
@@ -7,10 +8,17 @@ from telegram.constants import ParseMode
 from telegram.error import Conflict, NetworkError
 import re
 from bot_config import *
-from abuse import AbuseDetector
+from abuse import AbuseDetector, from_gpt
 from bio import BioLinkDetector
+from automaton import PhraseAutomaton
+from urls import HostSuffixIndex, extract_urls, join_url
+from pipeline import Pipeline, Stage, ModerationContext
+from resolver import RedirectResolver, DEFAULT_SHORTENERS
+from workqueue import WorkQueue
 from help import register_help_commands
 from storage import Storage
+from cache import TTLCache
+from modstats import ModerationStats, DELETE_TYPES, HOUR
 
 # Setup logging
 logging.basicConfig(
@@ -22,17 +30,36 @@ logger = logging.getLogger(__name__)
 class BioLinkBot:
     def __init__(self):
         self.abuse_detector = AbuseDetector()
+        self.abuse_queue = WorkQueue(self._remote_abuse_job, workers=ABUSE_WORKERS,
+                                     maxsize=ABUSE_QUEUE_SIZE, overflow=ABUSE_QUEUE_OVERFLOW)
         self.edited_messages = {}  # {chat_id: {message_id: timestamp}}
         self.special_users = set(SPECIAL_USERS)
         self.delete_tasks = {}
-        self.bio_detector = BioLinkDetector()
+        self.bio_detector = BioLinkDetector(instrument=RULE_STATS_ENABLED)
+        # Link verdicts by (chat_id, message_id), so /approve can count the override against the rule that fired
+        self.link_verdicts = TTLCache(4096, 86400)
         self.blocklist = set()
+        self.block_matcher = PhraseAutomaton()
+        self._block_generation = 0
         self.link_whitelist = set()
+        self.whitelist_index = HostSuffixIndex()
+        self.resolver = self._build_resolver()
         self.media_delete_delay = MEDIA_DELETE_DELAY
         self.sticker_delete_delay = STICKER_DELETE_DELAY
         self.storage = Storage()
-        self.chat_delays = {}  # {chat_id: {"media": int|None, "sticker": int|None}}
+        # {chat_id: {"media": int|None, "sticker": int|None, "sensitivity": str}}, loaded per chat on first use
+        self.chat_settings = {}
         self._load_persistent_state()
+        # Verdicts older than eight half-lives weigh under 0.4%.
+        self.abuse_detector.warm_trust(self.storage.events_since(
+            ("abuse_delete", "abuse_clean", "approve"), time.time() - 8 * TRUST_HALF_LIFE_DAYS * 86400))
+        self.mod_stats = ModerationStats(MOD_STATS_HOURS)
+        self._warm_mod_stats()
+        self._attach_verdict_store()
+        self._start_storage_workers()
+        self.block_matcher = PhraseAutomaton(self.blocklist)
+        self.rebuild_whitelist_index()
+        self.moderation = self._build_moderation_pipeline()
     
     async def send_log(self, context: ContextTypes.DEFAULT_TYPE, log_message: str, user_info: str = ""):
         """Send log to log channel"""
@@ -84,65 +111,70 @@ class BioLinkBot:
         user_id = message.from_user.id
         user = message.from_user
         self.storage.save_event("seen", {"chat_id": chat_id, "user_id": user_id})
+        await self.preload_chat_settings(chat_id)
         
         is_special = user_id in self.special_users or user_id == OWNER_ID
         
         text = message.text or message.caption or ""
         
-        # Blocklist detection first
-        if text and self.contains_blocked(text):
+        ctx = ModerationContext(message, text, chat_id, user_id)
+        stage, verdict = await self.moderation.run(ctx)
+        if stage == "blocklist":
+            blocked = verdict
             try:
                 await message.delete()
                 await self.send_log(context, f"🚫 Blocklist word deleted", 
-                                  f"User: {user.full_name} (@{user.username or 'no_username'})")
-                self.storage.save_event("blocklist_delete", {
+                                  f"User: {user.full_name} (@{user.username or 'no_username'})\nPhrase: {blocked}")
+                self.log_deletion("blocklist_delete", {
                     "chat_id": chat_id,
                     "user_id": user_id,
-                    "text": text
+                    "text": text,
+                    "phrase": blocked
                 })
                 return
             except:
                 pass
-        
-        if self.message_has_link(message) and not self.is_whitelisted(message):
+        elif stage == "link":
+            self.link_verdicts.set((chat_id, message.message_id), verdict)
             try:
                 await message.delete()
-                reason = self.bio_detector.get_link_reason(message) or "unknown"
+                reason = verdict.rule or "unknown"
                 await self.send_log(context, f"🗑️ Link message deleted", 
                                   f"User: {user.full_name} (@{user.username or 'no_username'})\nReason: {reason}")
-                self.storage.save_event("link_delete", {
+                self.log_deletion("link_delete", {
                     "chat_id": chat_id,
                     "user_id": user_id,
                     "text": text,
-                    "reason": reason
+                    "reason": reason,
+                    "rule_id": verdict.rule_id
                 })
                 return
             except Exception as e:
                 logger.error(f"Failed to delete link message: {e}")
                 await self.send_log(context, f"❌ Failed to delete link message: {e}", 
                                   f"User: {user.full_name} (@{user.username or 'no_username'})")
-        
-        # 2. Abuse detection
-        if ABUSE_DETECTION_ENABLED:
-            abuse_result = await self.abuse_detector.detect_abuse(text)
-            if abuse_result["is_abusive"] and abuse_result["confidence"] >= ABUSE_THRESHOLD:
-                try:
-                    await message.delete()
-                    await self.send_log(context, f"🚫 Abusive content deleted", 
-                                      f"User: {user.full_name} (@{user.username or 'no_username'})\n"
-                                      f"Reason: {abuse_result['reason']} (Confidence: {abuse_result['confidence']:.2f})")
-                    self.storage.save_event("abuse_delete", {
-                        "chat_id": chat_id,
-                        "user_id": user_id,
-                        "text": text,
-                        "reason": abuse_result['reason'],
-                        "confidence": abuse_result['confidence']
-                    })
-                    return
-                except Exception as e:
-                    logger.error(f"Failed to delete abusive message: {e}")
-                    await self.send_log(context, f"❌ Failed to delete abusive message: {e}", 
-                                      f"User: {user.full_name} (@{user.username or 'no_username'})")
+        elif stage == "abuse":
+            abuse_result = verdict
+            try:
+                await message.delete()
+                await self.send_log(context, f"🚫 Abusive content deleted", 
+                                  f"User: {user.full_name} (@{user.username or 'no_username'})\n"
+                                  f"Reason: {abuse_result['reason']} (Confidence: {abuse_result['confidence']:.2f})")
+                self.log_deletion("abuse_delete", {
+                    "chat_id": chat_id,
+                    "user_id": user_id,
+                    "text": text,
+                    "reason": abuse_result['reason'],
+                    "confidence": abuse_result['confidence']
+                })
+                return
+            except Exception as e:
+                logger.error(f"Failed to delete abusive message: {e}")
+                await self.send_log(context, f"❌ Failed to delete abusive message: {e}", 
+                                  f"User: {user.full_name} (@{user.username or 'no_username'})")
+        elif stage is None and text and ABUSE_DETECTION_ENABLED and ctx.data.get("abuse") is None:
+            # Local checks could not tell; GPT gets a look off the handler's path.
+            self.queue_remote_abuse(context, message, text)
         
         # Store message for edit monitoring
         # Auto delete media/sticker with configured delays
@@ -162,6 +194,98 @@ class BioLinkBot:
                 return
         self.edited_messages.setdefault(chat_id, {})[message.message_id] = datetime.now()
     
+    def log_deletion(self, event_type: str, payload: dict):
+        """Store a deletion event and count it in the /stats windows."""
+        self.storage.save_event(event_type, payload)
+        self.mod_stats.record(event_type, payload)
+
+    def _warm_mod_stats(self):
+        since = time.time() - self.mod_stats.hours * HOUR
+        try:
+            warmed = self.mod_stats.warm(self.storage.events_since(DELETE_TYPES, since))
+            if warmed:
+                logger.info(f"Loaded {warmed} recent deletions into /stats")
+        except Exception as e:
+            logger.error(f"Failed to load recent deletions: {e}")
+
+    def _build_moderation_pipeline(self) -> Pipeline:
+        # Declared costs are rough starting points; observed timings take over.
+        return Pipeline([
+            Stage("blocklist", self._stage_blocklist, cost_us=20),
+            Stage("link", self._stage_link, cost_us=40),
+            Stage("abuse", self._stage_abuse, cost_us=10, enabled=lambda: ABUSE_DETECTION_ENABLED),
+        ], reorder_every=PIPELINE_REORDER_EVERY, on_reorder=self.bio_detector.reorder_rules)
+
+    def _stage_blocklist(self, ctx):
+        return self.find_blocked(ctx.text)
+
+    async def _stage_link(self, ctx):
+        verdict = self.bio_detector.classify(ctx.message)
+        if not verdict.matched:
+            return None
+        links = extract_urls(ctx.message, verdict.text)
+        if self.resolver is not None:
+            links, target = await self.expand_short_links(links)
+            if target:
+                return verdict._replace(rule=f"redirect:{target}")
+        if self.links_whitelisted(links):
+            self.bio_detector.record_override(verdict)
+            return None
+        return verdict
+
+    def _stage_abuse(self, ctx):
+        result = self.abuse_detector.detect_local(ctx.text)
+        ctx.data["abuse"] = result
+        if result and result["is_abusive"] and result["confidence"] >= ABUSE_THRESHOLD:
+            return result
+        return None
+
+    def queue_remote_abuse(self, context, message, text: str, edited: bool = False) -> bool:
+        """Hand a message to the background GPT workers; False if it stays with the local verdict."""
+        if not self.abuse_detector.remote_available():
+            return False
+        user_id = message.from_user.id if message.from_user else None
+        trusted = user_id in self.special_users or user_id == OWNER_ID
+        if not self.abuse_detector.should_escalate(text, user_id, trusted, self.get_chat_sensitivity(message.chat.id)):
+            return False
+        return self.abuse_queue.submit((context, message, text, edited))
+
+    async def _remote_abuse_job(self, job):
+        context, message, text, edited = job
+        abuse_result = await self.abuse_detector.detect_remote(text)
+        chat_id = message.chat.id
+        user = message.from_user
+        if from_gpt(abuse_result):
+            self.abuse_detector.record_verdict(user.id, abuse_result["is_abusive"])
+        if not (abuse_result["is_abusive"] and abuse_result["confidence"] >= ABUSE_THRESHOLD):
+            if not abuse_result["is_abusive"] and from_gpt(abuse_result):
+                # GPT's clean verdicts are the local model's negative examples.
+                self.storage.save_event("abuse_clean", {
+                    "chat_id": chat_id,
+                    "user_id": user.id,
+                    "text": text,
+                    "confidence": abuse_result['confidence']
+                })
+            return
+        try:
+            await message.delete()
+            await self.cancel_deletion_task(chat_id, message.message_id)
+            await self.send_log(context, f"🚫 Abusive {'edited ' if edited else ''}content deleted", 
+                              f"User: {user.full_name} (@{user.username or 'no_username'})\n"
+                              f"Reason: {abuse_result['reason']} (Confidence: {abuse_result['confidence']:.2f})")
+            if not edited:
+                self.log_deletion("abuse_delete", {
+                    "chat_id": chat_id,
+                    "user_id": user.id,
+                    "text": text,
+                    "reason": abuse_result['reason'],
+                    "confidence": abuse_result['confidence'],
+                    # So warm_trust skips it, as from_gpt did here.
+                    "cached": bool(abuse_result.get("cached"))
+                })
+        except Exception as e:
+            logger.error(f"Failed to delete abusive message: {e}")
+
     async def cancel_deletion_task(self, chat_id: int, message_id: int):
         key = (chat_id, message_id)
         task = self.delete_tasks.get(key)
@@ -195,23 +319,27 @@ class BioLinkBot:
         user = message.from_user
         text = message.text or message.caption or ""
         self.storage.save_event("seen_edited", {"chat_id": chat_id, "user_id": user.id})
+        await self.preload_chat_settings(chat_id)
  
         await self.cancel_deletion_task(chat_id, message_id)
 
-        if text and self.contains_blocked(text):
+        blocked = self.find_blocked(text) if text else None
+        if blocked:
             try:
                 await message.delete()
                 await self.send_log(context, f"🚫 Blocklist word deleted (edited)", 
-                                  f"User: {user.full_name} (@{user.username or 'no_username'})")
+                                  f"User: {user.full_name} (@{user.username or 'no_username'})\nPhrase: {blocked}")
                 return
             except Exception as e:
                 logger.error(f"Failed to delete edited blocklist message: {e}")
                 pass
 
-        if self.message_has_link(message):
+        verdict = self.bio_detector.classify(message)
+        if verdict.matched:
+            self.link_verdicts.set((chat_id, message_id), verdict)
             try:
                 await message.delete()
-                reason = self.bio_detector.get_link_reason(message) or "unknown"
+                reason = verdict.rule or "unknown"
                 await self.send_log(context, f"🗑️ Edited message link deleted", 
                                   f"User: {user.full_name} (@{user.username or 'no_username'})\nReason: {reason}")
                 return
@@ -220,9 +348,11 @@ class BioLinkBot:
                 pass
 
         # 2. Abuse detection
-        if ABUSE_DETECTION_ENABLED:
-            abuse_result = await self.abuse_detector.detect_abuse(text)
-            if abuse_result["is_abusive"] and abuse_result["confidence"] >= ABUSE_THRESHOLD:
+        if ABUSE_DETECTION_ENABLED and text:
+            abuse_result = self.abuse_detector.detect_local(text)
+            if abuse_result is None:
+                self.queue_remote_abuse(context, message, text, edited=True)
+            elif abuse_result["is_abusive"] and abuse_result["confidence"] >= ABUSE_THRESHOLD:
                 try:
                     await message.delete()
                     await self.send_log(context, f"🚫 Abusive edited content deleted", 
@@ -250,37 +380,31 @@ class BioLinkBot:
     def _load_persistent_state(self):
         try:
             state = self.storage.load_state()
-            if isinstance(state.get("blocklist"), list):
-                self.blocklist = set(state.get("blocklist"))
-            if isinstance(state.get("special_users"), list):
-                self.special_users.update(state.get("special_users"))
-            if isinstance(state.get("link_whitelist"), list):
-                self.link_whitelist = set(state.get("link_whitelist"))
+            self.blocklist = self.storage.load_set("blocklist")
+            self.special_users.update(self.storage.load_set("special_users"))
+            self.link_whitelist = self.storage.load_set("link_whitelist")
             if isinstance(state.get("media_delete_delay"), int):
                 self.media_delete_delay = state.get("media_delete_delay")
             if isinstance(state.get("sticker_delete_delay"), int):
                 self.sticker_delete_delay = state.get("sticker_delete_delay")
-            chat_delays = state.get("chat_delays") or {}
-            if isinstance(chat_delays, dict):
-                self.chat_delays = chat_delays
         except Exception:
             pass
 
     def persist_blocklist(self):
         try:
-            self.storage.update_state({"blocklist": sorted(list(self.blocklist))})
+            self.storage.sync_set("blocklist", self.blocklist)
         except Exception:
             pass
 
     def persist_special_users(self):
         try:
-            self.storage.update_state({"special_users": sorted(list(self.special_users))})
+            self.storage.sync_set("special_users", self.special_users)
         except Exception:
             pass
     
     def persist_whitelist(self):
         try:
-            self.storage.update_state({"link_whitelist": sorted(list(self.link_whitelist))})
+            self.storage.sync_set("link_whitelist", self.link_whitelist)
         except Exception:
             pass
 
@@ -293,8 +417,25 @@ class BioLinkBot:
         except Exception:
             pass
     
+    def _chat_settings(self, chat_id: int) -> dict:
+        settings = self.chat_settings.get(chat_id)
+        if settings is None:
+            try:
+                settings = self.storage.load_chat_settings(chat_id)
+            except Exception:
+                settings = {}
+            self.chat_settings[chat_id] = settings
+        return settings
+
+    async def preload_chat_settings(self, chat_id: int):
+        """Load a chat's settings without blocking the event loop, so the getters below find them cached."""
+        if chat_id not in self.chat_settings:
+            settings = await self.storage.aload_chat_settings(chat_id)
+            # Keep whatever a concurrent load or a setter put there meanwhile.
+            self.chat_settings.setdefault(chat_id, settings)
+
     def get_chat_delay(self, chat_id: int, target: str) -> int | None:
-        per = self.chat_delays.get(str(chat_id)) or self.chat_delays.get(chat_id) or {}
+        per = self._chat_settings(chat_id)
         if target in per:
             val = per.get(target)
             if val is None:
@@ -305,40 +446,97 @@ class BioLinkBot:
         return default
     
     def set_chat_delay(self, chat_id: int, target: str, seconds: int | None):
-        entry = self.chat_delays.get(str(chat_id)) or self.chat_delays.get(chat_id) or {}
+        entry = self._chat_settings(chat_id)
         if seconds is None or seconds <= 0:
             entry[target] = None
         else:
             entry[target] = int(seconds)
-        # store using string key for consistency
-        self.chat_delays[str(chat_id)] = entry
         try:
-            self.storage.update_state({"chat_delays": self.chat_delays})
+            self.storage.set_chat_setting(chat_id, target, entry[target])
         except Exception:
             pass
     
-    def is_whitelisted(self, message) -> bool:
-        base = self.bio_detector.normalize(message.text or message.caption or "").lower()
-        terms = [w.lower() for w in self.link_whitelist if w and '.' in w]
-        if not terms:
+    def get_chat_sensitivity(self, chat_id: int) -> str:
+        return self._chat_settings(chat_id).get("sensitivity") or "normal"
+
+    def set_chat_sensitivity(self, chat_id: int, level: str):
+        self._chat_settings(chat_id)["sensitivity"] = level
+        try:
+            self.storage.set_chat_setting(chat_id, "sensitivity", level)
+        except Exception:
+            pass
+
+    def rebuild_whitelist_index(self):
+        self.whitelist_index = HostSuffixIndex(self.link_whitelist)
+
+    def is_whitelisted(self, message, normalized: str = None) -> bool:
+        """True when the message has links and every one of them is on an approved host."""
+        if not self.whitelist_index:
             return False
-        ents = []
-        if getattr(message, "entities", None):
-            ents += message.entities
-        if getattr(message, "caption_entities", None):
-            ents += message.caption_entities
-        for e in ents:
-            if e.type == "text_link" and getattr(e, "url", None):
-                url = e.url.lower()
-                for w in terms:
-                    if w in url:
-                        return True
-            elif e.type == "url":
-                seg = base[e.offset:e.offset + e.length].lower()
-                for w in terms:
-                    if w in seg:
-                        return True
-        return False
+        if normalized is None:
+            normalized = self.bio_detector.normalize(message.text or message.caption or "")
+        return self.links_whitelisted(extract_urls(message, normalized))
+
+    def links_whitelisted(self, links) -> bool:
+        index = self.whitelist_index
+        if not index or not links:
+            return False
+        return all(index.match(host, path) for host, path, _ in links)
+
+    def _build_resolver(self):
+        if not REDIRECT_RESOLVER_ENABLED:
+            return None
+        try:
+            return RedirectResolver(SHORTENER_HOSTS or DEFAULT_SHORTENERS, max_hops=REDIRECT_MAX_HOPS,
+                                    timeout=REDIRECT_TIMEOUT, concurrency=REDIRECT_CONCURRENCY,
+                                    ttl=REDIRECT_CACHE_TTL)
+        except Exception as e:
+            print(f"Warning: redirect resolver disabled: {e}")
+            return None
+
+    def _attach_verdict_store(self, warm: int = VERDICT_WARM_SIZE):
+        """Back the GPT verdict and redirect caches with storage so they survive restarts."""
+        store = self.storage if VERDICT_STORE_ENABLED and self.storage.enabled else None
+        try:
+            warmed = self.abuse_detector.attach_store(store, warm)
+            if self.resolver is not None:
+                warmed += self.resolver.attach_store(store, VERDICT_STORE_TTL, warm)
+            if warmed:
+                logger.info(f"Loaded {warmed} stored verdicts")
+        except Exception as e:
+            print(f"Warning: verdict store unavailable: {e}")
+
+    def _start_storage_workers(self):
+        # Retention first: its optional VACUUM conversion runs before anything writes.
+        if RETENTION_ENABLED:
+            self.storage.start_retention(EVENT_RETENTION_DAYS, EVENT_RETENTION_KEEP, RETENTION_BATCH,
+                                         RETENTION_INTERVAL, RETENTION_VACUUM_PAGES, RETENTION_CONVERT_VACUUM)
+        if EVENT_WRITER_ENABLED:
+            self.storage.start_writer(EVENT_FLUSH_MS, EVENT_BATCH_SIZE, EVENT_QUEUE_SIZE)
+
+    async def expand_short_links(self, links):
+        """
+        Replace shortener links with the host they redirect to, within the
+        REDIRECT_BUDGET_MS budget. Returns (links, target) where target is the
+        bio-link domain a short link led to, if any. Links that did not
+        resolve in time are kept as they are.
+        """
+        resolver = self.resolver
+        # The query stays on: some shorteners carry the link id there (?id=).
+        short = [join_url(*link) for link in links if resolver.is_shortener(link[0])]
+        if not short:
+            return links, None
+        final = await resolver.resolve_within(short, REDIRECT_BUDGET_MS / 1000)
+        expanded = []
+        target = None
+        for link in links:
+            if resolver.is_shortener(link[0]):
+                hit = final.get(join_url(*link))
+                if hit:
+                    link = (*hit, "")
+                    target = target or self.bio_detector.target_domain_of(link[0])
+            expanded.append(link)
+        return expanded, target
     async def is_owner_or_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         user_id = update.effective_user.id
         if user_id == OWNER_ID:
@@ -350,11 +548,21 @@ class BioLinkBot:
             return False
     
     def contains_blocked(self, text: str) -> bool:
-        base = (text or "").lower()
-        for w in self.blocklist:
-            if w and w.lower() in base:
-                return True
-        return False
+        return self.find_blocked(text) is not None
+
+    def find_blocked(self, text: str) -> str | None:
+        hit = self.block_matcher.search(text or "")
+        return hit[0] if hit else None
+
+    async def refresh_block_matcher(self):
+        """Rebuild the blocklist automaton off the event loop and swap it in."""
+        self._block_generation += 1
+        generation = self._block_generation
+        phrases = tuple(self.blocklist)
+        matcher = await asyncio.get_running_loop().run_in_executor(None, PhraseAutomaton, phrases)
+        # A newer rebuild may have started while this one ran; keep only the latest.
+        if generation == self._block_generation:
+            self.block_matcher = matcher
     
     async def delete_scheduled_message(self, context: ContextTypes.DEFAULT_TYPE):
         pass
@@ -373,15 +581,25 @@ class BioLinkBot:
     def is_sticker_message(self, message) -> bool:
         return bool(getattr(message, "sticker", None))
     
-    def set_mongo_uri(self, uri: str) -> bool:
+    async def set_mongo_uri(self, uri: str) -> bool:
         try:
             import os
             os.environ["MONGO_URI"] = uri
             from storage import Storage
-            self.storage = Storage(uri)
-            if self.storage.enabled:
-                return True
-            return False
+            # Connecting, loading the seen ids and closing the old store all
+            # wait on the network or disk; keep that off the event loop.
+            storage = await asyncio.to_thread(Storage, uri)
+            if not storage.mongo_enabled:
+                # Keep the current store rather than quietly switching to a fresh SQLite one.
+                await asyncio.to_thread(storage.close)
+                return False
+            old, self.storage = self.storage, storage
+            self.chat_settings = {}
+            # No preload: stored verdicts are awaited one by one on cache misses.
+            self._attach_verdict_store(warm=0)
+            self._start_storage_workers()
+            await asyncio.to_thread(old.close)
+            return True
         except Exception:
             return False
     
@@ -400,7 +618,7 @@ class BioLinkBot:
         # For demo, we'll set it directly
         import os
         os.environ["GPT_API_KEY"] = new_key
-        self.abuse_detector.is_ready = True
+        self.abuse_detector.set_api_key(new_key)
         
         await update.message.reply_text("✅ GPT API key updated!")
         await self.send_log(context, "🔑 GPT API key updated by owner")
@@ -425,14 +643,32 @@ class BioLinkBot:
     
     async def status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Bot status command"""
-        groups = self.storage.count_groups() if self.storage.enabled else 0
+        groups = await self.storage.acount_groups() if self.storage.enabled else 0
         users = self.storage.count_distinct_users() if self.storage.enabled else 0
+        cache = self.abuse_detector.cache_stats()
+        guard = self.abuse_detector.guard.snapshot()
+        queue = self.abuse_queue.snapshot()
+        writer = self.storage.writer.snapshot() if self.storage.writer is not None else None
+        writer_line = (f"{writer['flushed']} written in {writer['batches']} batches, {writer['depth']} queued, "
+                       f"{writer['dropped']} dropped, {writer['failed']} failed") if writer else "off"
+        retention = self.storage.retention.snapshot() if self.storage.retention is not None else None
+        storage_line = f"✅ {self.storage.backend.name}, {self.storage.errors} errors" if self.storage.enabled else "❌"
+        retention_line = (f"{retention['rolled_up']} rolled up, {retention['pruned']} pruned, "
+                          f"{retention['vacuumed_pages']} pages freed") if retention else "off"
         status_text = f"""
 🤖 **Bot Status**
 • Bot: ✅ Online
-• Storage: {'✅' if self.storage.enabled else '❌'}
+• Storage: {storage_line}
 • Groups: {groups}
 • Users: {users}
+• Abuse cache: {cache['hit_rate']:.0%} hits, {cache['saved_rate']:.0%} without a GPT call ({cache['gpt_calls']} calls, {cache['store_hits']} from storage)
+• Lexicon: {len(self.abuse_detector.lexicon)} terms, {cache['lexicon_hits']} deletions
+• Local model: {'✅' if self.abuse_detector.model is not None else '❌'} {cache['model_abusive'] + cache['model_clean']} settled, {cache['escalated']} escalated
+• Gate: {sum(cache['gated'].values())} GPT calls avoided ({', '.join(f'{k} {v}' for k, v in sorted(cache['gated'].items())) or 'none yet'}), {cache['gate_passed']} passed
+• GPT guard: {guard['state'].replace('_', ' ')}, {guard['in_flight']} in flight, {guard['timeouts']} timeouts, {cache['degraded']} local-only verdicts
+• Abuse queue: {queue['depth']} waiting (max {queue['max_depth']}), {queue['dropped']} dropped, wait p50 {queue['wait_p50_ms']:.0f} ms / p99 {queue['wait_p99_ms']:.0f} ms
+• Event writer: {writer_line}
+• Retention: {retention_line}
         """
         await update.message.reply_text(status_text, parse_mode=ParseMode.MARKDOWN)
         await self.send_log(context, "📊 Status command used", f"User: {update.effective_user.full_name}")
@@ -509,7 +745,7 @@ Bot auto-removes links and abusive content. Edited messages are removed after 10
     
     def run(self):
         """Start the bot"""
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = Application.builder().token(BOT_TOKEN).post_init(self._startup).post_shutdown(self._shutdown).build()
         
         # Handlers
         application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & ((filters.TEXT & ~filters.COMMAND) | (filters.CAPTION & ~filters.COMMAND)), self.handle_message))
@@ -537,6 +773,15 @@ Bot auto-removes links and abusive content. Edited messages are removed after 10
         print("🚀 Bot started!")
         application.run_polling()
 
+    async def _startup(self, application):
+        self.abuse_queue.start()
+
+    async def _shutdown(self, application):
+        await self.abuse_queue.stop()
+        if self.resolver is not None:
+            await self.resolver.close()
+        self.storage.close()
+
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Update {update} caused error {context.error}")
         
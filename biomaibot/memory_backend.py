@@ -0,0 +1,115 @@
+import threading
+
+from backend import SET_NAMES, StorageBackend
+
+class MemoryBackend(StorageBackend):
+    """
+    Everything in dicts and sets for the life of the process. Nothing is
+    kept across restarts; it exists for tests, benchmarks and running the
+    bot without a writable disk. One lock covers all of it, since the event
+    writer thread and the event loop both write.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = []
+        self.users = set()
+        self.chats = set()
+        self.state = {}
+        self.sets = {name: set() for name in SET_NAMES}
+        self.chat_settings = {}
+        self.groups = {}
+        self.verdicts = {}
+
+    def insert_events(self, rows):
+        with self._lock:
+            for event_type, payload, ts, new_user, new_chat in rows:
+                self.events.append((event_type, dict(payload), ts))
+                if new_user is not None:
+                    self.users.add(new_user)
+                if new_chat is not None:
+                    self.chats.add(new_chat)
+
+    def add_event(self, row):
+        self.insert_events([row])
+
+    def iter_events(self, types=None) -> list:
+        with self._lock:
+            events = list(self.events)
+        if types:
+            types = set(types)
+            events = [e for e in events if e[0] in types]
+        return [(event_type, dict(payload)) for event_type, payload, _ in events]
+
+    def events_since(self, types, since: float) -> list:
+        types = set(types)
+        with self._lock:
+            events = [e for e in self.events if e[0] in types and e[2] >= since]
+        return [(event_type, dict(payload), ts) for event_type, payload, ts in events]
+
+    def count_events(self) -> int:
+        return len(self.events)
+
+    def load_seen(self):
+        with self._lock:
+            return set(self.users), set(self.chats)
+
+    def load_state(self) -> dict:
+        with self._lock:
+            return dict(self.state)
+
+    def update_state(self, fields: dict):
+        with self._lock:
+            self.state.update(fields)
+
+    def load_set(self, name: str) -> set:
+        with self._lock:
+            return set(self.sets[name])
+
+    def sync_set(self, name: str, added, removed):
+        with self._lock:
+            members = self.sets[name]
+            members.update(added)
+            members.difference_update(removed)
+
+    def load_chat_settings(self, chat_id: int) -> dict:
+        with self._lock:
+            return dict(self.chat_settings.get(chat_id, {}))
+
+    def set_chat_setting(self, chat_id: int, key: str, value):
+        with self._lock:
+            self.chat_settings.setdefault(chat_id, {})[key] = value
+
+    def add_group(self, chat_id: int, title: str = None):
+        with self._lock:
+            if title or chat_id not in self.groups:
+                self.groups[chat_id] = title or None
+
+    def count_groups(self) -> int:
+        return len(self.groups)
+
+    def save_verdict(self, kind: str, key: bytes, verdict, source, confidence, expires: float):
+        with self._lock:
+            self.verdicts[(kind, bytes(key))] = (verdict, expires)
+
+    def load_verdict(self, kind: str, key: bytes, now: float):
+        found = self.verdicts.get((kind, bytes(key)))
+        return found if found and found[1] > now else None
+
+    def recent_verdicts(self, kind: str, limit: int, now: float) -> list:
+        with self._lock:
+            live = [(k, v, e) for (c, k), (v, e) in self.verdicts.items() if c == kind and e > now]
+        live.sort(key=lambda item: item[2], reverse=True)
+        return live[:limit]
+
+    def prune_verdicts(self, now: float) -> int:
+        with self._lock:
+            expired = [k for k, (_, e) in self.verdicts.items() if e <= now]
+            for k in expired:
+                del self.verdicts[k]
+        return len(expired)
+
+    def snapshot(self) -> dict:
+        return {"events": len(self.events), "verdicts": len(self.verdicts)}
@@ -0,0 +1,140 @@
+import html
+import time
+from collections import Counter
+
+HOUR = 3600
+
+# Events that mean the bot deleted a message.
+DELETE_TYPES = ("blocklist_delete", "link_delete", "abuse_delete")
+
+# Abuse reasons the local checks give; anything else is GPT's own wording.
+LOCAL_ABUSE_REASONS = ("local_match", "local_fallback", "lexicon", "model")
+
+def reason_key(event_type: str, payload: dict) -> str:
+    """A short, low-cardinality label for why a message was deleted."""
+    if event_type == "blocklist_delete":
+        return "blocklist"
+    reason = str(payload.get("reason") or "")
+    if event_type == "link_delete":
+        # Rule ids, and "redirect:<host>" for expanded short links.
+        return "link:" + (reason.split(":", 1)[0] or "unknown")
+    head = reason.split(":", 1)[0]
+    return "abuse:" + (head if head in LOCAL_ABUSE_REASONS else "gpt")
+
+# Zero, then eight heights.
+BARS = "·▁▂▃▄▅▆▇█"
+
+def parse_window(text: str):
+    """Hours in a window like "24h", "7d" or "week"; None if it is not one."""
+    text = (text or "").strip().lower()
+    if text == "week":
+        return 168
+    if text[:-1].isdigit() and text[-1:] in ("h", "d"):
+        return int(text[:-1]) * (24 if text.endswith("d") else 1) or None
+    return None
+
+def _bar(count: int, peak: int) -> str:
+    return BARS[0] if not count else BARS[max(1, round(count / peak * (len(BARS) - 1)))]
+
+def format_report(report: dict, title: str) -> str:
+    """HTML /stats reply: totals, reasons, top offenders and a row of hourly bars per UTC day."""
+    hours = report["hours"]
+    window = f"{hours // 24}d" if hours % 24 == 0 and hours > 24 else f"{hours}h"
+    lines = [f"📈 <b>Moderation in {html.escape(title)}, last {window}</b>"]
+    if not report["deletions"]:
+        lines.append("No deletions.")
+        return "\n".join(lines)
+    lines.append(f"Deletions: {report['deletions']} from {report['offender_count']} users")
+    lines.append("By reason: " + ", ".join(f"{reason} {n}" for reason, n in report["reasons"]))
+    lines.append("Top offenders:")
+    lines += [f'{i}. <a href="tg://user?id={user_id}">{user_id}</a>: {n}' for i, (user_id, n) in enumerate(report["offenders"], 1)]
+    hourly = report["hourly"]
+    peak = max(hourly)
+    peak_hour = report["first_hour"] + hourly.index(peak)
+    lines.append(f"Hourly, UTC (peak {peak} at {time.strftime('%m-%d %H:00', time.gmtime(peak_hour * HOUR))}):")
+    rows, days = [], []
+    for i, count in enumerate(hourly):
+        hour = report["first_hour"] + i
+        day = time.strftime("%m-%d", time.gmtime(hour * HOUR))
+        if not days or days[-1][0] != day:
+            # Pad the first day so every row starts at 00:00.
+            days.append((day, [None] * (hour % 24)))
+        days[-1][1].append(count)
+    for day, counts in days:
+        bars = "".join(" " if c is None else _bar(c, peak) for c in counts)
+        rows.append(f"{day} {bars.ljust(24)} {sum(c or 0 for c in counts)}")
+    lines.append("<pre>" + "\n".join(rows) + "</pre>")
+    return "\n".join(lines)
+
+class ModerationStats:
+    """
+    Per-chat deletion counts in hourly buckets over the last `hours` hours,
+    kept in memory. Each bucket counts deletions by reason and by user, so
+    recording is a couple of dict increments and a report only sums the
+    buckets in its window, however long the stored history is. Buckets
+    that fall out of the window are dropped the next time the chat gets a
+    new one.
+    """
+
+    def __init__(self, hours: int = 168, clock=time.time):
+        self.hours = max(1, hours)
+        self._clock = clock
+        # {chat_id: {hour: (Counter reasons, Counter users)}}
+        self._chats = {}
+        self.recorded = 0
+
+    def record(self, event_type: str, payload: dict, ts: float = None):
+        chat_id = payload.get("chat_id")
+        if event_type not in DELETE_TYPES or chat_id is None:
+            return
+        now_hour = int(self._clock() // HOUR)
+        hour = int((self._clock() if ts is None else ts) // HOUR)
+        if hour <= now_hour - self.hours:
+            return
+        buckets = self._chats.setdefault(chat_id, {})
+        bucket = buckets.get(hour)
+        if bucket is None:
+            for old in [h for h in buckets if h <= now_hour - self.hours]:
+                del buckets[old]
+            bucket = buckets[hour] = (Counter(), Counter())
+        bucket[0][reason_key(event_type, payload)] += 1
+        user_id = payload.get("user_id")
+        if user_id is not None:
+            bucket[1][user_id] += 1
+        self.recorded += 1
+
+    def warm(self, events) -> int:
+        """Record stored (type, payload, ts) events; returns how many were in the window."""
+        before = self.recorded
+        for event_type, payload, ts in events:
+            self.record(event_type, payload, ts)
+        return self.recorded - before
+
+    def report(self, chat_id: int, hours: int = 24, top: int = 5) -> dict:
+        """Totals, top reasons and offenders, and per-hour counts (oldest first) for the last `hours` hours."""
+        hours = max(1, min(hours, self.hours))
+        now_hour = int(self._clock() // HOUR)
+        first = now_hour - hours + 1
+        reasons, users = Counter(), Counter()
+        hourly = [0] * hours
+        for hour, (by_reason, by_user) in self._chats.get(chat_id, {}).items():
+            if first <= hour <= now_hour:
+                reasons.update(by_reason)
+                users.update(by_user)
+                hourly[hour - first] = sum(by_reason.values())
+        return {
+            "hours": hours,
+            "first_hour": first,
+            "deletions": sum(hourly),
+            "reasons": reasons.most_common(),
+            "offenders": users.most_common(top),
+            "offender_count": len(users),
+            "hourly": hourly,
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            "chats": len(self._chats),
+            "buckets": sum(len(b) for b in self._chats.values()),
+            "recorded": self.recorded,
+        }
@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+from backend import StorageBackend
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import DeleteOne, InsertOne, UpdateOne
+except ImportError:
+    AsyncIOMotorClient = None
+
+logger = logging.getLogger(__name__)
+
+# Member collections of the stored sets, by set name.
+SET_COLLECTIONS = {
+    "blocklist": "blocklist",
+    "link_whitelist": "link_whitelist",
+    "special_users": "special_users",
+}
+
+# settings document marking that users/chats were filled from event history.
+SEEN_BACKFILL_KEY = "_seen_backfilled"
+
+def _utc(ts: float) -> datetime:
+    return datetime.utcfromtimestamp(ts)
+
+class MongoBackend(StorageBackend):
+    """
+    MongoDB storage through motor. The client and its connection pool live
+    on an event loop of their own in a background thread, so the bot's loop
+    never waits on the network for a write: settings and set changes are
+    queued and sent every `flush_ms` as one ordered bulk_write per
+    collection, and events arrive from the event writer as unordered
+    insert_many batches. Reads first wait for the writes queued before them,
+    then for the answer, for at most `timeout` seconds. Point reads of a
+    verdict or a chat's settings skip the flush, and their `aload_*`
+    versions await the IO loop instead of blocking the caller's.
+    """
+
+    name = "mongo"
+
+    def __init__(self, uri: str, pool_size: int = 20, timeout: float = 5.0, flush_ms: float = 50.0):
+        if AsyncIOMotorClient is None:
+            raise RuntimeError("motor is not installed")
+        self.timeout = timeout
+        self.flush_interval = max(0.0, flush_ms) / 1000.0
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="mongo-io", daemon=True)
+        self._thread.start()
+        self._pending = {}
+        self._flush_timer = None
+        self._flush_lock = None
+        self.bulk_writes = 0
+        self.ops_written = 0
+        self.failed_ops = 0
+        self.events_written = 0
+        try:
+            self.client, self.db = self.call(self._connect(uri, pool_size))
+        except Exception:
+            self._stop_loop()
+            raise
+
+    def call(self, coro):
+        """Run `coro` on the IO loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(self.timeout)
+
+    async def _connect(self, uri, pool_size):
+        self._flush_lock = asyncio.Lock()
+        client = AsyncIOMotorClient(uri, maxPoolSize=pool_size, serverSelectionTimeoutMS=int(self.timeout * 1000))
+        try:
+            db = client.get_default_database()
+        except Exception:
+            db = client.get_database("biomaibot")
+        try:
+            await client.admin.command("ping")
+            await db.events.create_index([("type", 1), ("ts", 1)])
+            await db.events.create_index([("data.chat_id", 1), ("ts", 1)])
+            await db.events.create_index("data.user_id")
+            # Expired verdicts are removed by the server.
+            await db.verdicts.create_index("expires", expireAfterSeconds=0)
+            await db.verdicts.create_index([("kind", 1), ("expires", -1)])
+            await self._split_global(db)
+        except Exception:
+            client.close()
+            raise
+        return client, db
+
+    async def _split_global(self, db):
+        # Older versions kept every setting in one {"_id": "global"} document;
+        # spread it over the per-record collections once.
+        doc = await db.settings.find_one({"_id": "global"})
+        if not doc:
+            return
+        doc.pop("_id", None)
+        titles = doc.pop("group_titles", None) or {}
+        groups = [UpdateOne({"_id": int(c)}, {"$set": {"title": titles.get(str(c))}}, upsert=True)
+                  for c in doc.pop("groups", None) or []]
+        if groups:
+            await db.groups.bulk_write(groups)
+        per_chat = {}
+        for chat_id, delays in (doc.pop("chat_delays", None) or {}).items():
+            per_chat.setdefault(int(chat_id), {}).update(delays or {})
+        for chat_id, level in (doc.pop("chat_sensitivity", None) or {}).items():
+            per_chat.setdefault(int(chat_id), {})["sensitivity"] = level
+        if per_chat:
+            await db.chat_settings.bulk_write([UpdateOne({"_id": c}, {"$set": v}, upsert=True) for c, v in per_chat.items()])
+        for name, coll in SET_COLLECTIONS.items():
+            members = doc.pop(name, None) or []
+            if members:
+                await db[coll].bulk_write([UpdateOne({"_id": m}, {"$setOnInsert": {"added": datetime.utcnow()}}, upsert=True)
+                                           for m in members])
+        rest = [UpdateOne({"_id": k}, {"$set": {"value": v}}, upsert=True) for k, v in doc.items()]
+        if rest:
+            await db.settings.bulk_write(rest)
+        await db.settings.delete_one({"_id": "global"})
+
+    def queue(self, collection: str, op):
+        """Queue one pymongo write op for the next bulk_write; safe from any thread."""
+        self.loop.call_soon_threadsafe(self._enqueue, collection, op)
+
+    def _enqueue(self, collection, op):
+        self._pending.setdefault(collection, []).append(op)
+        if self._flush_timer is None:
+            self._flush_timer = self.loop.call_later(self.flush_interval, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_timer = None
+        self.loop.create_task(self._flush())
+
+    async def _flush(self):
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            for collection, ops in pending.items():
+                try:
+                    await self.db[collection].bulk_write(ops, ordered=True)
+                    self.bulk_writes += 1
+                    self.ops_written += len(ops)
+                except Exception as e:
+                    self.failed_ops += len(ops)
+                    logger.error(f"MongoDB bulk write to {collection} failed: {e}")
+
+    async def _read(self, coro_fn, flush: bool = True):
+        if flush:
+            await self._flush()
+        return await coro_fn()
+
+    def read(self, coro_fn, flush: bool = True):
+        """Flush queued writes (unless `flush` is False), then run `coro_fn()` on the IO loop and return its result."""
+        return self.call(self._read(coro_fn, flush))
+
+    async def aread(self, coro_fn, flush: bool = False):
+        """Like read(coro_fn, flush), but awaited from another event loop instead of blocking it."""
+        future = asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._read(coro_fn, flush), self.loop))
+        return await asyncio.wait_for(future, self.timeout)
+
+    def flush(self):
+        self.call(self._flush())
+
+    def close(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
+        try:
+            self.client.close()
+        except Exception:
+            pass
+        self._stop_loop()
+
+    def _stop_loop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(self.timeout)
+        self.loop.close()
+
+    def _seen_ops(self, rows):
+        for collection, ids in (("users", [(r[3], r[2]) for r in rows if r[3] is not None]),
+                                ("chats", [(r[4], r[2]) for r in rows if r[4] is not None])):
+            for _id, ts in ids:
+                self.queue(collection, UpdateOne({"_id": _id}, {"$setOnInsert": {"first_seen": _utc(ts)}}, upsert=True))
+
+    def insert_events(self, rows):
+        """Write (type, payload, ts, new user, new chat) rows in one unordered batch; blocks the calling thread."""
+        docs = [{"type": event_type, "data": payload, "ts": _utc(ts)} for event_type, payload, ts, _, _ in rows]
+
+        async def insert():
+            await self.db.events.insert_many(docs, ordered=False)
+
+        self.call(insert())
+        self.events_written += len(docs)
+        self._seen_ops(rows)
+
+    def add_event(self, row):
+        """Queue one event row without waiting."""
+        event_type, payload, ts, _, _ = row
+        self.queue("events", InsertOne({"type": event_type, "data": payload, "ts": _utc(ts)}))
+        self._seen_ops([row])
+
+    def iter_events(self, types=None):
+        query = {"type": {"$in": list(types)}} if types else {}
+
+        async def fetch():
+            return await self.db.events.find(query, {"type": 1, "data": 1}).sort("ts", 1).to_list(None)
+
+        return [(doc.get("type"), doc.get("data") or {}) for doc in self.read(fetch)]
+
+    def events_since(self, types, since: float) -> list:
+        query = {"type": {"$in": list(types)}, "ts": {"$gte": _utc(since)}}
+
+        async def fetch():
+            return await self.db.events.find(query, {"type": 1, "data": 1, "ts": 1}).sort("ts", 1).to_list(None)
+
+        return [(doc.get("type"), doc.get("data") or {}, (doc["ts"] - datetime(1970, 1, 1)).total_seconds())
+                for doc in self.read(fetch)]
+
+    def count_events(self) -> int:
+        return self.read(lambda: self.db.events.estimated_document_count())
+
+    def load_seen(self):
+        """
+        (user ids, chat ids) seen so far, filling the collections from history
+        until a fill has finished once; the upserts are safe to repeat after
+        one that was cut short.
+        """
+        async def fetch():
+            if not await self.db.settings.find_one({"_id": SEEN_BACKFILL_KEY}):
+                for field, collection in (("data.user_id", "users"), ("data.chat_id", "chats")):
+                    ids = [i for i in await self.db.events.distinct(field) if i is not None]
+                    if ids:
+                        await self.db[collection].bulk_write(
+                            [UpdateOne({"_id": i}, {"$setOnInsert": {"first_seen": datetime.utcnow()}}, upsert=True) for i in ids],
+                            ordered=False
+                        )
+                await self.db.settings.update_one({"_id": SEEN_BACKFILL_KEY}, {"$set": {"at": datetime.utcnow()}}, upsert=True)
+            return set(await self.db.users.distinct("_id")), set(await self.db.chats.distinct("_id"))
+
+        return self.read(fetch)
+
+    def load_state(self) -> dict:
+        async def fetch():
+            return await self.db.settings.find({"_id": {"$ne": SEEN_BACKFILL_KEY}}).to_list(None)
+
+        return {doc["_id"]: doc.get("value") for doc in self.read(fetch)}
+
+    def update_state(self, fields: dict):
+        for key, value in fields.items():
+            self.queue("settings", UpdateOne({"_id": key}, {"$set": {"value": value}}, upsert=True))
+
+    def load_set(self, name: str) -> set:
+        return set(self.read(lambda: self.db[SET_COLLECTIONS[name]].distinct("_id")))
+
+    def sync_set(self, name: str, added, removed):
+        collection = SET_COLLECTIONS[name]
+        for member in added:
+            self.queue(collection, UpdateOne({"_id": member}, {"$setOnInsert": {"added": datetime.utcnow()}}, upsert=True))
+        for member in removed:
+            self.queue(collection, DeleteOne({"_id": member}))
+
+    def load_chat_settings(self, chat_id: int) -> dict:
+        return self._chat_settings_doc(self.read(lambda: self.db.chat_settings.find_one({"_id": chat_id}), flush=False))
+
+    async def aload_chat_settings(self, chat_id: int) -> dict:
+        return self._chat_settings_doc(await self.aread(lambda: self.db.chat_settings.find_one({"_id": chat_id})))
+
+    @staticmethod
+    def _chat_settings_doc(doc) -> dict:
+        doc = doc or {}
+        doc.pop("_id", None)
+        return doc
+
+    def set_chat_setting(self, chat_id: int, key: str, value):
+        self.queue("chat_settings", UpdateOne({"_id": chat_id}, {"$set": {key: value}}, upsert=True))
+
+    def add_group(self, chat_id: int, title: str = None):
+        update = {"$set": {"title": title}} if title else {"$setOnInsert": {"title": None}}
+        self.queue("groups", UpdateOne({"_id": chat_id}, update, upsert=True))
+
+    def count_groups(self) -> int:
+        return self.read(lambda: self.db.groups.count_documents({}))
+
+    async def acount_groups(self) -> int:
+        return await self.aread(lambda: self.db.groups.count_documents({}), flush=True)
+
+    def save_verdict(self, kind: str, key: bytes, verdict, source, confidence, expires: float):
+        self.queue("verdicts", UpdateOne(
+            {"_id": f"{kind}:{key.hex()}"},
+            {"$set": {"kind": kind, "verdict": verdict, "source": source, "confidence": confidence, "expires": _utc(expires)}},
+            upsert=True
+        ))
+
+    def _verdict_query(self, kind: str, key: bytes, now: float):
+        return self.db.verdicts.find_one({"_id": f"{kind}:{key.hex()}", "expires": {"$gt": _utc(now)}})
+
+    @staticmethod
+    def _verdict_doc(doc):
+        if not doc:
+            return None
+        return doc["verdict"], (doc["expires"] - datetime(1970, 1, 1)).total_seconds()
+
+    def load_verdict(self, kind: str, key: bytes, now: float):
+        return self._verdict_doc(self.read(lambda: self._verdict_query(kind, key, now), flush=False))
+
+    async def aload_verdict(self, kind: str, key: bytes, now: float):
+        return self._verdict_doc(await self.aread(lambda: self._verdict_query(kind, key, now)))
+
+    def recent_verdicts(self, kind: str, limit: int, now: float):
+        async def fetch():
+            cursor = self.db.verdicts.find({"kind": kind, "expires": {"$gt": _utc(now)}}).sort("expires", -1).limit(limit)
+            return await cursor.to_list(None)
+
+        return [(bytes.fromhex(d["_id"].split(":", 1)[1]), d["verdict"], (d["expires"] - datetime(1970, 1, 1)).total_seconds())
+                for d in self.read(fetch)]
+
+    def prune_verdicts(self, now: float) -> int:
+        async def prune():
+            return (await self.db.verdicts.delete_many({"expires": {"$lte": _utc(now)}})).deleted_count
+
+        return self.read(prune)
+
+    def snapshot(self) -> dict:
+        return {
+            "bulk_writes": self.bulk_writes,
+            "ops_written": self.ops_written,
+            "failed_ops": self.failed_ops,
+            "events_written": self.events_written,
+            "queued": sum(len(ops) for ops in self._pending.values()),
+        }
@@ -0,0 +1,140 @@
+import re
+import unicodedata
+
+# Zero-width and bidi control characters spammers use to split words.
+ZERO_WIDTH = (
+    [chr(c) for c in range(0x200B, 0x2010)]
+    + [chr(c) for c in range(0x202A, 0x202F)]
+    + [chr(c) for c in range(0x2060, 0x2065)]
+    + ['\u00ad', '\u180e', '\ufeff']
+)
+
+# Lookalikes that NFKD leaves alone. Values keep the case of the glyph they imitate.
+HOMOGLYPHS = {
+    # Latin letters without a decomposition
+    'ø': 'o', 'Ø': 'O', 'œ': 'oe', 'Œ': 'OE', 'ß': 'ss', 'ẞ': 'SS', 'ı': 'i', 'ł': 'l', 'Ł': 'L',
+    'ɩ': 'i', 'ɡ': 'g', 'ɑ': 'a', 'ʟ': 'l', 'ǀ': 'l', '¡': 'i',
+    # Cyrillic
+    'а': 'a', 'в': 'b', 'с': 'c', 'ԁ': 'd', 'е': 'e', 'ё': 'e', 'һ': 'h', 'і': 'i', 'ї': 'i', 'ј': 'j',
+    'к': 'k', 'ӏ': 'l', 'м': 'm', 'п': 'n', 'о': 'o', 'р': 'p', 'ԛ': 'q', 'г': 'r', 'ѕ': 's', 'т': 't',
+    'ѵ': 'v', 'ԝ': 'w', 'х': 'x', 'у': 'y', 'ү': 'y',
+    'А': 'A', 'В': 'B', 'С': 'C', 'Ԁ': 'D', 'Е': 'E', 'Ё': 'E', 'Һ': 'H', 'Н': 'H', 'І': 'I', 'Ї': 'I',
+    'Ј': 'J', 'К': 'K', 'Ӏ': 'I', 'М': 'M', 'О': 'O', 'Р': 'P', 'Ԛ': 'Q', 'Ѕ': 'S', 'Т': 'T', 'Ѵ': 'V',
+    'Ԝ': 'W', 'Х': 'X', 'У': 'Y', 'Ү': 'Y',
+    # Greek
+    'α': 'a', 'β': 'b', 'ϲ': 'c', 'ε': 'e', 'η': 'n', 'ι': 'i', 'ϳ': 'j', 'κ': 'k', 'ν': 'v', 'ο': 'o',
+    'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x', 'γ': 'y', 'ω': 'w',
+    'Α': 'A', 'Β': 'B', 'Ϲ': 'C', 'Ε': 'E', 'Η': 'H', 'Ι': 'I', 'Ϳ': 'J', 'Κ': 'K', 'Μ': 'M', 'Ν': 'N',
+    'Ο': 'O', 'Ρ': 'P', 'Τ': 'T', 'Υ': 'Y', 'Χ': 'X', 'Ζ': 'Z',
+    # Armenian
+    'օ': 'o', 'ս': 'u', 'հ': 'h', 'ո': 'n', 'Օ': 'O',
+    # Small capitals
+    'ᴀ': 'a', 'ʙ': 'b', 'ᴄ': 'c', 'ᴅ': 'd', 'ᴇ': 'e', 'ꜰ': 'f', 'ɢ': 'g', 'ʜ': 'h', 'ɪ': 'i', 'ᴊ': 'j',
+    'ᴋ': 'k', 'ᴍ': 'm', 'ɴ': 'n', 'ᴏ': 'o', 'ᴘ': 'p', 'ǫ': 'q', 'ʀ': 'r', 'ꜱ': 's', 'ᴛ': 't', 'ᴜ': 'u',
+    'ᴠ': 'v', 'ᴡ': 'w', 'ʏ': 'y', 'ᴢ': 'z',
+}
+# Regional indicator letters (🇦 .. 🇿) render as boxed capitals outside flag pairs.
+HOMOGLYPHS.update({chr(0x1F1E6 + i): chr(ord('a') + i) for i in range(26)})
+
+# Blocks that are folded eagerly at import; everything else is folded on first sight.
+_EAGER_RANGES = (
+    (0x00A0, 0x0250),    # Latin-1 supplement, Latin extended-A/B
+    (0x0370, 0x0530),    # Greek, Cyrillic
+    (0x1D00, 0x1D80),    # phonetic extensions (small capitals)
+    (0x2100, 0x2150),    # letterlike symbols
+    (0x2460, 0x2500),    # enclosed alphanumerics
+    (0xFF00, 0xFF70),    # fullwidth forms
+    (0x1D400, 0x1D800),  # mathematical alphanumeric symbols
+    (0x1F130, 0x1F1A0),  # squared / negative squared letters
+)
+
+_DOTS = '•·∙●﹒．｡。'
+_SPACES = ''.join(c for c in map(chr, range(0x3001)) if c.isspace())
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+# Word view for the abuse lexicon: Latin letters and the Devanagari block survive.
+_WORD_SEPARATORS = re.compile(r'[^a-z\u0900-\u097f]+')
+_SYMBOL_LEET = re.compile(r'[@$](?=[a-z])|(?<=[a-z])!(?=[a-z])')
+_LONG_RUNS = re.compile(r'(.)\1{2,}')
+
+def _fold_char(ch: str) -> str:
+    if ch in HOMOGLYPHS:
+        return HOMOGLYPHS[ch]
+    decomposed = unicodedata.normalize('NFKD', ch)
+    return ''.join(HOMOGLYPHS.get(c, c) for c in decomposed if not unicodedata.combining(c))
+
+# Code points folded on first sight that the table remembers; past that,
+# others are folded on every sight, so crafted text cannot grow it unbounded.
+_LAZY_LIMIT = 4096
+
+class _FoldTable(dict):
+    """str.translate mapping that folds unseen code points on demand, remembering up to `limit` entries."""
+
+    limit = 0
+
+    def __missing__(self, cp):
+        folded = _fold_char(chr(cp))
+        if len(self) < self.limit:
+            self[cp] = folded
+        return folded
+
+def _build_fold_table() -> _FoldTable:
+    table = _FoldTable((cp, chr(cp)) for cp in range(0x80))
+    for lo, hi in _EAGER_RANGES:
+        for cp in range(lo, hi):
+            table[cp] = _fold_char(chr(cp))
+    for ch, repl in HOMOGLYPHS.items():
+        table[ord(ch)] = repl
+    for ch in ZERO_WIDTH:
+        table[ord(ch)] = None
+    table.limit = len(table) + _LAZY_LIMIT
+    return table
+
+FOLD_TABLE = _build_fold_table()
+_OBFUSCATION_TABLE = str.maketrans({**{c: '.' for c in _DOTS}, **{c: None for c in _SPACES}, '-': None, '_': None})
+_LEET_TABLE = str.maketrans({'0': 'o', '1': 'l'})
+_WORD_LEET_TABLE = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't'})
+_SYMBOL_LETTERS = {'@': 'a', '$': 's', '!': 'i'}
+
+def fold(text: str) -> str:
+    """
+    Strip diacritics and zero-width characters and map lookalike letters to
+    ASCII in a single str.translate pass. Pure-ASCII text is returned as is.
+    """
+    if not text or text.isascii():
+        return text or ''
+    return text.translate(FOLD_TABLE)
+
+def obfuscation_view(lowered: str) -> str:
+    """Turn `[dot]`, `dot` and dot lookalikes into '.' and drop whitespace, '-' and '_'."""
+    s = fold(lowered).translate(_OBFUSCATION_TABLE)
+    if 'dot' in s:
+        s = s.replace('[dot]', '.').replace('dot', '.')
+    return s
+
+def collapsed_view(lowered: str) -> str:
+    """Keep only [a-z0-9] after reading 0 as o and 1 as l."""
+    return _NON_ALNUM.sub('', fold(lowered).translate(_LEET_TABLE))
+
+def word_view(lowered: str) -> str:
+    """
+    Space-separated words padded with a space on both sides, for matching
+    whole words. Leetspeak digits (and @, $, ! inside words) read as
+    letters, runs of three or more of one character shrink to one, and
+    runs of single letters ("f u c k", "f.u.c.k") join into one word.
+    """
+    s = fold(lowered).translate(_WORD_LEET_TABLE)
+    s = _SYMBOL_LEET.sub(lambda m: _SYMBOL_LETTERS[m.group(0)], s)
+    s = _LONG_RUNS.sub(r'\1', s)
+    words = []
+    run = []
+    for word in _WORD_SEPARATORS.sub(' ', s).split():
+        if len(word) == 1:
+            run.append(word)
+            continue
+        if run:
+            words.append(''.join(run) if len(run) > 1 else run[0])
+            run = []
+        words.append(word)
+    if run:
+        words.append(''.join(run) if len(run) > 1 else run[0])
+    return ' ' + ' '.join(words) + ' '
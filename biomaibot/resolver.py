@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import ipaddress
+import time
+from urllib.parse import urljoin, urlsplit
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from cache import TTLCache
+from urls import HostSuffixIndex, split_url
+
+DEFAULT_SHORTENERS = (
+    "bit.ly", "tinyurl.com", "goo.gl", "t.co", "cutt.ly", "is.gd", "rb.gy", "ow.ly",
+    "tiny.cc", "shorturl.at", "s.id", "rebrand.ly", "buff.ly", "t.ly",
+)
+
+_MISSING = object()
+
+class RedirectResolver:
+    """
+    Follows redirects from URL shorteners to the host they finally land on.
+
+    Each hop is a HEAD request (GET when the server refuses HEAD) on a pooled
+    client with a per-request timeout; at most `concurrency` chains are walked
+    at once. Final (host, path) pairs are kept in an LRU+TTL cache, failures
+    for a shorter time, and concurrent lookups of the same URL share one walk.
+    With a store attached, resolved chains also outlive the process.
+
+    A hop whose host is, or resolves to, a loopback, private, link-local or
+    otherwise non-global address is never requested: the chain ends there
+    and that host is reported as where it lands, so a shortener cannot
+    point the bot at its own network. `allow_private` turns this off for
+    local testing.
+    """
+
+    def __init__(self, shorteners=DEFAULT_SHORTENERS, max_hops: int = 5, timeout: float = 2.0,
+                 concurrency: int = 8, cache_size: int = 2048, ttl: float = 3600.0,
+                 failure_ttl: float = 60.0, client=None, allow_private: bool = False):
+        if client is None and httpx is None:
+            raise RuntimeError("httpx is not installed")
+        self.shorteners = HostSuffixIndex(shorteners)
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.failure_ttl = failure_ttl
+        self.allow_private = allow_private
+        self.cache = TTLCache(cache_size, ttl)
+        self._client = client
+        self._owns_client = client is None
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._inflight = {}
+        self.lookups = 0
+        self.resolved = 0
+        self.failures = 0
+        self.hops = 0
+        self.over_budget = 0
+        self.refused = 0
+        self.store = None
+        self.store_ttl = ttl
+        self.store_hits = 0
+
+    def attach_store(self, store, ttl: float = None, warm: int = 0) -> int:
+        """Keep resolved chains in `store` for `ttl` seconds and preload the `warm` freshest."""
+        self.store = store
+        if ttl is not None:
+            self.store_ttl = ttl
+        if store is None or warm <= 0:
+            return 0
+        now = time.time()
+        loaded = 0
+        for _, (url, host, path), expires in store.recent_verdicts("redirect", warm):
+            self.cache.set(url, (host, path), ttl=min(self.cache.ttl, expires - now))
+            loaded += 1
+        return loaded
+
+    @staticmethod
+    def store_key(url: str) -> bytes:
+        return hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    @property
+    def client(self):
+        # Created on first use so the pool binds to the running event loop.
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits, follow_redirects=False)
+        return self._client
+
+    async def close(self):
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def is_shortener(self, host: str) -> bool:
+        return self.shorteners.match(host)
+
+    async def resolve(self, url: str):
+        """Return the final (host, path) for `url`, or None if it could not be followed."""
+        self.lookups += 1
+        cached = self.cache.get(url, _MISSING)
+        if cached is not _MISSING:
+            return cached
+        task = self._inflight.get(url)
+        if task is None and self.store is not None:
+            stored = await self.store.aload_verdict("redirect", self.store_key(url))
+            if stored is not None:
+                self.store_hits += 1
+                (_, host, path), expires = stored
+                self.cache.set(url, (host, path), ttl=min(self.cache.ttl, expires - time.time()))
+                return host, path
+            # Another caller may have started the walk while the store answered.
+            task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._follow(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda t, key=url: self._store(key, t))
+        # Shielded so a caller that gives up does not cancel the shared walk.
+        return await asyncio.shield(task)
+
+    def _store(self, key, task):
+        self._inflight.pop(key, None)
+        result = None if task.cancelled() else task.result()
+        if result is None:
+            self.cache.set(key, None, ttl=self.failure_ttl)
+        else:
+            self.cache.set(key, result)
+            if self.store is not None:
+                self.store.save_verdict("redirect", self.store_key(key), [key, *result], source="http", ttl=self.store_ttl)
+
+    async def _follow(self, url: str):
+        try:
+            async with self._semaphore:
+                current = url
+                for _ in range(self.max_hops + 1):
+                    internal = not self.allow_private and await self._internal(current)
+                    if internal:
+                        self.refused += 1
+                    location = None if internal else await self._location(current)
+                    if location is None:
+                        host, path, _ = split_url(current)
+                        if host:
+                            self.resolved += 1
+                            return (host, path)
+                        break
+                    self.hops += 1
+                    current = urljoin(current, location)
+        except Exception:
+            pass
+        self.failures += 1
+        return None
+
+    async def _internal(self, url: str) -> bool:
+        """True when the host of `url` is a non-global IP literal or resolves to a non-global address."""
+        host = urlsplit(url if "://" in url else "http://" + url).hostname
+        if not host:
+            return True
+        try:
+            return not ipaddress.ip_address(host).is_global
+        except ValueError:
+            pass
+        infos = await asyncio.wait_for(asyncio.get_running_loop().getaddrinfo(host, None), self.timeout)
+        return not infos or any(not ipaddress.ip_address(info[4][0].split("%", 1)[0]).is_global for info in infos)
+
+    async def _location(self, url: str):
+        """Location header of a redirect response, or None when `url` does not redirect."""
+        response = await self.client.head(url)
+        if response.status_code in (405, 501):
+            async with self.client.stream("GET", url) as response:
+                pass
+        if 300 <= response.status_code < 400:
+            return response.headers.get("location")
+        return None
+
+    async def resolve_within(self, urls, budget: float) -> dict:
+        """
+        Resolve `urls` concurrently and return {url: (host, path) or None}
+        after at most `budget` seconds. Lookups still running at the deadline
+        are left to finish in the background and land in the cache.
+        """
+        tasks = {url: asyncio.ensure_future(self.resolve(url)) for url in dict.fromkeys(urls)}
+        if not tasks:
+            return {}
+        done, pending = await asyncio.wait(tasks.values(), timeout=budget)
+        if pending:
+            self.over_budget += 1
+        return {url: task.result() if task in done else None for url, task in tasks.items()}
+
+    def snapshot(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "resolved": self.resolved,
+            "failures": self.failures,
+            "hops": self.hops,
+            "over_budget": self.over_budget,
+            "refused": self.refused,
+            "store_hits": self.store_hits,
+            "inflight": len(self._inflight),
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+class Retention:
+    """
+    Background compaction for the SQLite events table. Each pass, on a
+    connection of its own:
+
+    - folds events past the last rolled-up id into per-day, per-chat,
+      per-type counts in `event_rollups`, `batch` rows per transaction;
+    - deletes rolled-up events older than `ttl_days` (except the types in
+      `keep`), again `batch` rows at a time with a short pause in between
+      so the event writer never waits long for the lock;
+    - returns up to `vacuum_pages` free pages to the filesystem with an
+      incremental vacuum, once the file is in incremental auto_vacuum mode.
+
+    Files created before that mode was set need one full VACUUM, which
+    holds the write lock for as long as it takes; that is left to
+    enable_incremental_vacuum, for startup, never a background pass.
+    Nothing reads `event_rollups` yet: the counts are kept so per-chat
+    history outlives the pruned events.
+    """
+
+    def __init__(self, connect, ttl_days: float = 30, keep=(), batch: int = 1000, interval: float = 300.0,
+                 vacuum_pages: int = 256, pause: float = 0.05, clock=time.time):
+        self.connect = connect
+        self.ttl = ttl_days * DAY
+        self.keep = tuple(keep)
+        self.batch = max(1, batch)
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self._clock = clock
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.passes = 0
+        self.rolled_up = 0
+        self.pruned = 0
+        self.vacuumed = 0
+        self.incremental = False
+        self.errors = 0
+        self.last_pass_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Retention pass failed: {e}")
+            self._stop.wait(self.interval)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def run_once(self) -> dict:
+        """One rollup, prune and vacuum pass; returns what it did."""
+        if self._conn is None:
+            self._conn = self.connect()
+            self.incremental = self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        t0 = time.perf_counter()
+        rolled = self.roll_up()
+        pruned = self.prune() if self.ttl > 0 else 0
+        vacuumed = self.vacuum()
+        self.passes += 1
+        self.last_pass_ms = (time.perf_counter() - t0) * 1000
+        return {"rolled_up": rolled, "pruned": pruned, "vacuumed": vacuumed}
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Switch an older file to incremental auto_vacuum with a full VACUUM,
+        before the thread starts; True if it had to. Blocks every writer
+        until done, so call it only before the handlers run.
+        """
+        if self.running:
+            raise RuntimeError("convert the database before starting retention")
+        conn = self.connect()
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+        finally:
+            conn.close()
+
+    def _watermark(self, cur) -> int:
+        row = cur.execute("SELECT value FROM settings WHERE key='rollup_last_id'").fetchone()
+        return int(row[0]) if row else 0
+
+    def roll_up(self) -> int:
+        conn = self._conn
+        total = 0
+        while not self._stop.is_set():
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                lo = self._watermark(cur)
+                top = cur.execute("SELECT MAX(id) FROM events").fetchone()[0] or 0
+                hi = min(top, lo + self.batch)
+                if hi <= lo:
+                    conn.rollback()
+                    break
+                cur.execute(
+                    "INSERT INTO event_rollups (day, chat_id, type, count) "
+                    "SELECT ts / ?, COALESCE(chat_id, 0), type, COUNT(*) FROM events WHERE id > ? AND id <= ? "
+                    "GROUP BY 1, 2, 3 "
+                    "ON CONFLICT (day, chat_id, type) DO UPDATE SET count = count + excluded.count",
+                    (DAY, lo, hi)
+                )
+                cur.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('rollup_last_id', ?)", (str(hi),))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            total += hi - lo
+            self.rolled_up += hi - lo
+            if hi == top:
+                break
+            self._stop.wait(self.pause)
+        return total
+
+    def prune(self) -> int:
+        conn = self._conn
+        cutoff = int(self._clock() - self.ttl)
+        keep = f" AND type NOT IN ({','.join('?' * len(self.keep))})" if self.keep else ""
+        total = 0
+        while not self._stop.is_set():
+            with conn:
+                limit = self._watermark(conn)
+                deleted = conn.execute(
+                    "DELETE FROM events WHERE id IN (SELECT id FROM events WHERE id <= ? AND ts < ?" + keep +
+                    " ORDER BY id LIMIT ?)",
+                    (limit, cutoff, *self.keep, self.batch)
+                ).rowcount
+            total += deleted
+            self.pruned += deleted
+            if deleted < self.batch:
+                break
+            self._stop.wait(self.pause)
+        return total
+
+    def vacuum(self) -> int:
+        conn = self._conn
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free or self.vacuum_pages <= 0 or not self.incremental:
+            return 0
+        pages = min(free, self.vacuum_pages)
+        conn.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+        self.vacuumed += pages
+        return pages
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "passes": self.passes,
+            "rolled_up": self.rolled_up,
+            "pruned": self.pruned,
+            "vacuumed_pages": self.vacuumed,
+            "incremental": self.incremental,
+            "errors": self.errors,
+            "last_pass_ms": self.last_pass_ms,
+        }
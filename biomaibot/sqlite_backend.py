@@ -0,0 +1,316 @@
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+from backend import StorageBackend
+
+def _compact(payload: dict):
+    """Payload JSON without the fields that have columns of their own; None when nothing is left."""
+    rest = {k: v for k, v in payload.items() if k not in ("chat_id", "user_id")}
+    return json.dumps(rest, ensure_ascii=False, separators=(",", ":")) if rest else None
+
+def _event_row(event_type: str, payload: dict, ts: int):
+    return (event_type, payload.get("chat_id"), payload.get("user_id"), _compact(payload), ts)
+
+def _epoch(value) -> int:
+    try:
+        return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+def _events_epoch_compact(cur):
+    # Integer epoch timestamps, chat_id/user_id only in their columns, and
+    # indexes for the per-type, per-chat and per-user queries.
+    cur.execute("CREATE TABLE events_new (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, chat_id INTEGER, user_id INTEGER, data TEXT, ts INTEGER NOT NULL)")
+    rows = cur.execute("SELECT id, type, chat_id, user_id, data, ts FROM events ORDER BY id").fetchall()
+    migrated = []
+    for row_id, event_type, chat_id, user_id, data, ts in rows:
+        try:
+            payload = json.loads(data or "{}")
+        except ValueError:
+            payload = {}
+        migrated.append((row_id, event_type or "", chat_id, user_id, _compact(payload), _epoch(ts)))
+    cur.executemany("INSERT INTO events_new (id, type, chat_id, user_id, data, ts) VALUES (?, ?, ?, ?, ?, ?)", migrated)
+    cur.execute("DROP TABLE events")
+    cur.execute("ALTER TABLE events_new RENAME TO events")
+    cur.execute("CREATE INDEX events_type_ts ON events (type, ts)")
+    cur.execute("CREATE INDEX events_chat_ts ON events (chat_id, ts)")
+    cur.execute("CREATE INDEX events_user ON events (user_id)")
+
+def _dimension_tables(cur):
+    # Every user and chat once, with when it was first seen, so counting them
+    # does not scan the events table.
+    cur.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, first_seen INTEGER NOT NULL)")
+    cur.execute("CREATE TABLE chats (chat_id INTEGER PRIMARY KEY, first_seen INTEGER NOT NULL)")
+    cur.execute("INSERT INTO users SELECT user_id, MIN(ts) FROM events WHERE user_id IS NOT NULL GROUP BY user_id")
+    cur.execute("INSERT INTO chats SELECT chat_id, MIN(ts) FROM events WHERE chat_id IS NOT NULL GROUP BY chat_id")
+
+# Stored sets: name -> (table, column)
+SET_TABLES = {
+    "blocklist": ("blocklist", "phrase"),
+    "link_whitelist": ("link_whitelist", "entry"),
+    "special_users": ("special_users", "user_id"),
+}
+
+def _normalized_settings(cur):
+    # Split the single "global" settings document into a row per group, per
+    # chat setting, per set member and per remaining global key.
+    cur.execute("CREATE TABLE groups (chat_id INTEGER PRIMARY KEY, title TEXT)")
+    cur.execute("CREATE TABLE chat_settings (chat_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT, PRIMARY KEY (chat_id, key)) WITHOUT ROWID")
+    cur.execute("CREATE TABLE blocklist (phrase TEXT PRIMARY KEY) WITHOUT ROWID")
+    cur.execute("CREATE TABLE link_whitelist (entry TEXT PRIMARY KEY) WITHOUT ROWID")
+    cur.execute("CREATE TABLE special_users (user_id INTEGER PRIMARY KEY)")
+    row = cur.execute("SELECT value FROM settings WHERE key='global'").fetchone()
+    try:
+        state = json.loads(row[0]) if row and row[0] else {}
+    except ValueError:
+        state = {}
+    titles = state.pop("group_titles", None) or {}
+    cur.executemany("INSERT OR IGNORE INTO groups (chat_id, title) VALUES (?, ?)",
+                    [(int(c), titles.get(str(c))) for c in state.pop("groups", None) or []])
+    per_chat = []
+    for chat_id, delays in (state.pop("chat_delays", None) or {}).items():
+        per_chat += [(int(chat_id), target, json.dumps(value)) for target, value in (delays or {}).items()]
+    for chat_id, level in (state.pop("chat_sensitivity", None) or {}).items():
+        per_chat.append((int(chat_id), "sensitivity", json.dumps(level)))
+    cur.executemany("INSERT OR REPLACE INTO chat_settings (chat_id, key, value) VALUES (?, ?, ?)", per_chat)
+    for name, (table, column) in SET_TABLES.items():
+        cur.executemany(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", [(m,) for m in state.pop(name, None) or []])
+    cur.execute("DELETE FROM settings WHERE key='global'")
+    cur.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(value, ensure_ascii=False)) for key, value in state.items()])
+
+# Schema steps, applied in order; PRAGMA user_version records how many ran.
+# Append new steps, never edit old ones.
+MIGRATIONS = (
+    (
+        "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, chat_id INTEGER, user_id INTEGER, data TEXT, ts TEXT)",
+        "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)",
+        "CREATE TABLE IF NOT EXISTS verdicts (hash BLOB, kind TEXT, verdict TEXT, source TEXT, confidence REAL, expires INTEGER, PRIMARY KEY (kind, hash))",
+        "CREATE INDEX IF NOT EXISTS verdicts_expires ON verdicts (kind, expires)",
+    ),
+    _events_epoch_compact,
+    _dimension_tables,
+    _normalized_settings,
+    (
+        # Per-day, per-chat, per-type event counts kept by retention.Retention.
+        "CREATE TABLE IF NOT EXISTS event_rollups (day INTEGER NOT NULL, chat_id INTEGER NOT NULL, type TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (day, chat_id, type)) WITHOUT ROWID",
+    ),
+)
+
+def connect_sqlite(path: str):
+    """Connection with the pragmas every connection to the bot's database uses."""
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+    # WAL lets the event writer commit while handlers read; NORMAL sync is
+    # safe under WAL and skips an fsync per commit.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+def migrate_sqlite(conn) -> int:
+    """Bring the schema up to date; returns the version it is now at."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0:
+        # Only takes effect before the first table exists; older files are
+        # converted at startup when RETENTION_CONVERT_VACUUM is set.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    for target in range(version + 1, len(MIGRATIONS) + 1):
+        step = MIGRATIONS[target - 1]
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            if callable(step):
+                step(cur)
+            else:
+                for sql in step:
+                    cur.execute(sql)
+            cur.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return max(version, len(MIGRATIONS))
+
+class SqliteBackend(StorageBackend):
+    """
+    The bot's SQLite database file. Handlers use one connection; batches from
+    the event writer thread go through a second one, so their transactions
+    never interleave with the event loop's.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = connect_sqlite(path)
+        try:
+            migrate_sqlite(self.conn)
+        except Exception:
+            self.conn.close()
+            raise
+        self._writer_conn = None
+
+    def connect(self):
+        """A new connection to the same file, for background threads."""
+        return connect_sqlite(self.path)
+
+    def close(self):
+        for conn in (self._writer_conn, self.conn):
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        self._writer_conn = None
+        self.conn = None
+
+    def insert_events(self, rows):
+        new_users = [(user_id, int(ts)) for _, _, ts, user_id, _ in rows if user_id is not None]
+        new_chats = [(chat_id, int(ts)) for _, _, ts, _, chat_id in rows if chat_id is not None]
+        if self._writer_conn is None:
+            self._writer_conn = self.connect()
+        with self._writer_conn:
+            self._writer_conn.executemany(
+                "INSERT INTO events (type, chat_id, user_id, data, ts) VALUES (?, ?, ?, ?, ?)",
+                [_event_row(event_type, payload, int(ts)) for event_type, payload, ts, _, _ in rows]
+            )
+            if new_users:
+                self._writer_conn.executemany("INSERT OR IGNORE INTO users (user_id, first_seen) VALUES (?, ?)", new_users)
+            if new_chats:
+                self._writer_conn.executemany("INSERT OR IGNORE INTO chats (chat_id, first_seen) VALUES (?, ?)", new_chats)
+
+    def add_event(self, row):
+        event_type, payload, ts, new_user, new_chat = row
+        ts = int(ts)
+        cur = self.conn.cursor()
+        cur.execute("INSERT INTO events (type, chat_id, user_id, data, ts) VALUES (?, ?, ?, ?, ?)",
+                    _event_row(event_type, payload, ts))
+        if new_user is not None:
+            cur.execute("INSERT OR IGNORE INTO users (user_id, first_seen) VALUES (?, ?)", (new_user, ts))
+        if new_chat is not None:
+            cur.execute("INSERT OR IGNORE INTO chats (chat_id, first_seen) VALUES (?, ?)", (new_chat, ts))
+        self.conn.commit()
+
+    def iter_events(self, types=None) -> list:
+        cur = self.conn.cursor()
+        if types:
+            types = list(types)
+            cur.execute(f"SELECT type, chat_id, user_id, data FROM events WHERE type IN ({','.join('?' * len(types))}) ORDER BY id", types)
+        else:
+            cur.execute("SELECT type, chat_id, user_id, data FROM events ORDER BY id")
+        events = []
+        for event_type, chat_id, user_id, data in cur.fetchall():
+            try:
+                payload = json.loads(data) if data else {}
+            except ValueError:
+                continue
+            if chat_id is not None:
+                payload["chat_id"] = chat_id
+            if user_id is not None:
+                payload["user_id"] = user_id
+            events.append((event_type, payload))
+        return events
+
+    def events_since(self, types, since: float) -> list:
+        types = list(types)
+        cur = self.conn.execute(
+            f"SELECT type, chat_id, user_id, data, ts FROM events WHERE type IN ({','.join('?' * len(types))}) AND ts >= ? ORDER BY ts, id",
+            (*types, int(since))
+        )
+        events = []
+        for event_type, chat_id, user_id, data, ts in cur.fetchall():
+            try:
+                payload = json.loads(data) if data else {}
+            except ValueError:
+                continue
+            if chat_id is not None:
+                payload["chat_id"] = chat_id
+            if user_id is not None:
+                payload["user_id"] = user_id
+            events.append((event_type, payload, ts))
+        return events
+
+    def count_events(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def load_seen(self):
+        return ({row[0] for row in self.conn.execute("SELECT user_id FROM users")},
+                {row[0] for row in self.conn.execute("SELECT chat_id FROM chats")})
+
+    def load_state(self) -> dict:
+        state = {}
+        for key, value in self.conn.execute("SELECT key, value FROM settings"):
+            try:
+                state[key] = json.loads(value)
+            except (TypeError, ValueError):
+                continue
+        return state
+
+    def update_state(self, fields: dict):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            [(key, json.dumps(value, ensure_ascii=False)) for key, value in fields.items()]
+        )
+        self.conn.commit()
+
+    def load_set(self, name: str) -> set:
+        table, column = SET_TABLES[name]
+        return {row[0] for row in self.conn.execute(f"SELECT {column} FROM {table}")}
+
+    def sync_set(self, name: str, added, removed):
+        table, column = SET_TABLES[name]
+        cur = self.conn.cursor()
+        cur.executemany(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", [(m,) for m in added])
+        cur.executemany(f"DELETE FROM {table} WHERE {column}=?", [(m,) for m in removed])
+        self.conn.commit()
+
+    def load_chat_settings(self, chat_id: int) -> dict:
+        cur = self.conn.execute("SELECT key, value FROM chat_settings WHERE chat_id=?", (chat_id,))
+        return {key: json.loads(value) for key, value in cur.fetchall()}
+
+    def set_chat_setting(self, chat_id: int, key: str, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO chat_settings (chat_id, key, value) VALUES (?, ?, ?)",
+            (chat_id, key, json.dumps(value, ensure_ascii=False))
+        )
+        self.conn.commit()
+
+    def add_group(self, chat_id: int, title: str = None):
+        cur = self.conn.cursor()
+        if title:
+            cur.execute(
+                "INSERT INTO groups (chat_id, title) VALUES (?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET title=excluded.title WHERE title IS NOT excluded.title",
+                (chat_id, title)
+            )
+        else:
+            cur.execute("INSERT OR IGNORE INTO groups (chat_id) VALUES (?)", (chat_id,))
+        if cur.rowcount:
+            self.conn.commit()
+
+    def count_groups(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM groups").fetchone()[0]
+
+    def save_verdict(self, kind: str, key: bytes, verdict, source, confidence, expires: float):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO verdicts (hash, kind, verdict, source, confidence, expires) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, kind, json.dumps(verdict, ensure_ascii=False, separators=(",", ":")), source, confidence, int(expires))
+        )
+        self.conn.commit()
+
+    def load_verdict(self, kind: str, key: bytes, now: float):
+        row = self.conn.execute("SELECT verdict, expires FROM verdicts WHERE kind=? AND hash=? AND expires>?",
+                                (kind, key, int(now))).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def recent_verdicts(self, kind: str, limit: int, now: float) -> list:
+        cur = self.conn.execute("SELECT hash, verdict, expires FROM verdicts WHERE kind=? AND expires>? ORDER BY expires DESC LIMIT ?",
+                                (kind, int(now), limit))
+        return [(bytes(h), json.loads(v), e) for h, v, e in cur.fetchall()]
+
+    def prune_verdicts(self, now: float) -> int:
+        cur = self.conn.execute("DELETE FROM verdicts WHERE expires<=?", (int(now),))
+        self.conn.commit()
+        return cur.rowcount
@@ -1,196 +1,264 @@
-from datetime import datetime
-from bot_config import MONGO_URI
-import sqlite3
-import json
+from bot_config import MONGO_URI, MONGO_POOL_SIZE, MONGO_TIMEOUT, MONGO_FLUSH_MS
+import time
+import atexit
+import logging
 from pathlib import Path
+from eventwriter import EventWriter
+from retention import Retention
 
-try:
-    from pymongo import MongoClient
-except Exception:
-    MongoClient = None
+from backend import SET_NAMES
+from mongo_backend import MongoBackend
+from sqlite_backend import SqliteBackend
+
+logger = logging.getLogger(__name__)
 
 class Storage:
-    def __init__(self, uri: str = None):
+    """
+    What the bot stores, on one backend.StorageBackend: MongoDB when a URI
+    is configured and reachable, otherwise the SQLite file, or whichever
+    backend is passed in. A failing backend call is logged and counted in
+    `errors` and the caller gets an empty answer, so moderation goes on
+    when storage does not.
+    """
+
+    def __init__(self, uri: str = None, sqlite_path: str = None, backend=None):
         use_uri = uri or MONGO_URI
-        self.mongo_enabled = False
-        self.sqlite_enabled = False
-        self.enabled = False
-        self.client = None
-        self.db = None
-        self.sqlite_conn = None
-        self.sqlite_path = str(Path(__file__).parent / "biomaibot.db")
-        if self.enabled:
+        self.sqlite_path = sqlite_path or str(Path(__file__).parent / "biomaibot.db")
+        self.backend = backend
+        self.writer = None
+        self.retention = None
+        self.errors = 0
+        # Ids already in the users/chats records; their sizes are the counts /status shows.
+        self.seen_users = set()
+        self.seen_chats = set()
+        # Last loaded or synced members of each stored set, to write only the difference.
+        self._sets = {}
+        if self.backend is None and use_uri:
             try:
-                self.client = MongoClient(use_uri)
-                self.db = None
-                if self.client:
-                    try:
-                        self.db = self.client.get_default_database()
-                    except Exception:
-                        self.db = self.client.get_database("biomaibot")
-                self.mongo_enabled = True if self.db is not None else False
-            except Exception:
-                self.client = None
-                self.db = None
-                self.mongo_enabled = False
-        if not self.mongo_enabled:
+                self.backend = MongoBackend(use_uri, MONGO_POOL_SIZE, MONGO_TIMEOUT, MONGO_FLUSH_MS)
+            except Exception as e:
+                print(f"Warning: MongoDB unavailable, using SQLite: {e}")
+        if self.backend is None:
             try:
-                self.sqlite_conn = sqlite3.connect(self.sqlite_path, check_same_thread=False)
-                cur = self.sqlite_conn.cursor()
-                cur.execute("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, chat_id INTEGER, user_id INTEGER, data TEXT, ts TEXT)")
-                cur.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
-                self.sqlite_conn.commit()
-                self.sqlite_enabled = True
-            except Exception:
-                self.sqlite_conn = None
-                self.sqlite_enabled = False
-        self.enabled = self.mongo_enabled or self.sqlite_enabled
-    
-    def save_event(self, event_type: str, payload: dict):
-        if not self.enabled:
-            return
-        chat_id = payload.get("chat_id")
+                self.backend = SqliteBackend(self.sqlite_path)
+            except Exception as e:
+                print(f"Warning: SQLite storage unavailable: {e}")
+        self._load_seen()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @property
+    def mongo_enabled(self) -> bool:
+        return isinstance(self.backend, MongoBackend)
+
+    @property
+    def sqlite_enabled(self) -> bool:
+        return isinstance(self.backend, SqliteBackend)
+
+    def _call(self, method: str, default, *args):
+        if self.backend is None:
+            return default
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Storage {method} on {self.backend.name} failed: {e}")
+            return default
+
+    async def _acall(self, method: str, default, *args):
+        if self.backend is None:
+            return default
+        try:
+            return await getattr(self.backend, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Storage {method} on {self.backend.name} failed: {e}")
+            return default
+
+    def _load_seen(self):
+        seen = self._call("load_seen", None)
+        if seen is not None:
+            self.seen_users, self.seen_chats = seen
+
+    def _first_sight(self, payload: dict):
+        """(new user id or None, new chat id or None), marking both as seen."""
         user_id = payload.get("user_id")
-        ts = datetime.utcnow().isoformat()
-        if self.mongo_enabled and self.db is not None:
+        chat_id = payload.get("chat_id")
+        if user_id is None or user_id in self.seen_users:
+            user_id = None
+        else:
+            self.seen_users.add(user_id)
+        if chat_id is None or chat_id in self.seen_chats:
+            chat_id = None
+        else:
+            self.seen_chats.add(chat_id)
+        return user_id, chat_id
+
+    def start_writer(self, flush_ms: float = 200, batch_size: int = 256, maxsize: int = 10000):
+        """Queue events for a background thread that writes them in batches instead of one commit each."""
+        if not self.enabled or self.writer is not None:
+            return self.writer
+        self.writer = EventWriter(self.backend.insert_events, flush_ms, batch_size, maxsize)
+        self.writer.start()
+        atexit.register(self.stop_writer)
+        return self.writer
+
+    def stop_writer(self, timeout: float = 5.0):
+        """Flush queued events and stop the background writer."""
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.stop(timeout)
+
+    def start_retention(self, ttl_days: float = 30, keep=(), batch: int = 1000, interval: float = 300.0,
+                        vacuum_pages: int = 256, convert_vacuum: bool = False):
+        """
+        Roll events up into daily counts and prune old ones on a background
+        thread (SQLite only). With `convert_vacuum`, an older file is first
+        switched to incremental vacuum with a full VACUUM, right here.
+        """
+        if not self.sqlite_enabled or self.retention is not None:
+            return self.retention
+        self.retention = Retention(self.backend.connect, ttl_days, keep, batch, interval, vacuum_pages)
+        if convert_vacuum:
+            t0 = time.perf_counter()
             try:
-                doc = {"type": event_type, "data": payload, "ts": datetime.utcnow()}
-                self.db.events.insert_one(doc)
-                return
-            except Exception:
-                pass
-        if self.sqlite_enabled and self.sqlite_conn is not None:
+                if self.retention.enable_incremental_vacuum():
+                    logger.info(f"Converted {self.sqlite_path} to incremental vacuum in {time.perf_counter() - t0:.1f}s")
+            except Exception as e:
+                logger.error(f"Converting {self.sqlite_path} to incremental vacuum failed: {e}")
+        self.retention.start()
+        atexit.register(self.stop_retention)
+        return self.retention
+
+    def stop_retention(self, timeout: float = 5.0):
+        retention, self.retention = self.retention, None
+        if retention is not None:
+            retention.stop(timeout)
+
+    def flush(self):
+        """Wait until every event and setting written so far is stored."""
+        if self.writer is not None:
+            self.writer.flush()
+        self._call("flush", None)
+
+    def close(self):
+        """Stop the background workers and close the backend."""
+        self.stop_writer()
+        self.stop_retention()
+        backend, self.backend = self.backend, None
+        if backend is not None:
             try:
-                cur = self.sqlite_conn.cursor()
-                cur.execute(
-                    "INSERT INTO events (type, chat_id, user_id, data, ts) VALUES (?, ?, ?, ?, ?)",
-                    (event_type, chat_id, user_id, json.dumps(payload, ensure_ascii=False), ts)
-                )
-                self.sqlite_conn.commit()
-            except Exception:
-                pass
+                backend.close()
+            except Exception as e:
+                logger.error(f"Closing {backend.name} storage failed: {e}")
 
-    def load_state(self) -> dict:
+    def save_event(self, event_type: str, payload: dict):
         if not self.enabled:
-            return {}
-        if self.mongo_enabled and self.db is not None:
-            try:
-                doc = self.db.settings.find_one({"_id": "global"}) or {}
-                doc.pop("_id", None)
-                return doc
-            except Exception:
-                pass
-        if self.sqlite_enabled and self.sqlite_conn is not None:
-            try:
-                cur = self.sqlite_conn.cursor()
-                cur.execute("SELECT value FROM settings WHERE key=?", ("global",))
-                row = cur.fetchone()
-                if not row or not row[0]:
-                    return {}
-                return json.loads(row[0])
-            except Exception:
-                return {}
-        return {}
+            return
+        new_user, new_chat = self._first_sight(payload)
+        row = (event_type, payload, time.time(), new_user, new_chat)
+        writer = self.writer
+        if writer is not None and writer.accepting:
+            # A full queue drops the event (counted in writer.dropped); writing
+            # it here instead would block the event loop exactly when storage is behind.
+            writer.put(row)
+            return
+        self._call("add_event", None, row)
+
+    def iter_events(self, types=None):
+        """Yield (type, payload) for stored events, oldest first, optionally only of the given types."""
+        if self.writer is not None:
+            self.writer.flush()
+        yield from self._call("iter_events", [], types)
+
+    def events_since(self, types, since: float) -> list:
+        """(type, payload, ts) for stored events of the given types since `since` (epoch seconds), oldest first."""
+        if self.writer is not None:
+            self.writer.flush()
+        return self._call("events_since", [], types, since)
+
+    def count_events(self) -> int:
+        if self.writer is not None:
+            self.writer.flush()
+        return self._call("count_events", 0)
+
+    def save_verdict(self, kind: str, key: bytes, verdict, source: str = None, confidence: float = None, ttl: float = 7 * 86400):
+        """Remember a decision about some content (hashed into `key`) until `ttl` seconds from now."""
+        self._call("save_verdict", None, kind, key, verdict, source, confidence, time.time() + ttl)
+
+    def load_verdict(self, kind: str, key: bytes):
+        """(verdict, expires) for a live stored decision, or None."""
+        return self._call("load_verdict", None, kind, key, time.time())
+
+    async def aload_verdict(self, kind: str, key: bytes):
+        """load_verdict for the event loop: awaits the backend instead of blocking on it."""
+        return await self._acall("aload_verdict", None, kind, key, time.time())
+
+    def recent_verdicts(self, kind: str, limit: int):
+        """Up to `limit` live decisions of one kind as (key, verdict, expires), longest-lived first."""
+        return self._call("recent_verdicts", [], kind, limit, time.time())
+
+    def prune_verdicts(self) -> int:
+        """Drop expired decisions; returns how many went."""
+        return self._call("prune_verdicts", 0, time.time())
+
+    def load_state(self) -> dict:
+        """Global settings as {key: value}."""
+        return self._call("load_state", {})
 
     def update_state(self, fields: dict):
-        if not self.enabled:
+        """Write the given global settings; other keys are left alone."""
+        if fields:
+            self._call("update_state", None, fields)
+
+    def load_set(self, name: str) -> set:
+        """Members of one of the SET_NAMES sets."""
+        if name not in SET_NAMES:
+            return set()
+        members = self._call("load_set", None, name)
+        if members is None:
+            return set()
+        self._sets[name] = set(members)
+        return members
+
+    def sync_set(self, name: str, members):
+        """Store `members` as the whole set, writing only what changed since the last load or sync."""
+        if not self.enabled or name not in SET_NAMES:
             return
-        if self.mongo_enabled and self.db is not None:
-            try:
-                self.db.settings.update_one({"_id": "global"}, {"$set": fields}, upsert=True)
-                return
-            except Exception:
-                pass
-        if self.sqlite_enabled and self.sqlite_conn is not None:
-            try:
-                current = self.load_state()
-                current.update(fields or {})
-                cur = self.sqlite_conn.cursor()
-                cur.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", ("global", json.dumps(current, ensure_ascii=False)))
-                self.sqlite_conn.commit()
-            except Exception:
-                pass
+        stored = self._sets.get(name)
+        if stored is None:
+            stored = self.load_set(name)
+        members = set(members)
+        added = members - stored
+        removed = stored - members
+        if not added and not removed:
+            return
+        if self._call("sync_set", False, name, added, removed) is not False:
+            self._sets[name] = members
+
+    def load_chat_settings(self, chat_id: int) -> dict:
+        """One chat's settings as {key: value}; empty when it has none."""
+        return self._call("load_chat_settings", {}, chat_id)
+
+    async def aload_chat_settings(self, chat_id: int) -> dict:
+        return await self._acall("aload_chat_settings", {}, chat_id)
+
+    def set_chat_setting(self, chat_id: int, key: str, value):
+        self._call("set_chat_setting", None, chat_id, key, value)
 
     def count_distinct_chats(self) -> int:
-        if not self.enabled:
-            return 0
-        if self.mongo_enabled and self.db is not None:
-            try:
-                return len(self.db.events.distinct("data.chat_id"))
-            except Exception:
-                pass
-        if self.sqlite_enabled and self.sqlite_conn is not None:
-            try:
-                cur = self.sqlite_conn.cursor()
-                cur.execute("SELECT COUNT(DISTINCT chat_id) FROM events")
-                row = cur.fetchone()
-                return int(row[0] or 0)
-            except Exception:
-                return 0
-        return 0
+        return len(self.seen_chats) if self.enabled else 0
 
     def count_distinct_users(self) -> int:
-        if not self.enabled:
-            return 0
-        if self.mongo_enabled and self.db is not None:
-            try:
-                return len(self.db.events.distinct("data.user_id"))
-            except Exception:
-                pass
-        if self.sqlite_enabled and self.sqlite_conn is not None:
-            try:
-                cur = self.sqlite_conn.cursor()
-                cur.execute("SELECT COUNT(DISTINCT user_id) FROM events")
-                row = cur.fetchone()
-                return int(row[0] or 0)
-            except Exception:
-                return 0
-        return 0
+        return len(self.seen_users) if self.enabled else 0
 
     def add_group(self, chat_id: int, title: str = None):
-        if not self.enabled:
-            return
-        if self.mongo_enabled and self.db is not None:
-            try:
-                update = {"$addToSet": {"groups": chat_id}}
-                if title:
-                    update["$set"] = {f"group_titles.{chat_id}": title}
-                self.db.settings.update_one({"_id": "global"}, update, upsert=True)
-                return
-            except Exception:
-                pass
-        if self.sqlite_enabled and self.sqlite_conn is not None:
-            try:
-                state = self.load_state()
-                groups = state.get("groups") or []
-                if chat_id not in groups:
-                    groups.append(chat_id)
-                if title:
-                    titles = state.get("group_titles") or {}
-                    titles[str(chat_id)] = title
-                    state["group_titles"] = titles
-                state["groups"] = groups
-                self.update_state(state)
-            except Exception:
-                pass
+        self._call("add_group", None, chat_id, title)
 
     def count_groups(self) -> int:
-        if not self.enabled:
-            return 0
-        if self.mongo_enabled and self.db is not None:
-            try:
-                doc = self.db.settings.find_one({"_id": "global"}, {"groups": 1}) or {}
-                groups = doc.get("groups") or []
-                if isinstance(groups, list):
-                    return len(groups)
-                return 0
-            except Exception:
-                return 0
-        if self.sqlite_enabled and self.sqlite_conn is not None:
-            try:
-                state = self.load_state()
-                groups = state.get("groups") or []
-                return len(groups) if isinstance(groups, list) else 0
-            except Exception:
-                return 0
-        return 0
+        return self._call("count_groups", 0)
+
+    async def acount_groups(self) -> int:
+        return await self._acall("acount_groups", 0)
@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+import conformance
+
+MONGO_URI = os.environ.get("TEST_MONGO_URI", "")
+
+BACKENDS = [pytest.param(opener, id=name) for name, opener in conformance.BACKENDS.items()]
+BACKENDS.append(pytest.param(conformance.mongo_opener(MONGO_URI) if MONGO_URI else None, id="mongo",
+                             marks=pytest.mark.skipif(not MONGO_URI, reason="TEST_MONGO_URI is not set")))
+
+@pytest.mark.parametrize("check", conformance.CHECKS, ids=lambda c: c.__name__[len("check_"):])
+@pytest.mark.parametrize("opener", BACKENDS)
+def test_conformance(opener, check, tmp_path):
+    b = opener(tmp_path)
+    try:
+        check(b)
+    finally:
+        b.close()
@@ -0,0 +1,69 @@
+import pytest
+
+from abuse import AbuseDetector
+from bot_config import ABUSE_THRESHOLD
+
+# Ordinary messages that share words with the lexicon; none may be deleted
+# without asking GPT.
+HARMLESS = [
+    "mera kutta bimar hai",
+    "kutte ko khana de do",
+    "gali ke kutte raat bhar bhonkte hain",
+    "uski kutti ne kal bachche diye",
+    "मेरा कुत्ता बहुत प्यारा है",
+    "Moby Dick is a great book",
+    "Dick Francis wrote thrillers",
+    "Lund university admission",
+    "I studied in Lund for a year",
+    "sale mein 50% choot mil rahi hai",
+    "careful, the cactus will prick you",
+    "kill the process and restart the bot",
+    "the murder mystery was great",
+    "report abuse to the admins",
+    "bc exam kal hai, pagal mat bano",
+    "rapeseed oil prices are up",
+    "fire retardant spray",
+    "I will kill it in the exam tomorrow",
+    "Randi Zuckerberg spoke at the summit",
+    "meri train chut gayi",
+    "Gand is the French name for Ghent",
+]
+
+# Still deleted locally.
+ABUSIVE = [
+    "tu kutta kamina hai",
+    "fuck off",
+    "chutiya hai tu",
+    "madarchod",
+    "teri gand mar dunga",
+    "randi ki aulad",
+]
+
+# Threats the regex tier caught before it was narrowed; still deleted locally.
+THREATS = [
+    "I will murder you",
+    "i will kill you",
+    "I'll kill u tonight",
+    "gonna shoot you",
+    "I will rape your sister",
+    "terrorist attack on you soon",
+]
+
+@pytest.fixture(scope="module")
+def detector():
+    d = AbuseDetector()
+    # A trained model is per deployment; this checks the lexicon and patterns.
+    d.model = None
+    return d
+
+def _deleted(detector, text):
+    result = detector.detect_local(text)
+    return bool(result and result["is_abusive"] and result["confidence"] >= ABUSE_THRESHOLD)
+
+@pytest.mark.parametrize("text", HARMLESS)
+def test_harmless_not_deleted(detector, text):
+    assert not _deleted(detector, text), detector.detect_local(text)
+
+@pytest.mark.parametrize("text", ABUSIVE + THREATS)
+def test_abusive_deleted(detector, text):
+    assert _deleted(detector, text), detector.detect_local(text)
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from abuse import AbuseDetector, from_gpt
+
+@pytest.fixture
+def detector():
+    d = AbuseDetector()
+    d.is_ready = True
+    d.client = object()
+    d.batcher = None
+    d.guard.available = lambda: True
+
+    async def ask(text):
+        await asyncio.sleep(0.01)
+        return {"is_abusive": False, "confidence": 0.1, "reason": "fine"}
+
+    d._ask_gpt = ask
+    return d
+
+def test_only_fresh_gpt_verdicts_count(detector):
+    async def run():
+        first, joined = await asyncio.gather(detector.detect_remote("hello there"), detector.detect_remote("hello there"))
+        repeat = await detector.detect_remote("hello there")
+        detector.override("hello there")
+        approved = await detector.detect_remote("hello there")
+        return first, joined, repeat, approved
+
+    first, joined, repeat, approved = asyncio.run(run())
+    assert from_gpt(first)
+    assert not from_gpt(joined) and not from_gpt(repeat) and not from_gpt(approved)
+    assert not from_gpt({"is_abusive": False, "confidence": 0.0, "reason": "admin"})
+
+def test_warm_trust_skips_local_and_cached_deletions(detector):
+    detector.warm_trust([
+        ("abuse_delete", {"user_id": 1, "reason": "lexicon:x"}, 0),
+        ("abuse_delete", {"user_id": 1, "reason": "insult", "cached": True}, 0),
+        ("abuse_delete", {"user_id": 1, "reason": "insult"}, 0),
+    ])
+    assert detector.user_history[1][:2] == [0.0, 1.0]
@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+
+from urls import HostSuffixIndex, extract_urls, join_url
+
+def _message(text):
+    return SimpleNamespace(text=text, caption=None, entities=None, caption_entities=None)
+
+def test_missing_space_is_not_a_link():
+    assert extract_urls(_message("ok.thanks see you")) == []
+
+def test_bare_hosts_need_a_known_tld():
+    found = extract_urls(_message("join t.me/mychannel or bit.ly/x, www.example.page, http://a.b.thanks/"))
+    assert [link[0] for link in found] == ["t.me", "bit.ly", "www.example.page", "a.b.thanks"], found
+
+def test_approved_link_with_missing_space_stays_approved():
+    index = HostSuffixIndex(["t.me/mychannel"])
+    links = extract_urls(_message("see t.me/mychannel ok.thanks"))
+    assert links and all(index.match(host, path) for host, path, _ in links), links
+
+def test_query_is_kept_for_short_links():
+    links = extract_urls(_message("free gift: sho.rt/go?id=42&x=1"))
+    assert links == [("sho.rt", "/go", "id=42&x=1")], links
+    assert join_url(*links[0]) == "https://sho.rt/go?id=42&x=1"
+    assert join_url("bit.ly", "/abc") == "https://bit.ly/abc"
@@ -0,0 +1,129 @@
+import re
+from urllib.parse import urlsplit
+
+# Dotted host candidates in free text. The lookbehind keeps match attempts to
+# the start of a token, so a scan is linear in the text length.
+_TEXT_URL = re.compile(r'(?<![A-Za-z0-9\-.@])(?:https?://)?[A-Za-z0-9\-]+(?:\.[A-Za-z0-9\-]+)+(?::\d+)?(?:/\S*)?', re.IGNORECASE)
+
+def split_url(url: str):
+    """Return (host, path, query) for a URL with or without scheme, or (None, '', '') if it has no usable host."""
+    raw = (url or "").strip()
+    if not raw:
+        return None, "", ""
+    if "://" not in raw:
+        raw = "http://" + raw.lstrip("/")
+    try:
+        parts = urlsplit(raw)
+        host = parts.hostname
+    except ValueError:
+        return None, "", ""
+    if not host:
+        return None, "", ""
+    host = host.rstrip(".").lower()
+    if "." not in host:
+        return None, "", ""
+    return host, parts.path or "", parts.query
+
+def join_url(host: str, path: str, query: str = "") -> str:
+    """An https URL back from split_url's parts."""
+    return f"https://{host}{path}" + (f"?{query}" if query else "")
+
+# Generic TLDs accepted for a bare dotted word in text; any two-letter one
+# counts as a country code. "ok.thanks" or "done.bye" is a missing space.
+GENERIC_TLDS = frozenset("""
+    com net org info biz edu gov mil int name pro mobi tel asia app dev io ai xyz top site online
+    store shop club live link click lol fun icu vip blog tech space website cloud win bid loan work
+    today world life news media email page one art best buzz cam cfd sbs bond rest monster quest
+    porn sex xxx adult bet casino poker games money cash finance crypto social chat group fans wiki
+""".split())
+
+def _looks_like_host(host: str, explicit: bool = True) -> bool:
+    """A plausible TLD; without a scheme or www. (`explicit`), a country code or a known generic one."""
+    tld = host.rsplit(".", 1)[-1]
+    if len(tld) < 2 or not tld.isascii() or not tld.isalpha():
+        return False
+    return explicit or len(tld) == 2 or tld in GENERIC_TLDS
+
+def extract_urls(message, normalized: str = None):
+    """
+    Collect (host, path, query) for every link in a message: text_link
+    targets, url entities and dotted hosts in the text that Telegram did
+    not mark up.
+    """
+    text = normalized if normalized is not None else (message.text or message.caption or "")
+    found = []
+    covered = []
+    entities = tuple(getattr(message, "entities", None) or ()) + tuple(getattr(message, "caption_entities", None) or ())
+    for e in entities:
+        if e.type == "text_link" and getattr(e, "url", None):
+            found.append(split_url(e.url))
+        elif e.type == "url":
+            found.append(split_url(text[e.offset:e.offset + e.length]))
+            covered.append((e.offset, e.offset + e.length))
+    for m in _TEXT_URL.finditer(text):
+        start, end = m.span()
+        if any(s <= start < t for s, t in covered):
+            continue
+        candidate = m.group(0).rstrip(".,;:!?)]}'\"")
+        explicit = candidate.lower().startswith(("http://", "https://", "www."))
+        host, path, query = split_url(candidate)
+        if host and _looks_like_host(host, explicit):
+            found.append((host, path, query))
+    return found
+
+def _under(path: str, prefix: str) -> bool:
+    return path == prefix or path.startswith(prefix + "/")
+
+class HostSuffixIndex:
+    """
+    Trie of whitelist entries keyed by reversed host labels.
+
+    An entry "youtube.com" admits youtube.com and any subdomain of it, but not
+    "evil-youtube.com" or "youtube.com.attacker.io". An entry with a path such
+    as "t.me/mychannel" only admits URLs whose path starts with that prefix.
+    Lookups cost one step per host label regardless of the number of entries.
+    """
+
+    _ANY_PATH = ""
+
+    def __init__(self, entries=()):
+        self._root = {}
+        self._size = 0
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def add(self, entry: str) -> bool:
+        if not entry or "." not in entry:
+            return False
+        host, path, _ = split_url(entry)
+        if not host:
+            return False
+        node = self._root
+        for label in reversed(host.split(".")):
+            node = node.setdefault(label, {})
+        paths = node.setdefault(None, set())
+        prefix = path.rstrip("/").lower()
+        if prefix not in paths:
+            paths.add(prefix)
+            self._size += 1
+        return True
+
+    def match(self, host: str, path: str = "") -> bool:
+        if not host:
+            return False
+        path = (path or "").lower()
+        node = self._root
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            prefixes = node.get(None)
+            if prefixes and (self._ANY_PATH in prefixes or any(_under(path, p) for p in prefixes)):
+                return True
+        return False
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class WorkQueue:
+    """
+    Bounded asyncio queue served by `workers` coroutines calling
+    `handler(job)`. When the queue is full, `overflow` decides who loses:
+    "drop_oldest" evicts the job that has waited longest to make room,
+    "local_only" refuses the new job. Either way the dropped message keeps
+    whatever verdict the local checks gave it.
+    """
+
+    DROP_OLDEST = "drop_oldest"
+    LOCAL_ONLY = "local_only"
+
+    def __init__(self, handler, workers: int = 4, maxsize: int = 500, overflow: str = LOCAL_ONLY, window: int = 1000):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self.overflow = overflow
+        self._queue = None
+        self._tasks = []
+        self._waits = deque(maxlen=window)
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.busy = 0
+        self.service_ns = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, job) -> bool:
+        """Queue a job without waiting; False if it was not queued."""
+        if self._queue is None:
+            return False
+        if self._queue.full():
+            self.dropped += 1
+            if self.overflow != self.DROP_OLDEST:
+                return False
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+            except asyncio.QueueEmpty:
+                pass
+        self._queue.put_nowait((time.monotonic(), job))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _worker(self):
+        queue = self._queue
+        while True:
+            queued_at, job = await queue.get()
+            self._waits.append(time.monotonic() - queued_at)
+            self.busy += 1
+            t0 = time.perf_counter_ns()
+            try:
+                await self.handler(job)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Background job failed: {e}")
+            finally:
+                self.service_ns += time.perf_counter_ns() - t0
+                self.busy -= 1
+                queue.task_done()
+
+    def snapshot(self) -> dict:
+        waits = sorted(self._waits)
+        done = self.processed + self.failed
+
+        def pct(q):
+            return waits[min(len(waits) - 1, int(q * (len(waits) - 1)))] * 1000 if waits else 0.0
+
+        return {
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_depth": self.max_depth,
+            "busy": self.busy,
+            "workers": len(self._tasks),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "wait_p50_ms": pct(0.50),
+            "wait_p99_ms": pct(0.99),
+            "service_avg_ms": self.service_ns / done / 1e6 if done else 0.0,
+        }